@@ -0,0 +1,148 @@
+from typing import Dict, List, Tuple
+from os import stat, replace
+from os.path import exists, realpath
+import hashlib
+import pickle
+
+class CohortIndex:
+    """Persistent record of VCFs that were already parsed.
+    For every VCF the index keeps its fingerprint (size, modification time and content hash)
+    and SNP records produced by VCFutilities.vcf_to_snp_records (or multi_sample_vcf_to_snp_records). On the next run only VCFs that are
+    new or whose content has changed need to be parsed, VCFs that are no longer in the cohort are dropped.
+    Content hash is only recalculated if size or modification time of the file changed.
+
+    Records depend on repeat regions that were excluded during parsing, so whole index
+    is discarded if repeats bed file has changed.
+    """
+
+    INDEX_VERSION=1
+    HASH_BLOCK_SIZE=1<<22
+
+    def __init__(self, index_file: str, repeats_bed_file: str="") -> None:
+        """
+        :param index_file: Path to pickled index, it is created if it does not exist
+        :type index_file: str
+        :param repeats_bed_file: Path to bed file with repeat regions used when parsing VCFs, can be empty
+        :type repeats_bed_file: str
+        """
+        self.index_file=index_file
+        self._repeats_fingerprint=self.content_hash(repeats_bed_file) if repeats_bed_file!="" else None
+        self._entries: Dict[str, Tuple[int, float, str, List[Tuple[str, int, str, str]]]]={}
+        self._is_modified=False
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, vcf_file: str) -> bool:
+        return self._key(vcf_file) in self._entries
+
+    @staticmethod
+    def _key(vcf_file: str) -> str:
+        return realpath(vcf_file)
+
+    @classmethod
+    def content_hash(cls, filename: str) -> str:
+        """Hash of file content
+        :param filename: path to file
+        :type filename: str
+        :rtype: str
+        """
+        file_hash=hashlib.blake2b(digest_size=20)
+        with open(filename, "rb") as input_file:
+            for block in iter(lambda: input_file.read(cls.HASH_BLOCK_SIZE), b""):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    @classmethod
+    def file_fingerprint(cls, filename: str) -> Tuple[int, float, str]:
+        """Size, modification time and content hash of the file
+        :param filename: path to file
+        :type filename: str
+        :rtype: Tuple[int, float, str]
+        """
+        file_stats=stat(filename)
+        return (file_stats.st_size, file_stats.st_mtime, cls.content_hash(filename))
+
+    def _load(self) -> None:
+        if not exists(self.index_file):
+            return None
+        try:
+            with open(self.index_file, "rb") as pickled_file:
+                index_data=pickle.load(pickled_file)
+        except (OSError, pickle.UnpicklingError, EOFError) as error:
+            print(f'Cohort index {self.index_file} could not be loaded and will be rebuilt: {error}')
+            return None
+        if index_data.get("version")!=self.INDEX_VERSION:
+            print(f'Cohort index {self.index_file} was created by different version and will be rebuilt')
+            return None
+        if index_data.get("repeats")!=self._repeats_fingerprint:
+            print(f'Repeat regions have changed since cohort index {self.index_file} was created, all VCFs will be reloaded')
+            return None
+        self._entries=index_data["entries"]
+
+    def changed_files(self, vcf_files: List[str]) -> List[str]:
+        """Identifies VCFs that have to be parsed because they are new or have changed.
+        Index entries of VCFs that are not in vcf_files are removed.
+        :param vcf_files: All VCF files of the cohort
+        :type vcf_files: List[str]
+        :return: VCF files that are not in the index or whose content has changed, in the order of vcf_files
+        :rtype: List[str]
+        """
+        vcf_keys=set([self._key(f) for f in vcf_files])
+        for removed_key in [f for f in self._entries if f not in vcf_keys]:
+            self._entries.pop(removed_key)
+            self._is_modified=True
+
+        changed_vcfs: List[str]=[]
+        for vcf_file in vcf_files:
+            key=self._key(vcf_file)
+            if key not in self._entries:
+                changed_vcfs.append(vcf_file)
+                continue
+            size, mtime, content_hash, records = self._entries[key]
+            file_stats=stat(vcf_file)
+            if file_stats.st_size==size and file_stats.st_mtime==mtime:
+                continue
+            #file was touched or copied, only reparse it if the content is actually different
+            if file_stats.st_size==size and self.content_hash(vcf_file)==content_hash:
+                self._entries[key]=(size, file_stats.st_mtime, content_hash, records)
+                self._is_modified=True
+            else:
+                self._entries.pop(key)
+                self._is_modified=True
+                changed_vcfs.append(vcf_file)
+        return changed_vcfs
+
+    def add(self, vcf_file: str, snp_records: List[Tuple[str, int, str, str]], fingerprint: Tuple[int, float, str]=None) -> None:
+        """Adds or replaces the VCF records in the index
+        :param vcf_file: path to VCF file
+        :type vcf_file: str
+        :param snp_records: records produced by VCFutilities.vcf_to_snp_records
+        :type snp_records: List[Tuple[str, int, str, str]]
+        :param fingerprint: Fingerprint of the VCF, calculated if not supplied
+        :type fingerprint: Tuple[int, float, str], optional
+        """
+        if fingerprint is None:
+            fingerprint=self.file_fingerprint(vcf_file)
+        self._entries[self._key(vcf_file)]=(fingerprint[0], fingerprint[1], fingerprint[2], snp_records)
+        self._is_modified=True
+
+    def records(self, vcf_file: str) -> List[Tuple[str, int, str, str]]:
+        """SNP records of the indexed VCF
+        :param vcf_file: path to VCF file
+        :type vcf_file: str
+        :rtype: List[Tuple[str, int, str, str]]
+        """
+        return self._entries[self._key(vcf_file)][3]
+
+    def save(self) -> None:
+        """Writes index to disk if it has changed since loading
+        """
+        if not self._is_modified:
+            return None
+        temp_file=f'{self.index_file}.tmp'
+        with open(temp_file, "wb") as output:
+            pickle.dump({"version": self.INDEX_VERSION, "repeats": self._repeats_fingerprint, "entries": self._entries}, output)
+        replace(temp_file, self.index_file) #partially written index is never left behind
+        self._is_modified=False
@@ -1,16 +1,57 @@
-from typing import List, Tuple, Dict, Set
+from typing import List, Tuple, Dict, Set, Iterator, Union
+from array import array
 import pandas as pd
+import numpy as np
+import numpy.typing as npt
 import uuid
 from io import TextIOWrapper
 from Bio import SeqIO
-import copy
 from json import load
 from os.path import exists, expanduser
 from multiprocessing import cpu_count
+import weakref
 
 
 
+class SnpRegistry:
+    """Assigns dense integer ids to distinct SNPs, SNP is identified by (contig, position, alt base).
+    Ids start at 0 and increase by one for every new SNP, so they can be used as array indices.
+    """
+    def __init__(self) -> None:
+        self._ids: Dict[Tuple[str, int, str], int]={}
+        self._keys: List[Tuple[str, int, str]]=[]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Tuple[str, int, str]) -> bool:
+        return key in self._ids
+
+    def get_id(self, key: Tuple[str, int, str]) -> int:
+        """Returns id of the SNP, new id is assigned if the SNP hasn't been seen before
+        :param key: (contig, position, alt base) of the SNP
+        :type key: Tuple[str, int, str]
+        :rtype: int
+        """
+        snp_id=self._ids.get(key)
+        if snp_id is None:
+            snp_id=len(self._keys)
+            self._ids[key]=snp_id
+            self._keys.append(key)
+        return snp_id
+
+    def key(self, snp_id: int) -> Tuple[str, int, str]:
+        """Returns (contig, position, alt base) of the SNP with given id
+        """
+        return self._keys[snp_id]
+
+
 class SNP:
+    __slots__=("_ref_contig_id", "_ref_base", "_alt_base", "_position", "_passes_filters",
+               "_sensitivity", "_specificity", "_is_genotype_snp", "_is_species_snp", "_id", "_hash")
+
+    registry: SnpRegistry=SnpRegistry() #ids are only valid within a process, they are reassigned when SNP is unpickled
+
     def __init__(self, **kwargs) -> None:
         """Constructor
 
@@ -38,6 +79,26 @@ class SNP:
         if kwargs.get("position","")!="":
             self._position=kwargs.get("position","")
         self._passes_filters=kwargs.get("passes_filters",False)
+        self._update_identity()
+
+    def _update_identity(self) -> None:
+        """Hash and registry id are calculated once, and again only if contig, position or alt base change
+        """
+        try:
+            key=(self._ref_contig_id, self._position, self._alt_base)
+        except AttributeError:
+            #incomplete SNP, identity is calculated once all values are set
+            self._id=-1
+            self._hash=None
+            return None
+        self._id=SNP.registry.get_id(key)
+        self._hash=hash(key)
+
+    @property
+    def id(self) -> int:
+        """Integer id of the SNP from SNP.registry, -1 if contig, position or alt base is not set
+        """
+        return self._id
 
     @property
     def coordinate(self) -> Tuple[str, int]:
@@ -50,6 +111,7 @@ class SNP:
     @ref_contig_id.setter
     def ref_contig_id(self, value: str):
         self._ref_contig_id = value
+        self._update_identity()
 
     @property
     def position(self) -> int:
@@ -58,6 +120,7 @@ class SNP:
     @position.setter
     def position(self, value: int):
         self._position = int(value)
+        self._update_identity()
 
     @property
     def ref_base(self) -> str:
@@ -74,6 +137,7 @@ class SNP:
     @alt_base.setter
     def alt_base(self, value: str):
         self._alt_base = value
+        self._update_identity()
 
     @property
     def sensitivity(self) -> float:
@@ -135,22 +199,44 @@ class SNP:
         file_handle.write(sep.join( [str(f) for f in [self._ref_contig_id, self.position, self.position+1, name] ] )+"\n")
 
     def __eq__(self, other) -> bool:
+        if self._id!=-1 and isinstance(other, SNP) and other._id!=-1:
+            return self._id==other._id
         return self.coordinate==other.coordinate and self.alt_base==other.alt_base
     
     def __lt__(self, other):
-        if self.ref_contig_id!=other.ref_contig_id:
-            return sorted([self.ref_contig_id, other.ref_contig_id])[0]==self.ref_contig_id #sort by IDs alphabetically
+        if self._ref_contig_id!=other._ref_contig_id:
+            return self._ref_contig_id<other._ref_contig_id #sort by IDs alphabetically
         else:
-            return self.position<other.position #sort by position if IDs are the same
+            return self._position<other._position #sort by position if IDs are the same
 
 
     def __hash__(self):
-        return hash( (self.ref_contig_id, self.position, self.alt_base) )
+        if self._hash is None:
+            return hash( (self.ref_contig_id, self.position, self.alt_base) )
+        return self._hash
+
+    def __getstate__(self) -> Dict:
+        return dict([ (f, getattr(self, f)) for f in self.__slots__ if f!="_id" and f!="_hash" and hasattr(self, f) ])
+
+    def __setstate__(self, state) -> None:
+        """Restores SNP from pickle, including pickles of SNPs created before SNP had __slots__
+        """
+        if isinstance(state, tuple):
+            #(instance dict, slots dict) format
+            state={**(state[0] or {}), **(state[1] or {})}
+        for key, value in state.items():
+            if key!="_id" and key!="_hash":
+                setattr(self, key, value)
+        self._update_identity()
 
     def copy(self):
-        """Creates deep copy of the SNP instance
+        """Creates copy of the SNP instance. All values are immutable, so copying them is sufficient
         """
-        return copy.deepcopy(self)
+        snp_copy=SNP.__new__(SNP)
+        for slot in self.__slots__:
+            if hasattr(self, slot):
+                setattr(snp_copy, slot, getattr(self, slot))
+        return snp_copy
 
 class Sample:
     """Represents a VCF sample and contains SNPs associated with it
@@ -159,7 +245,8 @@ class Sample:
     """
     def __init__(self, name: str, vcf_file: str) -> None:
         self._name=name
-        self._snps=[]
+        self._snps: List[SNP]=[]
+        self._snps_set: Set[SNP]=set() #mirrors _snps for fast membership checks
         self._vcf_file=vcf_file
         self._uuid=str(uuid.uuid4())
         self._genotype=""
@@ -181,6 +268,16 @@ class Sample:
     def snps(self) -> List[SNP]:
         return self._snps
 
+    def has_snp(self, snp: SNP) -> bool:
+        return snp in self._snps_set
+
+    def add_snps(self, snps: List[SNP]) -> None:
+        """Appends SNPs to the sample. Use this rather than modifying snps list directly
+        so that has_snp stays in sync
+        """
+        self._snps.extend(snps)
+        self._snps_set.update(snps)
+
     @property
     def name(self) -> str:
         return self._name
@@ -440,7 +537,16 @@ class Genotype:
         self._alleles: Dict[SNP, str]={}
         self._allele_depths: Dict[SNP, int]={}
         self._amplicons: List[Amplicon]=[]
+        self._containers=weakref.WeakSet() #Genotypes objects that include this genotype, they index its SNPs
 
+    def __getstate__(self) -> Dict:
+        state=self.__dict__.copy()
+        state.pop("_containers", None)
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._containers=weakref.WeakSet()
 
     @property
     def name(self) -> str:
@@ -466,6 +572,9 @@ class Genotype:
     def defining_snps(self) -> List[SNP]:
         return list(self._alleles.keys())
 
+    def has_snp(self, snp: SNP) -> bool:
+        return snp in self._alleles
+
     def get_genotype_allele(self, snp: SNP) -> str:
         if snp not in self._alleles:
             raise ValueError(f'SNP with coordinates {snp.coordinate} is not present among snps of genotype {self._name}')
@@ -477,8 +586,12 @@ class Genotype:
         return self._allele_depths[snp]
 
     def add_genotype_allele(self, snp: SNP, allele: str, depth: int):
+        is_new_snp=snp not in self._alleles
         self._alleles[snp]=allele
         self._allele_depths[snp]=depth
+        if is_new_snp:
+            for container in self._containers:
+                container._snp_added(self, snp)
 
     @property
     def defining_snp_coordinates(self) -> List[Tuple[str,int]]:
@@ -608,6 +721,116 @@ class BlastResult:
                 return False
         return True
         
+class BlastHits:
+    """Compact columnar collection of BLAST hits of one subject sequence (ex. amplicon).
+    Coordinates and scores are kept in typed arrays, query ids and sequences in byte buffers with end offsets,
+    so large numbers of hits take little memory and are cheap to pass between processes.
+    Individual hits are available as BlastResult objects.
+    """
+
+    def __init__(self, sseqid: str) -> None:
+        self.sseqid=sseqid
+        self._qstarts=array("q")
+        self._qends=array("q")
+        self._sstarts=array("q")
+        self._sends=array("q")
+        self._pidents=array("d")
+        self._evalues=array("d")
+        self._qseqids=bytearray()
+        self._qseqid_ends=array("q")
+        self._qseqs=bytearray()
+        self._qseq_ends=array("q")
+        self._file_indices=array("i")
+        self._query_files: List[str]=[]
+
+    def __len__(self) -> int:
+        return len(self._qstarts)
+
+    def _query_file_index(self, query_file: str) -> int:
+        #hits are usually added one query file at a time
+        if len(self._query_files)==0 or self._query_files[-1]!=query_file:
+            self._query_files.append(query_file)
+        return len(self._query_files)-1
+
+    def append(self, qseqid: Union[str, bytes], qstart: int, qend: int, sstart: int, send: int, pident: float, evalue: float,
+               qseq: Union[str, bytes], query_file: str) -> None:
+        """Adds hit, ids and sequences can be bytes as read from BLAST output
+        """
+        self._qstarts.append(qstart)
+        self._qends.append(qend)
+        self._sstarts.append(sstart)
+        self._sends.append(send)
+        self._pidents.append(pident)
+        self._evalues.append(evalue)
+        self._qseqids+=qseqid.encode() if isinstance(qseqid, str) else qseqid
+        self._qseqid_ends.append(len(self._qseqids))
+        self._qseqs+=qseq.encode() if isinstance(qseq, str) else qseq
+        self._qseq_ends.append(len(self._qseqs))
+        self._file_indices.append(self._query_file_index(query_file))
+
+    def extend(self, other) -> None:
+        """Adds all hits of other BlastHits
+        :param other: hits of the same subject
+        :type other: BlastHits
+        """
+        self._qstarts.extend(other._qstarts)
+        self._qends.extend(other._qends)
+        self._sstarts.extend(other._sstarts)
+        self._sends.extend(other._sends)
+        self._pidents.extend(other._pidents)
+        self._evalues.extend(other._evalues)
+        for own_values, own_ends, other_values, other_ends in [(self._qseqids, self._qseqid_ends, other._qseqids, other._qseqid_ends),
+                                                              (self._qseqs, self._qseq_ends, other._qseqs, other._qseq_ends)]:
+            offset=len(own_values)
+            own_values+=other_values
+            own_ends.extend([f+offset for f in other_ends])
+        file_offset=len(self._query_files)
+        self._query_files.extend(other._query_files)
+        self._file_indices.extend([f+file_offset for f in other._file_indices])
+
+    def _bytes_value(self, values: bytearray, ends: array, index: int) -> str:
+        start=ends[index-1] if index>0 else 0
+        return values[start:ends[index]].decode()
+
+    def qseqid(self, index: int) -> str:
+        return self._bytes_value(self._qseqids, self._qseqid_ends, index)
+
+    def qseq(self, index: int) -> str:
+        return self._bytes_value(self._qseqs, self._qseq_ends, index)
+
+    @property
+    def coordinates(self) -> npt.NDArray:
+        """Numeric columns of hits as NumPy structured array with fields qstart, qend, sstart, send, pident, evalue
+        """
+        table=np.empty(len(self), dtype=[("qstart", np.int64), ("qend", np.int64), ("sstart", np.int64), ("send", np.int64),
+                                         ("pident", np.float64), ("evalue", np.float64)])
+        for column, values in [("qstart", self._qstarts), ("qend", self._qends), ("sstart", self._sstarts),
+                               ("send", self._sends), ("pident", self._pidents), ("evalue", self._evalues)]:
+            table[column]=np.frombuffer(values, dtype=table.dtype[column]) if len(values)>0 else []
+        return table
+
+    def __getitem__(self, index: int) -> BlastResult:
+        if index<0:
+            index+=len(self)
+        if index<0 or index>=len(self):
+            raise IndexError(f'Hit index {index} is out of range for {len(self)} hits')
+        hit=BlastResult()
+        hit.qseqid=self.qseqid(index)
+        hit.qstart=self._qstarts[index]
+        hit.qend=self._qends[index]
+        hit.sseqid=self.sseqid
+        hit.sstart=self._sstarts[index]
+        hit.send=self._sends[index]
+        hit.pident=self._pidents[index]
+        hit.evalue=self._evalues[index]
+        hit.qseq=self.qseq(index)
+        hit.query_file_name=self._query_files[self._file_indices[index]]
+        return hit
+
+    def __iter__(self) -> Iterator[BlastResult]:
+        for i in range(len(self)):
+            yield self[i]
+
 class Primer:
     def __init__(self, seq: str, g_c: float, t_m: float, is_reverse) -> None:
         self._t_m=t_m
@@ -765,6 +988,43 @@ class Genotypes:
         :type genotypes: List[Genotype], optional
         """
         self._genotypes=kwargs.get("genotypes",[])
+        self._rebuild_index()
+
+    def __getstate__(self) -> Dict:
+        state=self.__dict__.copy()
+        state.pop("_name_index", None)
+        state.pop("_snp_index", None)
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        """Indexes genotypes by name and by SNP, results follow the order of genotypes
+        """
+        self._name_index: Dict[str, Genotype]={}
+        self._snp_index: Dict[SNP, List[Genotype]]={}
+        for genotype in self._genotypes:
+            self._index_genotype(genotype)
+        self._indexed_count=len(self._genotypes)
+
+    def _index_genotype(self, genotype: Genotype) -> None:
+        self._name_index.setdefault(genotype.name, genotype)
+        for snp in genotype.defining_snps:
+            self._snp_index.setdefault(snp, []).append(genotype)
+        genotype._containers.add(self)
+
+    def _check_index(self) -> None:
+        #genotypes list is public and could have been changed directly
+        if self._indexed_count!=len(self._genotypes):
+            self._rebuild_index()
+
+    def _snp_added(self, genotype: Genotype, snp: SNP) -> None:
+        """Called by genotype when it gets new SNP"""
+        if genotype not in self._genotypes:
+            return None
+        self._snp_index[snp]=[f for f in self._genotypes if f.has_snp(snp)]
 
     @property
     def genotypes(self) -> List[Genotype]:
@@ -773,18 +1033,29 @@ class Genotypes:
     @genotypes.setter
     def genotypes(self, value: List[Genotype]):
         self._genotypes = list(value)
+        self._rebuild_index()
+
+    def add_genotype(self, genotype: Genotype) -> None:
+        """Appends genotype and adds it to genotype and SNP indices. 
+        Use this rather than appending to genotypes list directly
+        :param genotype: genotype to add
+        :type genotype: Genotype
+        """
+        self._check_index()
+        self._genotypes.append(genotype)
+        self._index_genotype(genotype)
+        self._indexed_count=len(self._genotypes)
 
     def get_genotype(self, genotype_name: str) -> Genotype:
-        for genotype in self._genotypes:
-            if genotype.name==genotype_name:
-                return genotype
+        self._check_index()
+        return self._name_index.get(genotype_name)
 
     def all_snps_coord_sorted(self) -> List[SNP]:
         """Returns a list of unique contig + position pairs 
         sorted by contig and position
         """
         unique_contig_pos: List[SNP]=list(set([snp for snps in self.genotypes for snp in snps.defining_snps]))
-        unique_contig_pos=sorted(unique_contig_pos, key=lambda x: x)
+        unique_contig_pos=sorted(unique_contig_pos, key=lambda x: (x.ref_contig_id, x.position)) #same order as SNP.__lt__, but without python comparisons
         return unique_contig_pos
 
     def genotypes_to_snp_matrix(self) -> pd.DataFrame:
@@ -792,25 +1063,71 @@ class Genotypes:
         and each column a genotype. Two extra columns are Contig and Position
         The values indicate if the SNP passes some filter for that column (usually genotype)
         """
+        unique_contig_pos, gts, snp_presence = self._snp_presence_matrix()
+        output_df: pd.DataFrame=pd.DataFrame(snp_presence, columns=gts)
+        output_df.insert(0, "Position", [f.position for f in unique_contig_pos])
+        output_df.insert(0, "Contig", [f.ref_contig_id for f in unique_contig_pos])
+        return output_df
+
+    def _snp_presence_matrix(self) -> Tuple[List[SNP], List[str], npt.NDArray]:
+        """Builds boolean matrix with row for each unique SNP (sorted by contig and position)
+        and column for each genotype. Value is SNP's passes_filters if genotype has the SNP, otherwise False
+        """
         if len(self._genotypes)==0:
             raise ValueError("The object has no genotypes in it.")
         unique_contig_pos: List[SNP]=self.all_snps_coord_sorted()
-        gts: List[str]=[f.name for f in self.genotypes]
-        output_df: pd.DataFrame=pd.DataFrame(columns=["Contig","Position"]+gts, index=range(0,len(unique_contig_pos))).fillna(False)
-        output_df["Contig"]=[f.ref_contig_id for f in unique_contig_pos]
-        output_df["Position"]=[f.position for f in unique_contig_pos]
-        for gt in self.genotypes:
-            for snp in gt.defining_snps:
-                index=unique_contig_pos.index(snp)
-                output_df.loc[index, gt.name]=snp.passes_filters
-        return output_df
+        snp_rows: Dict[SNP, int]=dict([ (snp, i) for i, snp in enumerate(unique_contig_pos) ])
+        snp_presence=np.zeros( (len(unique_contig_pos), len(self._genotypes)), dtype=bool)
+        for column, gt in enumerate(self._genotypes):
+            gt_snps=gt.defining_snps
+            rows=np.fromiter( (snp_rows[snp] for snp in gt_snps), dtype=np.int64, count=len(gt_snps))
+            snp_presence[rows, column]=np.fromiter( (snp.passes_filters for snp in gt_snps), dtype=bool, count=len(gt_snps))
+        return (unique_contig_pos, [f.name for f in self._genotypes], snp_presence)
+
+    def genotypes_to_sparse_snp_matrix(self):
+        """Same as genotypes_to_snp_matrix, but as SciPy sparse matrix. Requires scipy
+        :return: CSR matrix, SNPs of matrix rows and genotype names of matrix columns
+        :rtype: Tuple[scipy.sparse.csr_matrix, List[SNP], List[str]]
+        """
+        try:
+            from scipy import sparse
+        except ImportError as error:
+            raise ImportError("Sparse genotype SNP matrix requires scipy, please install it") from error
+        unique_contig_pos, gts, snp_presence = self._snp_presence_matrix()
+        return (sparse.csr_matrix(snp_presence), unique_contig_pos, gts)
+
+    def snp_matrix_to_file(self, filename: str) -> None:
+        """Writes genotypes_to_snp_matrix to file, format is determined by the file extension:
+        .parquet - Parquet table (requires pyarrow or fastparquet)
+        .npz - compressed NumPy archive with CSR components (data, indices, indptr, shape) of 
+        sparse matrix as well as contigs, positions and genotypes. It can be loaded without SciPy, 
+        or as scipy.sparse.csr_matrix((data, indices, indptr), shape=shape)
+        any other - tab delimited table
+        :param filename: output file
+        :type filename: str
+        """
+        if filename.endswith(".npz"):
+            unique_contig_pos, gts, snp_presence = self._snp_presence_matrix()
+            rows, columns = np.nonzero(snp_presence) #row-major order, so these are CSR indices
+            np.savez_compressed(filename, data=np.ones(len(rows), dtype=bool), indices=columns, 
+                                indptr=np.searchsorted(rows, np.arange(snp_presence.shape[0]+1)),
+                                shape=np.asarray(snp_presence.shape),
+                                contigs=np.asarray([f.ref_contig_id for f in unique_contig_pos]),
+                                positions=np.asarray([f.position for f in unique_contig_pos]),
+                                genotypes=np.asarray(gts))
+        elif filename.endswith(".parquet"):
+            output_df=self.genotypes_to_snp_matrix()
+            output_df.columns=[str(f) for f in output_df.columns]
+            try:
+                output_df.to_parquet(filename, index=False)
+            except ImportError as error:
+                raise ImportError("Parquet output requires pyarrow or fastparquet, please install it or use .tsv or .npz output") from error
+        else:
+            self.genotypes_to_snp_matrix().to_csv(filename, sep="\t", index=False)
 
     def genotypes_with_snp(self, snp: SNP) -> List[Genotype]:
-        result: List[Genotype] = []
-        for genotype in self._genotypes:
-            if snp in genotype.defining_snps:
-                result.append(genotype)
-        return result
+        self._check_index()
+        return list(self._snp_index.get(snp, []))
 
     def get_duplicate_snps(self) -> List[SNP]:
         pass
@@ -827,6 +1144,13 @@ class InputConfiguration:
     sensitivity_limit: float=-1.0
     specificity_limit: float=-1.0
     min_amplicon_length=200
+    collapse_clonal_samples=False
+    interval_selection="all"
+    genotype_redundancy=1
+    interval_snp_weight=1.0
+    msa_engine="mafft"
+    negative_genomes_db=""
+    scratch_dir=""
     def __init__(self, file_name: str):
         file_name=expanduser(file_name)
         try:
@@ -838,11 +1162,24 @@ class InputConfiguration:
                 InputConfiguration.max_amplicon_len=InputConfiguration.flank_len_to_check*2
                 InputConfiguration.use_negative_genomes_subdir=str.lower(self._config_data["input_directories"]["use_negative_genomes_subdir"])=="true"
                 InputConfiguration.output_dir=expanduser(self._config_data["output_files"]["output_dir"])+"/"
+                negative_genomes_db=self._config_data["input_directories"].get("negative_genomes_db", "")
+                InputConfiguration.negative_genomes_db=expanduser(negative_genomes_db) if negative_genomes_db!="" else ""
+                scratch_dir=self._config_data["input_directories"].get("scratch_dir", "")
+                InputConfiguration.scratch_dir=expanduser(scratch_dir) if scratch_dir!="" else ""
                 InputConfiguration.specificity_limit=self._config_data["analysis_parameters"]["snp_specificity"]/100
                 InputConfiguration.sensitivity_limit=self._config_data["analysis_parameters"]["snp_sensitivity"]/100
                 InputConfiguration.min_amplicon_length=self._config_data["analysis_parameters"]["min_amplicon_length"]
                 InputConfiguration.blast_evalue=self._config_data["analysis_parameters"]["blast_e_value"]
                 InputConfiguration.blast_word_size=self._config_data["analysis_parameters"]["blast_word_size"]
+                InputConfiguration.collapse_clonal_samples=str.lower(str(self._config_data["analysis_parameters"].get("collapse_clonal_samples", "false")))=="true"
+                InputConfiguration.interval_selection=str.lower(str(self._config_data["analysis_parameters"].get("interval_selection", "all")))
+                if InputConfiguration.interval_selection not in ["all", "set_cover"]:
+                    raise ValueError(f'Unknown interval_selection {InputConfiguration.interval_selection}, it must be "all" or "set_cover"')
+                InputConfiguration.genotype_redundancy=int(self._config_data["analysis_parameters"].get("genotype_redundancy", 1))
+                InputConfiguration.interval_snp_weight=float(self._config_data["analysis_parameters"].get("interval_snp_weight", 1.0))
+                InputConfiguration.msa_engine=str.lower(str(self._config_data["analysis_parameters"].get("msa_engine", "mafft")))
+                if InputConfiguration.msa_engine not in ["mafft", "anchored"]:
+                    raise ValueError(f'Unknown msa_engine {InputConfiguration.msa_engine}, it must be "mafft" or "anchored"')
                 self._load_whole_reference()
         except IOError as error:
             if not exists(file_name):
@@ -961,6 +1298,20 @@ class InputConfiguration:
     def gt_snps_vcf(self) -> str:
         return self.output_dir+self._config_data["output_files"]["genoptype_snps_vcf"]
     
+    @property
+    def genotype_snp_matrix(self) -> str:
+        """Path to genotypes x SNPs matrix output, empty string if it should not be written
+        """
+        matrix_file=self._config_data["output_files"].get("genotype_snp_matrix", "genotype_snp_matrix.tsv")
+        return self.output_dir+matrix_file if matrix_file!="" else ""
+
+    @property
+    def cohort_index(self) -> str:
+        """Path to the index of parsed VCFs, empty string if index should not be used
+        """
+        index_file=self._config_data["output_files"].get("cohort_index", "cohort_index.pkl")
+        return self.output_dir+index_file if index_file!="" else ""
+
     @property
     def gt_species_snps_vcf(self) -> str:
         return self.output_dir+self._config_data["output_files"]["gt_and_species_snps_vcf"]
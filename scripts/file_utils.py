@@ -0,0 +1,88 @@
+from typing import IO
+from os.path import splitext, getsize
+from os import getpid
+from socket import gethostname
+import gzip
+from Bio import bgzf
+
+COMPRESSION_EXTENSIONS=[".gz", ".bgz"] #bgzip files are valid gzip files, so both are read with gzip
+COMPRESSION_RATIO=3.5 #typical for gzip compressed nucleotide fasta
+
+def is_compressed(filename: str) -> bool:
+    """Checks if file is gzip or bgzip compressed based on its extension
+    :param filename: file name or path
+    :type filename: str
+    :rtype: bool
+    """
+    return splitext(filename)[1].lower() in COMPRESSION_EXTENSIONS
+
+def remove_compression_extension(filename: str) -> str:
+    """Removes compression extension, ex. genome.fna.gz becomes genome.fna
+    :param filename: file name or path
+    :type filename: str
+    :rtype: str
+    """
+    return splitext(filename)[0] if is_compressed(filename) else filename
+
+def file_extension(filename: str) -> str:
+    """Extension of the file ignoring compression extension, ex. .vcf for sample.vcf.gz
+    :param filename: file name or path
+    :type filename: str
+    :rtype: str
+    """
+    return splitext(remove_compression_extension(filename))[1]
+
+def uncompressed_size(filename: str) -> int:
+    """Size of file content in bytes. For gzip files this is read from the gzip trailer,
+    for bgzip or multi-member gzip files (which only record size of the last member) it is estimated
+    :param filename: path to file
+    :type filename: str
+    :rtype: int
+    """
+    file_size=getsize(filename)
+    if not is_compressed(filename):
+        return file_size
+    estimated_size=int(file_size*COMPRESSION_RATIO)
+    if file_size<18: #smaller than gzip header and trailer
+        return 0
+    with open(filename, "rb") as compressed_file:
+        compressed_file.seek(-4, 2)
+        trailer_size=int.from_bytes(compressed_file.read(4), "little")
+    #trailer records size modulo 4GB of the last member only, so it is only trusted if it is plausible
+    return trailer_size if file_size<=trailer_size<=file_size*20 else estimated_size
+
+def open_file(filename: str, mode: str="r") -> IO:
+    """Opens plain or gzip/bgzip compressed file. Compressed files are decompressed
+    while being read, they are never decompressed to disk. Compressed files are written
+    with bgzip, so they can be indexed by tabix.
+    :param filename: path to file
+    :type filename: str
+    :param mode: "r" for text or "rb" for binary reading, "w" for writing
+    :type mode: str
+    """
+    if is_compressed(filename):
+        if "w" in mode:
+            return bgzf.BgzfWriter(filename, "wb")
+        return gzip.open(filename, mode if "b" in mode else mode+"t")
+    return open(filename, mode)
+
+def fasta_contig_id(header: str, contig_index: int) -> str:
+    """Contig id from fasta header, which is the first word after ">". Header without id
+    gets placeholder id based on position of contig in the file, ex. contig_0 for the first contig
+    :param header: header line including ">"
+    :type header: str
+    :param contig_index: 0-based index of the contig in the file
+    :type contig_index: int
+    :rtype: str
+    """
+    header_words=header[1:].split()
+    return header_words[0] if len(header_words)!=0 else f'contig_{contig_index}'
+
+def scratch_name(prefix: str) -> str:
+    """Name for scratch file that is unique to current process, so that concurrent runs (also on different hosts)
+    sharing a directory don't overwrite each other's files
+    :param prefix: start of the name
+    :type prefix: str
+    :rtype: str
+    """
+    return f'{prefix}_{gethostname()}_{getpid()}'
@@ -1,15 +1,19 @@
 #take all fastas in specified directory and check all for specific gene
-from os import listdir, walk, mkdir, remove
-from os.path import isfile, join, splitext, exists
+from os import listdir, walk, mkdir
+from os.path import isfile, join, exists
 import subprocess
-from typing import List, Dict, Tuple
+import tempfile
+from typing import List, Dict, Tuple, Iterator
 from run_blast import BlastRunner
-from multiprocessing import Pool
+from genomes_blast_db import GenomesBlastDb
+from multiprocessing import Pool, Condition, RawValue
 import numpy as np
 import numpy.typing as npt
 from Bio.Seq import Seq
-from data_classes import Amplicon, BlastResult, InputConfiguration
+from Bio.Align import PairwiseAligner
+from data_classes import Amplicon, BlastResult, BlastHits, InputConfiguration
 from tqdm import tqdm
+from file_utils import file_extension
 import pickle
 
 class MergedAmplicons:
@@ -63,20 +67,92 @@ class MergedAmplicons:
         self._destination_amplicons = [f for f in amplicons if f.id not in self._source_to_destination.keys()]
         return self._destination_amplicons
 
+class ThreadBudget:
+    """Threads shared by MAFFT jobs that run in Pool workers, so that together they never use more than the budget.
+    Job gets threads planned for it, or, once fewer jobs are left than there are free threads, an equal share
+    of free threads, but never more threads than are free. Job waits until at least one thread is free.
+    """
+    def __init__(self, threads: int, jobs: int) -> None:
+        """
+        :param threads: total number of threads
+        :type threads: int
+        :param jobs: number of jobs that will acquire threads
+        :type jobs: int
+        """
+        self._condition=Condition()
+        self._free_threads=RawValue("i", threads)
+        self._jobs_left=RawValue("i", jobs)
+
+    def acquire(self, planned_threads: int) -> int:
+        """Takes threads for a job, must be followed by release
+        :param planned_threads: threads planned for the job
+        :type planned_threads: int
+        :return: threads taken
+        :rtype: int
+        """
+        with self._condition:
+            while self._free_threads.value<1:
+                self._condition.wait()
+            self._jobs_left.value-=1
+            #leftover threads are shared by the last jobs, so that they don't run with few threads on idle CPUs
+            threads=min(self._free_threads.value, max(planned_threads, self._free_threads.value//(self._jobs_left.value+1)))
+            self._free_threads.value-=threads
+            return threads
+
+    def release(self, threads: int) -> None:
+        with self._condition:
+            self._free_threads.value+=threads
+            self._condition.notify_all()
+
+_thread_budget: ThreadBudget=None #set in Pool workers that run MAFFT jobs
+
+def _set_thread_budget(thread_budget: ThreadBudget) -> None:
+    global _thread_budget
+    _thread_budget=thread_budget
+
+def _base_encoding_table() -> npt.NDArray:
+    #maps every byte to base code, lower case bases are same as upper case and unknown characters are N
+    table=np.full(256, InputConfiguration.BASE_DIC["N"], dtype=np.uint8)
+    for base, code in InputConfiguration.BASE_DIC.items():
+        table[ord(base)]=code
+        table[ord(base.lower())]=code
+    return table
+
 class MsaResult:
     """Result of MSA alignment consiting of two parts:
     Index of sequences IDs and MSA sequences
+    Sequences are stored as uint8 matrix (rows are sequences, columns are MSA positions) of InputConfiguration.BASE_DIC codes
+    Each row can represent several identical sequences, base counts are weighted by number of sequences in the row
     """
-    def __init__(self, amplicon_id: str, ids: List[str], sequences:List[str]) -> None:
+    ENCODING_TABLE: npt.NDArray=_base_encoding_table()
+    DECODING_TABLE: npt.NDArray=np.frombuffer("".join([InputConfiguration.NUMBER_DIC[f] for f in range(len(InputConfiguration.NUMBER_DIC))]).encode(), dtype=np.uint8)
+
+    def __init__(self, amplicon_id: str, ids: List[str], sequences:List[str], row_members: List[List[str]]=None) -> None:
+        """
+        :param amplicon_id: id of the amplicon the MSA is for
+        :type amplicon_id: str
+        :param ids: id of each MSA row
+        :type ids: List[str]
+        :param sequences: aligned sequence of each MSA row
+        :type sequences: List[str]
+        :param row_members: ids of all identical sequences represented by each row, optional. By default each row is a single sequence
+        :type row_members: List[List[str]]
+        """
         self._amplicon_id=amplicon_id
         self._ids: List[str]=ids
-        self._sequences: npt.NDArray= np.asarray([ self._to_numeric( list(f.upper()) ) for f in sequences ], dtype=int)
-
-    def _to_numeric(self, sequence:List[str]) -> List[int]:
-        return [ InputConfiguration.BASE_DIC[f] if f in InputConfiguration.BASE_DIC else InputConfiguration.BASE_DIC["N"] for f in sequence ]
-    
-    def _to_char(self, sequence: List[int]) -> str:
-        return "".join( [ InputConfiguration.NUMBER_DIC[f] for f in sequence ] )
+        self._row_members: List[List[str]]=row_members if row_members is not None else [ [f] for f in ids ]
+        if len(self._row_members)!=len(ids):
+            raise ValueError(f'MSA of amplicon {amplicon_id} has {len(ids)} rows, but members of {len(self._row_members)} rows')
+        self._weights: npt.NDArray=np.asarray([len(f) for f in self._row_members], dtype=np.int64)
+        msa_length=len(sequences[0]) if len(sequences)>0 else 0
+        if any([len(f)!=msa_length for f in sequences]):
+            raise ValueError(f'MSA sequences of amplicon {amplicon_id} have different lengths')
+        encoded=self.ENCODING_TABLE[np.frombuffer("".join(sequences).encode("ascii", "replace"), dtype=np.uint8)]
+        self._sequences: npt.NDArray=encoded.reshape(len(sequences), msa_length)
+        self._base_counts: npt.NDArray=None
+
+    def _to_char(self, sequence: npt.NDArray) -> str:
+        return self.DECODING_TABLE[sequence].tobytes().decode()
 
     @property
     def amplicon_id(self) -> str:
@@ -90,6 +166,48 @@ class MsaResult:
     def matrix(self) -> npt.NDArray:
         return self._sequences
 
+    @property
+    def weights(self) -> npt.NDArray:
+        """Number of sequences represented by each MSA row
+        :rtype: npt.NDArray
+        """
+        return self._weights
+
+    def row_members(self, index: int) -> List[str]:
+        """Ids of all sequences represented by MSA row
+        :param index: row of the MSA
+        :type index: int
+        :rtype: List[str]
+        """
+        return self._row_members[index]
+
+    @property
+    def base_counts(self) -> npt.NDArray:
+        """Number of each base in every MSA column
+        :return: column x base code matrix, base codes are values of InputConfiguration.BASE_DIC
+        :rtype: npt.NDArray
+        """
+        if self._base_counts is None:
+            #offsetting codes by column makes single bincount count bases of all columns
+            columns=self._sequences.shape[1]
+            codes=len(self.DECODING_TABLE)
+            column_offsets=np.arange(columns, dtype=np.int64)*codes
+            row_weights=np.repeat(self._weights, columns)
+            self._base_counts=np.bincount( (self._sequences+column_offsets).ravel(), weights=row_weights,
+                                          minlength=columns*codes).reshape(columns, codes).astype(np.int64)
+        return self._base_counts
+
+    def coordinate_map(self, index: int) -> npt.NDArray:
+        """Maps MSA columns to positions in the ungapped sequence of the row, gaps are -1
+        :param index: row of the MSA
+        :type index: int
+        :rtype: npt.NDArray
+        """
+        if index >= self._sequences.shape[0]:
+            raise ValueError(f'Index value {index} exceeds the number of MSA rows')
+        is_base=self._sequences[index,:]!=InputConfiguration.BASE_DIC["-"]
+        return np.where(is_base, np.cumsum(is_base)-1, -1)
+
     def _values_at_col(self, index:int) -> npt.NDArray:
         if index < self._sequences.shape[1]:
             return self._sequences[:,index]
@@ -97,8 +215,7 @@ class MsaResult:
             raise ValueError(f'Index value {index} exceeds the number of MSA columns')
 
     def nucleotides_at_col(self, index:int) -> List[str]:
-        numeric_values=self._values_at_col(index)
-        return  [ InputConfiguration.NUMBER_DIC[f] for f in numeric_values ]
+        return list(self._to_char(self._values_at_col(index)))
 
     def row_to_seq(self, index: int) -> str:
         if index < self._sequences.shape[0]:
@@ -108,6 +225,10 @@ class MsaResult:
 
 
 class MsaGenerator:
+    MAX_PROGRESSIVE_SEQUENCES=5000 #larger MSAs use PartTree, progressive alignment time grows quadratically with number of sequences
+    MAX_PARTTREE_SEQUENCES=20000 #larger MSAs align every hit to the amplicon (mafft --addfragments), which grows linearly
+    SEED_KMER_LEN=16 #length of exact matches that seed anchored alignment
+    MAX_SEED_SHIFT=50 #maximum length of gaps between seed blocks of anchored alignment, in addition to length difference of sequences
 
     def __init__(self, temp_blast_db_dir: str) -> None:
         self.temp_blast_db_dir=temp_blast_db_dir
@@ -118,124 +239,275 @@ class MsaGenerator:
         if InputConfiguration.use_negative_genomes_subdir:
             for path, subdirs, dir_files in walk(dir_to_search):
                 for name in dir_files:
-                    if isfile(join(path, name)) and (splitext(name)[-1]==".fasta" or splitext(name)[-1]==".fna"):
+                    if isfile(join(path, name)) and file_extension(name) in [".fasta", ".fna"]:
                         self.file_to_search.append(join(path, name))
         else:
-            self.file_to_search = [dir_to_search+"/"+f for f in listdir(dir_to_search) if isfile(join(dir_to_search, f)) and (splitext(f)[-1]==".fasta" or splitext(f)[-1]==".fna")]
+            self.file_to_search = [dir_to_search+"/"+f for f in listdir(dir_to_search) if isfile(join(dir_to_search, f)) and file_extension(f) in [".fasta", ".fna"]]
         #self.file_to_search=self.file_to_search[0:500]
 
-    def generate_msa(self, amplicons:List[Amplicon], genomes_dir:str) -> Dict[str, MsaResult]:
+    def generate_msa(self, amplicons:List[Amplicon], genomes_dir:str) -> List[MsaResult]:
         """Takes list of Amplicons and directory of genomes
         blasts amplicon sequences against all genomes in directory 
         and creates multiple sequences alignment file of blast results
         one MSA per amplicon supplied
         """
+        return list(self.iter_msa(amplicons, genomes_dir))
+
+    def iter_msa(self, amplicons:List[Amplicon], genomes_dir:str) -> Iterator[MsaResult]:
+        """Same as generate_msa, but MSAs are yielded as soon as they are aligned (in order of completion),
+        so they can be processed while other amplicons are being aligned and don't all need to be kept in memory
+        """
         if not exists(InputConfiguration.output_dir):
             mkdir(InputConfiguration.output_dir)
         #Collect fasta files against which to run blast
         self._get_fasta_files(genomes_dir)
         if len(self.file_to_search)==0:
             if InputConfiguration.use_negative_genomes_subdir:
-                raise ValueError(f'When looking for genomes to BLAST against, no .fna or .fasta files found in {genomes_dir} or sub-directories.')
+                raise ValueError(f'When looking for genomes to BLAST against, no .fna or .fasta (or .fna.gz, .fasta.gz) files found in {genomes_dir} or sub-directories.')
             else:
-                raise ValueError(f'When looking for genomes to BLAST against, no .fna or .fasta files found in {genomes_dir}. Did you mean to include sub-directories?')
+                raise ValueError(f'When looking for genomes to BLAST against, no .fna or .fasta (or .fna.gz, .fasta.gz) files found in {genomes_dir}. Did you mean to include sub-directories?')
 
         print("Merging amplicons")
         merged_amplicons=MergedAmplicons()
         merged_amplicons.merge_amplicons(amplicons)
         blast_results_raw=self._run_blast( merged_amplicons.destination_amplicons, self.file_to_search )
         blast_results=self._process_blast_results(blast_results_raw, merged_amplicons.destination_amplicons)
-        msa_results: List[MsaResult] = self._align_blast_results(blast_results, merged_amplicons.destination_amplicons)
-        return msa_results
+        yield from self._align_blast_results(blast_results, merged_amplicons.destination_amplicons)
 
-    def _align_blast_results(self, blast_results: Dict[str, List[BlastResult]], amplicons: List[Amplicon]) -> List[MsaResult]:
+    def _align_blast_results(self, blast_results: Dict[str, BlastHits], amplicons: List[Amplicon]) -> Iterator[MsaResult]:
         if __name__ == 'generate_msa':
             print("Generating MSAs")
-            pool = Pool(processes= InputConfiguration.cpu_threads )
+            amplicon_seqs: Dict[str, str]=dict([ (f.id, f.seq) for f in amplicons ])
+            is_anchored=InputConfiguration.msa_engine=="anchored"
             aligner_inputs:List=[]
-            for amplicon_id, amplicon_blast_results in blast_results.items():
+            for amplicon_id in list(blast_results.keys()):
+                amplicon_blast_results=blast_results.pop(amplicon_id) #hits are released once they are reduced to unique sequences
                 if len(amplicon_blast_results)==0:
                     continue
-                amplicon_seq=[f.seq for f in amplicons if f.id==amplicon_id][0]
-                aligner_inputs.append([amplicon_blast_results,amplicon_id,amplicon_seq])
-
-            msa_results = list(tqdm( pool.imap(func=self._align_results_helper, iterable=aligner_inputs), total=len(aligner_inputs) ))
-            pool.close()
-            return msa_results
-
-
-    def _run_blast(self, subject_sequences: List[Amplicon], query_files: List[str]) -> List[BlastResult] :
-        """Runs blast against a single file at a time using Pool
-        this is the fastest implemintaiton of all tried
+                row_members, row_sequences, row_anchors = self._alignment_rows(amplicon_blast_results, amplicon_id, amplicon_seqs[amplicon_id], is_anchored)
+                aligner_inputs.append([amplicon_id, row_members, row_sequences, row_anchors, 1])
+            if not is_anchored:
+                self._plan_mafft_jobs(aligner_inputs)
+
+            #MAFFT jobs share threads, so that large jobs can use more threads without oversubscribing CPUs
+            thread_budget=ThreadBudget(InputConfiguration.cpu_threads, len(aligner_inputs))
+            with Pool(processes= InputConfiguration.cpu_threads, initializer=_set_thread_budget, initargs=(thread_budget,) ) as pool:
+                yield from tqdm( pool.imap_unordered(func=self._align_results_helper, iterable=aligner_inputs), total=len(aligner_inputs) )
+
+    def _mafft_strategy(self, sequence_count: int) -> Tuple[str, List[str]]:
+        """MAFFT alignment strategy for the number of sequences
+        :return: name of the strategy and MAFFT arguments
+        :rtype: Tuple[str, List[str]]
         """
-        if not exists(self.temp_blast_db_dir):
-            mkdir(self.temp_blast_db_dir)
-        with open(self.temp_blast_db_dir+"/temp.fasta", "w") as temp_file:
-            for amplicon in subject_sequences:
-                temp_file.write(">"+amplicon.id+"\n"+amplicon.seq+"\n")
-        subject_seq_file=self.temp_blast_db_dir+"/temp.fasta"
-
-        blast_runner=BlastRunner()           
-        blast_runner.db_from_file(subject_seq_file, self.temp_blast_db_dir)
-        blast_results: List[ Tuple[str, List[BlastResult]] ]=[]
-
-        if __name__ == 'generate_msa':
-            print("Running BLAST against genomes")
-            with Pool(processes= InputConfiguration.cpu_threads) as pool: #min(  max(cpu_count()-1,1) , self.cpu_threads ) )
-                blast_results = list(tqdm( pool.imap(func=blast_runner.run_from_file, iterable=query_files), total=len(query_files) ))
-            return [item for sublist in blast_results for item in sublist]
-
-    def _process_blast_results(self, blast_resuls: List[BlastResult], target_amplicons: List[Amplicon]) -> Dict[str, List[BlastResult] ]:  #str is the name of the amplicon
+        if sequence_count<=self.MAX_PROGRESSIVE_SEQUENCES:
+            return ("FFT-NS-1", ["--retree", "1"])
+        elif sequence_count<=self.MAX_PARTTREE_SEQUENCES:
+            return ("PartTree", ["--retree", "1", "--parttree"])
+        else:
+            return ("add-fragments", ["--6merpair", "--keeplength", "--addfragments"])
+
+    def _plan_mafft_jobs(self, aligner_inputs: List) -> None:
+        """Orders MAFFT jobs from largest to smallest, so that the largest don't run alone at the end,
+        and plans for each job threads in proportion to its share of all alignment work.
+        Job size is number of sequences multiplied by amplicon length. Jobs running at the same time
+        get their threads from shared ThreadBudget, so together they never use more than cpu_threads.
+        :param aligner_inputs: inputs of _align_results_helper, they are sorted and their thread counts set in place
+        :type aligner_inputs: List
+        """
+        if len(aligner_inputs)==0:
+            return
+        job_sizes=dict([ (f[0], len(f[2])*len(f[2][0])) for f in aligner_inputs ])
+        total_size=sum(job_sizes.values())
+        aligner_inputs.sort(key=lambda f: job_sizes[f[0]], reverse=True)
+        strategy_counts: Dict[str, int]={}
+        for aligner_input in aligner_inputs:
+            aligner_input[4]=max(1, min(InputConfiguration.cpu_threads, round(InputConfiguration.cpu_threads*job_sizes[aligner_input[0]]/total_size)))
+            strategy=self._mafft_strategy(len(aligner_input[2]))[0]
+            strategy_counts[strategy]=strategy_counts.get(strategy, 0)+1
+        largest=aligner_inputs[0]
+        print(f'MAFFT strategies: {", ".join([f"{name} for {count} MSAs" for name, count in strategy_counts.items()])}. '
+              f'Largest MSA has {len(largest[2])} sequences and is planned {largest[4]} threads')
+
+    def _run_blast(self, subject_sequences: List[Amplicon], query_files: List[str]) -> Dict[str, BlastHits] :
+        """Runs blast against batches of genome files using Pool, batches are sized by total length of genomes.
+        Hits of every batch are collected into compact per-amplicon collections as soon as batch is searched.
+        If persistent database of negative genomes is configured, amplicons are searched against it instead
+        """
+        if InputConfiguration.negative_genomes_db!="":
+            genomes_db=GenomesBlastDb(InputConfiguration.negative_genomes_db, query_files)
+            genomes_db.update()
+            if __name__ == 'generate_msa':
+                print("Running BLAST against negative genomes database")
+                return genomes_db.search(subject_sequences)
+
+        subject_seqs="".join([">"+amplicon.id+"\n"+amplicon.seq+"\n" for amplicon in subject_sequences])
+        blast_runner=BlastRunner()
+        amplicon_hits: Dict[str, BlastHits]={}
+        try:
+            blast_runner.db_from_multi_sequence_string(subject_seqs, self.temp_blast_db_dir)
+            if __name__ == 'generate_msa':
+                print("Running BLAST against genomes")
+                #several small genomes are searched by each blastn process
+                query_batches=blast_runner.batch_query_files(query_files, InputConfiguration.cpu_threads)
+                with Pool(processes= InputConfiguration.cpu_threads) as pool, tqdm(total=len(query_files)) as progress_meter: #min(  max(cpu_count()-1,1) , self.cpu_threads ) )
+                    for query_batch, genome_hits in zip(query_batches, pool.imap(func=blast_runner.run_from_files_by_subject, iterable=query_batches)):
+                        progress_meter.update(len(query_batch))
+                        for amplicon_id, hits in genome_hits.items():
+                            if amplicon_id not in amplicon_hits:
+                                amplicon_hits[amplicon_id]=hits
+                            else:
+                                amplicon_hits[amplicon_id].extend(hits)
+                return amplicon_hits
+        finally:
+            blast_runner.remove_db()
+
+    def _process_blast_results(self, blast_resuls: Dict[str, BlastHits], target_amplicons: List[Amplicon]) -> Dict[str, BlastHits ]:  #str is the name of the amplicon
         """Create a dictionarty which for each amplicon ID lists
         valid blast hits with correctly oriented sequence
         """
-        valid_amplicon_hits: Dict[str, List[BlastResult] ]={}
+        valid_amplicon_hits: Dict[str, BlastHits ]={}
         for amplicon in target_amplicons:
-            valid_amplicon_hits[amplicon.id]=[]
-
-        for result in blast_resuls:
-            valid_amplicon_hits[result.sseqid].append(result)
-
-        del blast_resuls
+            valid_amplicon_hits[amplicon.id]=blast_resuls.get(amplicon.id, BlastHits(amplicon.id))
         return valid_amplicon_hits
 
+    def _alignment_rows(self, blast_results: BlastHits, amplicon_id: str, amplicon_seq: str, is_anchored: bool) -> Tuple[List[List[str]], List[str], List[Tuple[int, int]]]:
+        """Orients hit sequences as the amplicon and collapses identical hit sequences (ex. from closely related genomes),
+        so they are aligned once. Amplicon sequence is always the first row.
+        :return: ids of sequences represented by each row, sequence of each row and amplicon region (start, end) each row matches
+        :rtype: Tuple[List[List[str]], List[str], List[Tuple[int, int]]]
+        """
+        row_members: List[List[str]]=[ [amplicon_id] ]
+        row_sequences: List[str]=[amplicon_seq]
+        row_anchors: List[Tuple[int, int]]=[ (0, len(amplicon_seq)) ]
+        sequence_rows: Dict[Tuple, int]={}
+        for result in blast_results:
+            if result.sstart>result.send:
+                seq_to_allign=str(Seq(result.qseq.replace("-","")).reverse_complement()).upper()
+            else:
+                seq_to_allign=result.qseq.replace("-","").upper()
+            anchor=(min(result.sstart, result.send)-1, max(result.sstart, result.send))
+            #anchored alignment depends on the amplicon region the hit is aligned to
+            row_key=(seq_to_allign, anchor) if is_anchored else (seq_to_allign,)
+            if row_key in sequence_rows:
+                row_members[sequence_rows[row_key]].append(result.qseqid)
+                continue
+            sequence_rows[row_key]=len(row_members)
+            row_members.append([result.qseqid])
+            row_sequences.append(seq_to_allign)
+            row_anchors.append(anchor)
+        return row_members, row_sequences, row_anchors
+
     def _align_results_helper(self, values:List) -> MsaResult:
-        """Take valid blast results and create a file of unalligned hits
-        use MSA tool (here Mafft) to align them
-        this might be replaced later, but at the moment this is simpler approach
-        """
-        blast_results: List[BlastResult]; amplicon_id: str; amplicon_seq: str
-        blast_results, amplicon_id, amplicon_seq=values
-        fasta_file=f'{self.temp_blast_db_dir}/{amplicon_id}.fasta'
-        with open(fasta_file, "w") as output:
-            output.write(">"+amplicon_id+"\n"+amplicon_seq+"\n")
-            for result in blast_results:
-                if result.sstart>result.send:
-                    seq_to_allign=Seq(result.qseq.replace("-","")).reverse_complement()
-                else:
-                    seq_to_allign=result.qseq.replace("-","")
-                output.write(f'>{result.qseqid}'+"\n")
-                output.write(str(seq_to_allign)+"\n")
-
-        outcome=subprocess.run(f'mafft --retree 1 {fasta_file}', \
-                               shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        remove(fasta_file) 
-        if outcome.returncode==2 or outcome.returncode==1:
-            raise OSError(f'Error generating BLAST database: {outcome.stderr}')
-
-        # msa_results: Dict[str,str]={}
-        ids=[]
-        sequences=[]
-        current_sequence=""
+        """Aligns unique hit sequences of amplicon (see _alignment_rows) with MAFFT,
+        or, with "anchored" msa_engine, aligns each hit to the amplicon
+        :param values: amplicon id, ids of sequences of each row, sequence of each row, amplicon region of each row, planned MAFFT threads
+        :type values: List
+        """
+        amplicon_id: str; row_members: List[List[str]]; row_sequences: List[str]; row_anchors: List[Tuple[int, int]]; threads: int
+        amplicon_id, row_members, row_sequences, row_anchors, threads = values
+        ids=[f[0] for f in row_members]
+        if InputConfiguration.msa_engine=="anchored":
+            sequences=self._anchored_alignment(row_sequences, row_anchors)
+        elif _thread_budget is None:
+            sequences=self._mafft_alignment(ids, row_sequences, threads)
+        else:
+            threads=_thread_budget.acquire(threads)
+            try:
+                sequences=self._mafft_alignment(ids, row_sequences, threads)
+            finally:
+                _thread_budget.release(threads)
+        return MsaResult( amplicon_id, ids, sequences, row_members)
+
+    def _mafft_alignment(self, ids: List[str], sequences: List[str], threads: int=1) -> List[str]:
+        """Aligns sequences with MAFFT using strategy chosen by _mafft_strategy. The first sequence is the amplicon.
+        """
+        strategy, strategy_arguments = self._mafft_strategy(len(sequences))
+        fasta_lines=[f'>{seq_id}\n{sequence}\n' for seq_id, sequence in zip(ids, sequences)]
+        arguments=["mafft", "--thread", str(threads)]+strategy_arguments
+        if strategy=="add-fragments":
+            #hits are passed to MAFFT through stdin and added to the amplicon, which is the only temporary file
+            with tempfile.NamedTemporaryFile(mode="w", suffix=".fasta", dir=InputConfiguration.scratch_dir if InputConfiguration.scratch_dir!="" else None) as amplicon_file:
+                amplicon_file.write(fasta_lines[0])
+                amplicon_file.flush()
+                outcome=subprocess.run(arguments+["/dev/stdin", amplicon_file.name], input="".join(fasta_lines[1:]).encode(),
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        else:
+            #sequences are passed to MAFFT through stdin, so there are no temporary files
+            outcome=subprocess.run(arguments+["-"], input="".join(fasta_lines).encode(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if outcome.returncode!=0:
+            raise OSError(f'Error running MAFFT: {outcome.stderr.decode()}')
+
+        #MAFFT keeps sequences in input order (added fragments follow the amplicon), so aligned sequences match ids
+        aligned_sequences=[]
+        current_sequence=[]
         for line in outcome.stdout.decode().strip().split("\n"):
             if line[0]==">":
-                ids.append(line[1:])
                 if len(current_sequence)!=0:
-                    sequences.append(current_sequence)
-                    current_sequence=""
+                    aligned_sequences.append("".join(current_sequence))
+                    current_sequence=[]
             else:
-                current_sequence = current_sequence + line
-        sequences.append(current_sequence)
-
-        return MsaResult( amplicon_id, ids, sequences)
-
+                current_sequence.append(line.strip())
+        aligned_sequences.append("".join(current_sequence))
+        return aligned_sequences
+
+    def _seed_blocks(self, target: str, query: str) -> List[Tuple[int, int, int]]:
+        """Exactly matching blocks of target and query that are used as fixed points of alignment.
+        Blocks start with k-mers that occur in target only once and are extended while bases match,
+        blocks are collinear and shift between diagonals of neighbouring blocks is limited.
+        :return: (target start, query start, length) of each block
+        :rtype: List[Tuple[int, int, int]]
+        """
+        k=self.SEED_KMER_LEN
+        kmer_positions: Dict[str, int]={}
+        for i in range(len(target)-k+1):
+            kmer_positions[target[i:i+k]]=-1 if target[i:i+k] in kmer_positions else i
+        max_shift=abs(len(target)-len(query))+self.MAX_SEED_SHIFT
+        blocks: List[Tuple[int, int, int]]=[]
+        target_end, query_end = 0, 0
+        query_start=0
+        while query_start<=len(query)-k:
+            target_start=kmer_positions.get(query[query_start:query_start+k], -1)
+            if target_start<target_end or abs( (target_start-query_start)-(target_end-query_end) )>max_shift:
+                query_start+=1
+                continue
+            length=k
+            while target_start+length<len(target) and query_start+length<len(query) and target[target_start+length]==query[query_start+length]:
+                length+=1
+            blocks.append( (target_start, query_start, length) )
+            target_end, query_end = target_start+length, query_start+length
+            query_start=query_end
+        return blocks
+
+    def _anchored_alignment(self, sequences: List[str], anchors: List[Tuple[int, int]]) -> List[str]:
+        """Aligns every hit to the amplicon region found by BLAST and places it on amplicon coordinates.
+        The first sequence is the amplicon. Bases inserted in hits relative to amplicon have no amplicon
+        coordinate and are dropped, these MSA columns can't be used for SNPs anyway. Amplicon bases not covered
+        by the hit, or deleted in it, are gaps.
+        Exactly matching seed blocks are copied as they are, only sequences between them are aligned by dynamic programming.
+        :param sequences: amplicon followed by hit sequences in amplicon orientation
+        :type sequences: List[str]
+        :param anchors: for each sequence, start (0-indexed) and end (not included) of amplicon region it matches
+        :type anchors: List[Tuple[int, int]]
+        :return: aligned sequences, all of amplicon length
+        :rtype: List[str]
+        """
+        amplicon_seq=sequences[0].upper()
+        #scores are blastn defaults, gap of length k costs 5+2*k
+        aligner=PairwiseAligner(mode="global", match_score=2, mismatch_score=-3, open_gap_score=-7, extend_gap_score=-2)
+        aligned_sequences=[amplicon_seq]
+        for sequence, (anchor_start, anchor_end) in zip(sequences[1:], anchors[1:]):
+            aligned=bytearray(b"-"*len(amplicon_seq))
+            target=amplicon_seq[anchor_start:anchor_end]
+            blocks=self._seed_blocks(target, sequence)
+            target_end, query_end = 0, 0
+            #regions between blocks (and after the last block) are aligned, blocks are copied
+            for target_start, query_start, length in blocks+[ (len(target), len(sequence), 0) ]:
+                if target_start>target_end and query_start>query_end:
+                    alignment=aligner.align(target[target_end:target_start], sequence[query_end:query_start])[0]
+                    for (gap_target_start, gap_target_end), (gap_query_start, gap_query_end) in zip(*alignment.aligned):
+                        aligned[anchor_start+target_end+gap_target_start:anchor_start+target_end+gap_target_end]=\
+                            sequence[query_end+gap_query_start:query_end+gap_query_end].encode()
+                aligned[anchor_start+target_start:anchor_start+target_start+length]=sequence[query_start:query_start+length].encode()
+                target_end, query_end = target_start+length, query_start+length
+            aligned_sequences.append(aligned.decode())
+        return aligned_sequences
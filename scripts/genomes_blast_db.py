@@ -0,0 +1,211 @@
+import subprocess
+from os import stat, makedirs, replace
+from os.path import exists, realpath
+from typing import List, Tuple, Dict
+from multiprocessing import Pool
+import hashlib
+import pickle
+from Bio.Seq import Seq
+from tqdm import tqdm
+from data_classes import Amplicon, BlastHits, InputConfiguration
+from file_utils import open_file, fasta_contig_id
+from run_blast import stream_process_output
+
+class GenomesBlastDb:
+    """Persistent BLAST database of negative genomes.
+    Database is built once and reused by subsequent runs until the genome catalog changes. Catalog fingerprint
+    is calculated from path, size and modification time of every genome file.
+    Genome contigs are renamed in the database, so that contigs with same names in different files don't clash.
+    The catalog file maps database ids back to genome files and original contig ids.
+    makeblastdb splits large collections into several volumes, blastn searches all of them.
+    E-values are rescaled to search space of genome contig against all amplicons, so that they are same as
+    when each genome is searched against amplicons and don't depend on which other genomes are in the database.
+    """
+
+    CATALOG_VERSION=2
+    DB_NAME="negative_genomes"
+    AMPLICONS_PER_BATCH=50
+
+    def __init__(self, db_dir: str, genome_files: List[str]) -> None:
+        """
+        :param db_dir: Directory for the database, it is created if it does not exist
+        :type db_dir: str
+        :param genome_files: Fasta files (can be gzip compressed) of negative genomes
+        :type genome_files: List[str]
+        """
+        self.db_dir=db_dir
+        self.genome_files=sorted(genome_files)
+        self.word_size: int=InputConfiguration.blast_word_size
+        self.e_value: float=InputConfiguration.blast_evalue
+        self._contig_ids: List[List[str]]=[]
+        self._contig_lengths: List[List[int]]=[]
+        self._amplicons_length: int=0
+
+    @property
+    def db_path(self) -> str:
+        return f'{self.db_dir}/{self.DB_NAME}'
+
+    @property
+    def catalog_file(self) -> str:
+        return f'{self.db_dir}/{self.DB_NAME}.catalog.pkl'
+
+    def catalog_fingerprint(self) -> str:
+        """Hash of paths, sizes and modification times of genome files
+        :rtype: str
+        """
+        catalog_hash=hashlib.blake2b(digest_size=20)
+        for genome_file in self.genome_files:
+            file_stats=stat(genome_file)
+            catalog_hash.update(f'{realpath(genome_file)}\t{file_stats.st_size}\t{file_stats.st_mtime_ns}\n'.encode())
+        return catalog_hash.hexdigest()
+
+    @staticmethod
+    def db_contig_id(file_index: int, contig_index: int) -> str:
+        return f'ng{file_index}_{contig_index}'
+
+    def _load_catalog(self) -> bool:
+        if not exists(self.catalog_file):
+            return False
+        try:
+            with open(self.catalog_file, "rb") as pickled_file:
+                catalog=pickle.load(pickled_file)
+        except (OSError, pickle.UnpicklingError, EOFError) as error:
+            print(f'Negative genomes database catalog {self.catalog_file} could not be loaded and database will be rebuilt: {error}')
+            return False
+        if catalog.get("version")!=self.CATALOG_VERSION or catalog.get("fingerprint")!=self.catalog_fingerprint():
+            return False
+        self._contig_ids=catalog["contig_ids"]
+        self._contig_lengths=catalog["contig_lengths"]
+        return True
+
+    def update(self) -> bool:
+        """Builds the database, unless database for the same genomes already exists
+        :return: True if database was (re)built
+        :rtype: bool
+        """
+        if self._load_catalog():
+            print(f'Using existing BLAST database of {len(self.genome_files)} negative genomes in {self.db_dir}')
+            return False
+        print(f'Building BLAST database of {len(self.genome_files)} negative genomes in {self.db_dir}')
+        if not exists(self.db_dir):
+            makedirs(self.db_dir)
+        #genomes are streamed to makeblastdb with renamed contigs, so there is no combined copy of genomes on disk
+        builder=subprocess.Popen(["makeblastdb", "-in", "-", "-dbtype", "nucl", "-parse_seqids", "-title", self.DB_NAME,
+                                  "-out", self.db_path], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self._contig_ids=[]
+        self._contig_lengths=[]
+        try:
+            for file_index, genome_file in enumerate(tqdm(self.genome_files)):
+                file_contig_ids: List[str]=[]
+                file_contig_lengths: List[int]=[]
+                with open_file(genome_file) as genome:
+                    for line in genome:
+                        if line[0]==">":
+                            builder.stdin.write(f'>{self.db_contig_id(file_index, len(file_contig_ids))}\n'.encode())
+                            file_contig_ids.append(fasta_contig_id(line, len(file_contig_ids)))
+                            file_contig_lengths.append(0)
+                        else:
+                            builder.stdin.write(line.encode() if line[-1]=="\n" else (line+"\n").encode()) #last line of file may lack new line
+                            file_contig_lengths[-1]+=len(line.strip())
+                self._contig_ids.append(file_contig_ids)
+                self._contig_lengths.append(file_contig_lengths)
+            builder.stdin.close()
+        except BrokenPipeError:
+            pass #makeblastdb failed, the error is reported below
+        if builder.wait()!=0:
+            raise OSError(f'Error generating BLAST database of negative genomes: {builder.stderr.read().decode()}')
+        #catalog is written only after database is complete, so interrupted build is rebuilt on next run
+        temp_file=f'{self.catalog_file}.tmp'
+        with open(temp_file, "wb") as output:
+            pickle.dump({"version": self.CATALOG_VERSION, "fingerprint": self.catalog_fingerprint(), "contig_ids": self._contig_ids,
+                         "contig_lengths": self._contig_lengths}, output)
+        replace(temp_file, self.catalog_file)
+        return True
+
+    @staticmethod
+    def _contig_index(db_contig_id: str) -> Tuple[int, int]:
+        file_index, contig_index = db_contig_id.split("|")[-1][2:].split("_")
+        return (int(file_index), int(contig_index))
+
+    def genome_contig(self, db_contig_id: str) -> Tuple[str, str]:
+        """Genome file and original contig id of the database contig
+        :param db_contig_id: contig id in the database
+        :type db_contig_id: str
+        :rtype: Tuple[str, str]
+        """
+        file_index, contig_index = self._contig_index(db_contig_id)
+        return (self.genome_files[file_index], self._contig_ids[file_index][contig_index])
+
+    @property
+    def search_space(self) -> int:
+        """Search space passed to blastn, it is the smallest search space of any contig against all amplicons,
+        so that blastn e-value cut-off doesn't drop hits that pass the cut-off after rescaling
+        :rtype: int
+        """
+        shortest_contig=min([min(f, default=1) for f in self._contig_lengths], default=1)
+        return max(shortest_contig, 1)*max(self._amplicons_length, 1)
+
+    def genome_evalue(self, db_contig_id: str, evalue: float) -> float:
+        """Rescales e-value reported by blastn to search space of the contig against all amplicons,
+        which blastn uses when genome is query and amplicons are database (length adjustment is ignored)
+        :param db_contig_id: contig id in the database
+        :type db_contig_id: str
+        :param evalue: e-value reported by blastn with search_space
+        :type evalue: float
+        :rtype: float
+        """
+        file_index, contig_index = self._contig_index(db_contig_id)
+        return evalue*self._contig_lengths[file_index][contig_index]*self._amplicons_length/self.search_space
+
+    def _add_hit(self, subject_hits: Dict[str, BlastHits], blast_hit: List[bytes]) -> None:
+        """Converts hit of amplicon (query) against genome (subject) into hit of genome against amplicon
+        which is what BlastRunner.run_from_file_by_subject produces when genome is query and amplicons are database.
+        Hit is dropped if its rescaled e-value is above the cut-off.
+        :param subject_hits: hits of each amplicon, new hit is added to them
+        :type subject_hits: Dict[str, BlastHits]
+        :param blast_hit: values of blastn output line: qseqid qstart qend sseqid sstart send pident evalue sseq
+        :type blast_hit: List[bytes]
+        """
+        evalue=self.genome_evalue(blast_hit[3].decode(), float(blast_hit[7]))
+        if evalue>self.e_value:
+            return
+        amplicon_id=blast_hit[0].decode()
+        if amplicon_id not in subject_hits:
+            subject_hits[amplicon_id]=BlastHits(amplicon_id)
+        genome_file, contig_id = self.genome_contig(blast_hit[3].decode())
+        genome_start, genome_end = int(blast_hit[4]), int(blast_hit[5])
+        if genome_start<=genome_end:
+            subject_hits[amplicon_id].append(contig_id, genome_start, genome_end, int(blast_hit[1]), int(blast_hit[2]),
+                                             float(blast_hit[6]), evalue, blast_hit[8], genome_file)
+        else:
+            #genome was on the reverse strand, genome sequence is returned in genome orientation
+            subject_hits[amplicon_id].append(contig_id, genome_end, genome_start, int(blast_hit[2]), int(blast_hit[1]),
+                                             float(blast_hit[6]), evalue, str(Seq(blast_hit[8].decode()).reverse_complement()), genome_file)
+
+    def _search_batch(self, amplicons: List[Tuple[str, str]]) -> Dict[str, BlastHits]:
+        query="".join([f'>{amplicon_id}\n{sequence}\n' for amplicon_id, sequence in amplicons])
+        subject_hits: Dict[str, BlastHits]={}
+        for line in stream_process_output(["blastn", "-task", "megablast", "-query", "-", "-db", self.db_path,
+                                           "-max_target_seqs", "1000000000", "-num_threads", "1",
+                                           "-evalue", str(self.e_value), "-searchsp", str(self.search_space), "-word_size", str(self.word_size),
+                                           "-outfmt", "6 qseqid qstart qend sseqid sstart send pident evalue sseq"],
+                                          stdin_data=query.encode()):
+            if line.strip()!=b"":
+                self._add_hit(subject_hits, line.rstrip(b"\n").split(b"\t"))
+        return subject_hits
+
+    def search(self, amplicons: List[Amplicon]) -> Dict[str, BlastHits]:
+        """Searches amplicons against the database in batches
+        :param amplicons: amplicons to search
+        :type amplicons: List[Amplicon]
+        :return: hits of each amplicon in the same form as BlastRunner.run_from_file_by_subject with genomes as queries
+        :rtype: Dict[str, BlastHits]
+        """
+        query_amplicons=[(f.id, f.seq) for f in amplicons]
+        self._amplicons_length=sum([len(f.seq) for f in amplicons]) #set before Pool, so that workers get it
+        batches=[query_amplicons[i:i+self.AMPLICONS_PER_BATCH] for i in range(0, len(query_amplicons), self.AMPLICONS_PER_BATCH)]
+        amplicon_hits: Dict[str, BlastHits]={}
+        with Pool(processes=InputConfiguration.cpu_threads) as pool:
+            for batch_hits in tqdm( pool.imap(func=self._search_batch, iterable=batches), total=len(batches) ):
+                amplicon_hits.update(batch_hits) #every amplicon is in a single batch
+        return amplicon_hits
@@ -1,7 +1,10 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import pandas as pd
-from collections import Counter
+import numpy as np
+import numpy.typing as npt
+import warnings
 from data_classes import Genotype, Genotypes, Sample, InputConfiguration
+from snp_matrix import SnpPresenceMatrix
 
 class HierarchyUtilities:
     """Class representing a hierarchy structure of the target organims.
@@ -44,44 +47,90 @@ class HierarchyUtilities:
     _column_to_gt: List[str]
     _genotype_snps: pd.DataFrame
 
-    def find_defining_snps(self, samples: List[Sample]) -> Genotypes:
+    def find_defining_snps(self, samples: List[Sample], snp_matrix: SnpPresenceMatrix=None) -> Genotypes:
         """Identifies SNPs that are specific to genotypes
         :param samples: Collection of all samples that were loaded from VCF files.
         :type samples: List[Sample]
+        :param snp_matrix: Presence matrix of samples SNPs, if not supplied it is created from samples SNPs
+        :type snp_matrix: SnpPresenceMatrix, optional
         """
+        if snp_matrix is None:
+            snp_matrix=SnpPresenceMatrix.from_samples(samples)
+        hierarchy_genotypes: List[Genotype]=list(self.genotype_hierarchy.values())
+        gt_snps, gt_samples_counts=self._genotype_snp_counts(snp_matrix, hierarchy_genotypes)
+        non_gt_snps=gt_snps[-1,:]-gt_snps[:-1,:] #last row has counts for all samples
+        non_gt_samples_counts=gt_samples_counts[-1]-gt_samples_counts[:-1]
+        gt_snps=gt_snps[:-1,:]
+        gt_samples_counts=gt_samples_counts[:-1]
+
+        #Sensitivity and specificity for all genotypes and SNPs at once. Each SNP is checked as both
+        #a genotype allele (SNP present in genotype) and a non-genotype allele (SNP present in the rest of samples)
+        #a genotype can be defined by SNPs not present in it or SNPs present in it
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gt_fraction=gt_snps/gt_samples_counts[:,None]
+            non_gt_fraction=non_gt_snps/non_gt_samples_counts[:,None]
+        direct_sensitivity, direct_specificity = gt_fraction, 1-non_gt_fraction
+        inverted_sensitivity, inverted_specificity = non_gt_fraction, 1-gt_fraction
+        direct_snps=(gt_snps>0) & (direct_sensitivity>InputConfiguration.specificity_limit) & (direct_specificity>InputConfiguration.sensitivity_limit)
+        #SNP that passes as genotype allele is not added again as non-genotype allele
+        inverted_snps=(non_gt_snps>0) & (inverted_sensitivity>InputConfiguration.specificity_limit) & (inverted_specificity>InputConfiguration.sensitivity_limit) & ~direct_snps
+
+        all_snps=snp_matrix.snps
         genotypes=Genotypes()
-        for gt_name, genotype in self.genotype_hierarchy.items():
-            gt_samples=[f for f in samples if f.genotype in genotype.subgenotypes]
-            non_gt_samples=[f for f in samples if f.genotype not in genotype.subgenotypes]
-            gt_snps=Counter([snp for sample in gt_samples for snp in sample.snps])
-            non_gt_snps=Counter([snp for sample in non_gt_samples for snp in sample.snps])
-            for snps_dict, invert_specificity_sensitivity in zip([gt_snps, non_gt_snps], [False, True]):
-                #a genotype can be defined by SNPs not present in it or SNPs present in it
-                #for this reason, SNPs in genotype samples are not sufficient and SNPs not in genotype also have to be checked
-                #this creates potiential double counting, which needs to be checked
-                for gt_snp, gt_snp_count in snps_dict.items():
-                    if gt_snp.position==16879:
-                        a=1
-                    if invert_specificity_sensitivity:
-                        specificity=1-gt_snps[gt_snp]/len(gt_samples)
-                        sensitivity=non_gt_snps[gt_snp]/(  len(non_gt_samples) )
-                        allele_depth=non_gt_snps[gt_snp]
-                    else:
-                        sensitivity=gt_snp_count/len(gt_samples)
-                        specificity=1-non_gt_snps[gt_snp]/len(non_gt_samples)
-                        allele_depth=gt_snp_count
-                    if sensitivity>InputConfiguration.specificity_limit and specificity>InputConfiguration.sensitivity_limit and gt_snp not in genotype.defining_snps:
-                        # gt_snp not in genotype.defining_snps check for redundancy
-                        snp_copy=gt_snp.copy()
-                        snp_copy.sensitivity=sensitivity
-                        snp_copy.specificity=specificity
-                        snp_copy.passes_filters=True
-                        snp_copy.is_genotype_snp=True
-                        genotype_allele=gt_snp.ref_base if invert_specificity_sensitivity else gt_snp.alt_base
-                        genotype.add_genotype_allele(snp_copy, genotype_allele, allele_depth )
+        for i, genotype in enumerate(hierarchy_genotypes):
+            if gt_samples_counts[i]==0 or non_gt_samples_counts[i]==0:
+                warnings.warn(f'Genotype {genotype.name} has {gt_samples_counts[i]} of {gt_samples_counts[i]+non_gt_samples_counts[i]} samples, specificity and sensitivity cannot be calculated')
+                genotypes.add_genotype(genotype)
+                continue
+            for passing_snps, sensitivity, specificity, depths, invert_specificity_sensitivity in \
+                    [(direct_snps, direct_sensitivity, direct_specificity, gt_snps, False),
+                     (inverted_snps, inverted_sensitivity, inverted_specificity, non_gt_snps, True)]:
+                for snp_id in np.flatnonzero(passing_snps[i,:]):
+                    gt_snp=all_snps[snp_id]
+                    if genotype.has_snp(gt_snp):
+                        continue #redundancy check, genotype can already have alleles from previous run
+                    snp_copy=gt_snp.copy()
+                    snp_copy.sensitivity=sensitivity[i, snp_id]
+                    snp_copy.specificity=specificity[i, snp_id]
+                    snp_copy.passes_filters=True
+                    snp_copy.is_genotype_snp=True
+                    genotype_allele=gt_snp.ref_base if invert_specificity_sensitivity else gt_snp.alt_base
+                    genotype.add_genotype_allele(snp_copy, genotype_allele, int(depths[i, snp_id]) )
 
-            genotypes.genotypes.append(genotype)
+            genotypes.add_genotype(genotype)
             print(f'{genotype.name} has {str(len(genotype.defining_snps))} SNPs')
         return genotypes
 
-       
\ No newline at end of file
+    def _genotype_snp_counts(self, snp_matrix: SnpPresenceMatrix, hierarchy_genotypes: List[Genotype]) -> Tuple[npt.NDArray, npt.NDArray]:
+        """Counts SNPs in samples of each hierarchy genotype (incl. subgenotypes).
+        The matrix is scanned once to get counts per sample genotype. Hierarchy genotypes are then 
+        processed from smallest to largest, so that counts of a genotype are the sum of counts of 
+        genotypes nested in it (ex. 4.3.1.1 in 4.3.1) plus counts of its remaining sample genotypes.
+        :return: SNP counts with one row per hierarchy genotype plus last row for all samples 
+                and number of samples in each of these rows
+        :rtype: Tuple[npt.NDArray, npt.NDArray]
+        """
+        sample_genotypes, sample_genotype_sizes, sample_genotype_counts=snp_matrix.genotype_column_counts()
+        sample_genotype_index: Dict[str, int]=dict([ (name, i) for i, name in enumerate(sample_genotypes) ])
+        snps_counts=np.zeros( (len(hierarchy_genotypes)+1, sample_genotype_counts.shape[1]), dtype=np.int64)
+        samples_counts=np.zeros( len(hierarchy_genotypes)+1, dtype=np.int64)
+
+        genotype_labels=[ set(genotype.subgenotypes) for genotype in hierarchy_genotypes ]
+        processed_genotypes: List[int]=[]
+        #smallest genotypes first, so that counts of nested genotypes are complete when genotypes containing them are reached
+        for i in sorted(range(0, len(hierarchy_genotypes)), key=lambda x: len(genotype_labels[x])):
+            remaining_labels=set(genotype_labels[i])
+            #largest nested genotypes first, they cover the most samples
+            for nested in sorted(processed_genotypes, key=lambda x: len(genotype_labels[x]), reverse=True):
+                if genotype_labels[nested] < genotype_labels[i] and genotype_labels[nested] <= remaining_labels:
+                    snps_counts[i,:]+=snps_counts[nested,:]
+                    samples_counts[i]+=samples_counts[nested]
+                    remaining_labels-=genotype_labels[nested]
+            label_rows=[ sample_genotype_index[label] for label in remaining_labels if label in sample_genotype_index ]
+            if len(label_rows)>0:
+                snps_counts[i,:]+=sample_genotype_counts[label_rows,:].sum(axis=0)
+                samples_counts[i]+=sample_genotype_sizes[label_rows].sum()
+            processed_genotypes.append(i)
+        snps_counts[-1,:]=sample_genotype_counts.sum(axis=0)
+        samples_counts[-1]=sample_genotype_sizes.sum()
+        return (snps_counts, samples_counts)
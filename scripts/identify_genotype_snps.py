@@ -1,15 +1,29 @@
 from inputs_validation import ValidateFiles
 from os import listdir
-from os.path import splitext
 import metadata_utils as metadata_utils
 from load_vcfs import VCFutilities
 from hierarchy_utils import HierarchyUtilities
+from snp_matrix import SnpPresenceMatrix
+from cohort_index import CohortIndex
+import file_utils
 import pandas as pd
-from typing import Dict, List
+import numpy.typing as npt
+from typing import Dict, List, Tuple, Set
 from data_classes import  Genotypes, Sample, SNP, InputConfiguration
+from multiprocessing import Pool
+from functools import partial
 from tqdm import tqdm
 import pickle
 
+def _read_vcf_records(vcf_file: str, with_fingerprint: bool=False, multi_sample_vcfs: Set[str]=frozenset()) -> Tuple[str, List[Tuple[str, int, str, str]], Tuple[int, float, str]]:
+    """Pool worker, parses single VCF into compact SNP records.
+    Repeat regions are inherited from the parent process via VCFutilities class attribute
+    """
+    fingerprint=CohortIndex.file_fingerprint(vcf_file) if with_fingerprint else None
+    if vcf_file in multi_sample_vcfs:
+        return (vcf_file, VCFutilities().multi_sample_vcf_to_snp_records(vcf_file), fingerprint)
+    return (vcf_file, VCFutilities().vcf_to_snp_records(vcf_file), fingerprint)
+
 class GenotypeSnpIdentifier:
 
     def __init__(self, config: InputConfiguration) -> None:
@@ -17,7 +31,7 @@ class GenotypeSnpIdentifier:
         self.vcf_utils=VCFutilities()
         self.file_validator=ValidateFiles()
         self.master_vcf=pd.DataFrame()
-        self.vcf_files: List[str]=[f'{config.vcf_dir}{f}' for f in listdir(config.vcf_dir) if splitext(f)[1]==".vcf"  ]
+        self.vcf_files: List[str]=[f'{config.vcf_dir}{f}' for f in listdir(config.vcf_dir) if file_utils.file_extension(f)==".vcf"  ]
 
         if config.repeats_bed_file!="":
             self.file_validator.validate_bed(config.repeats_bed_file)
@@ -25,33 +39,98 @@ class GenotypeSnpIdentifier:
 
         self.vcf_utils.load_repeat_regions(config.repeats_bed_file)
         metadata_utils.load_metadata(config)
-        samples_without_metadata=metadata_utils.samples_in_metadata(self.vcf_files)
-        for sample in samples_without_metadata:
-            self.vcf_files.remove(sample)
+        #joint-called VCFs have many samples, their names are taken from the VCF header
+        self.multi_sample_vcfs: Dict[str, List[str]]={}
+        for vcf in self.vcf_files:
+            if self.vcf_utils.determine_vcf_type(vcf)=="multi_sample":
+                self.multi_sample_vcfs[vcf]=self.vcf_utils.vcf_sample_names(vcf)
+        single_sample_vcfs=[f for f in self.vcf_files if f not in self.multi_sample_vcfs]
+        multi_vcf_samples=[sample for samples in self.multi_sample_vcfs.values() for sample in samples]
+        self.samples_without_metadata: Set[str]=set(metadata_utils.samples_in_metadata(single_sample_vcfs+multi_vcf_samples))
+        for sample in single_sample_vcfs:
+            if sample in self.samples_without_metadata:
+                self.vcf_files.remove(sample)
         metadata_utils.genotype_column=config.genotype_column #this will be an input
 
         if float(config.sensitivity_limit)<0.001 or float(config.specificity_limit)<0.001:
             raise ValueError("Either sensitivity or specifity is <1, did you enter deciman instead of integer? Ex: 0.1 instead of 10.")
         self.hierarchy_utils=HierarchyUtilities()
         self.hierarchy_utils.load_hierarchy(config.hierarchy_file)
+        self.cohort_index=None
+        if config.cohort_index!="":
+            self.cohort_index=CohortIndex(config.cohort_index, config.repeats_bed_file)
         
 
     def identify_snps(self) -> Genotypes:
         """Scans VCF files for SNPs that segregate genotypes of interest from the rest.
 
         """
-        vcfs: List[Sample]=[]
         print("Loading VCFs")
-        all_snps: Dict[SNP, SNP]={} #this is needed for speed. List lookup is slow and sets by nature don't support indexing
+        #SNPs are stored in presence matrix rather than in samples, it is much more compact
+        snp_matrix=SnpPresenceMatrix()
         with tqdm(total=len(self.vcf_files)) as progress_meter:
-            for i, vcf in enumerate(self.vcf_files):
-                vcf_obj=Sample(vcf.replace(".vcf",""), vcf)
-                vcf_obj.genotype=metadata_utils.get_metavalue(vcf, metadata_utils.genotype_column)
-                self.vcf_utils.vcf_to_snps(vcf, all_snps, vcf_obj)
-                vcfs.append( vcf_obj )
+            for vcf, snp_records in self._parse_vcfs():
+                if vcf in self.multi_sample_vcfs:
+                    self._add_multi_sample_vcf(snp_matrix, vcf, snp_records)
+                else:
+                    vcf_obj=Sample(file_utils.remove_compression_extension(vcf).replace(".vcf",""), vcf)
+                    vcf_obj.genotype=metadata_utils.get_metavalue(vcf, metadata_utils.genotype_column)
+                    snp_matrix.add_sample(vcf_obj, snp_records)
                 progress_meter.update(1)
+        snp_matrix.pack()
+        if InputConfiguration.collapse_clonal_samples:
+            samples_count=snp_matrix.shape[0]
+            snp_matrix.collapse_identical_samples()
+            print(f'Collapsed {samples_count} samples into {snp_matrix.shape[0]} samples with unique genotype and SNPs')
 
-        genotype_bifurcating_snps: Genotypes=self.hierarchy_utils.find_defining_snps(vcfs)
+        genotype_bifurcating_snps: Genotypes=self.hierarchy_utils.find_defining_snps(snp_matrix.samples, snp_matrix)
 
         return genotype_bifurcating_snps
-    
\ No newline at end of file
+
+    def _add_multi_sample_vcf(self, snp_matrix: SnpPresenceMatrix, vcf: str, multi_sample_records: Tuple[List[str], List[Tuple[str, int, str, str]], List[npt.NDArray]]) -> None:
+        """Adds samples of multi-sample VCF that have metadata to SNP matrix
+        """
+        sample_names, snp_records, sample_record_ids = multi_sample_records
+        samples: List[Sample]=[]
+        samples_record_ids: List[npt.NDArray]=[]
+        for sample_name, record_ids in zip(sample_names, sample_record_ids):
+            if sample_name in self.samples_without_metadata:
+                continue
+            sample=Sample(sample_name, vcf)
+            sample.genotype=metadata_utils.get_metavalue(sample_name, metadata_utils.genotype_column)
+            samples.append(sample)
+            samples_record_ids.append(record_ids)
+        snp_matrix.add_multi_sample_records(samples, snp_records, samples_record_ids)
+
+    def _parse_vcfs(self):
+        """Yields (vcf file, SNP records) in the order of self.vcf_files.
+        If cohort index is used, only VCFs that are new or changed since the last run are parsed,
+        records of the other VCFs come from the index.
+        """
+        if self.cohort_index is None:
+            for vcf, snp_records, _ in self._read_vcfs(self.vcf_files, False):
+                yield (vcf, snp_records)
+        else:
+            changed_vcfs=self.cohort_index.changed_files(self.vcf_files)
+            print(f'{len(self.vcf_files)-len(changed_vcfs)} VCFs loaded from cohort index, {len(changed_vcfs)} VCFs are new or changed')
+            for vcf, snp_records, fingerprint in self._read_vcfs(changed_vcfs, True):
+                self.cohort_index.add(vcf, snp_records, fingerprint)
+            self.cohort_index.save()
+            for vcf in self.vcf_files:
+                yield (vcf, self.cohort_index.records(vcf))
+
+    def _read_vcfs(self, vcf_files: List[str], with_fingerprint: bool):
+        """Yields (vcf file, SNP records, fingerprint) in the order of vcf_files.
+        With more than one CPU the files are parsed by a pool of workers, but the records are
+        still merged into SNP matrix by the caller one file at a time. This keeps SNP identity
+        and deduplication the same as in single process mode.
+        """
+        cpu_threads=getattr(InputConfiguration, "cpu_threads", 1)
+        if cpu_threads<=1 or len(vcf_files)<=1:
+            for vcf in vcf_files:
+                yield _read_vcf_records(vcf, with_fingerprint, self.multi_sample_vcfs)
+        else:
+            chunk_size=max(1, len(vcf_files)//(cpu_threads*8) )
+            with Pool(processes=cpu_threads) as pool:
+                for result in pool.imap(partial(_read_vcf_records, with_fingerprint=with_fingerprint, multi_sample_vcfs=frozenset(self.multi_sample_vcfs)), vcf_files, chunksize=chunk_size):
+                    yield result
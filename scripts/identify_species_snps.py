@@ -1,8 +1,8 @@
-from collections import Counter
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import numpy as np
+import numpy.typing as npt
 from generate_msa import MsaGenerator, MsaResult
 from data_classes import Amplicon, SNP, FlankingAmplicon, Genotype, InputConfiguration
-from tqdm import tqdm
 
 class IdentifySpeciesSnps:
     """Set of functions to identify SNPs that separate target organism
@@ -31,75 +31,90 @@ class IdentifySpeciesSnps:
         """
         with open(f'{self.msa_dir}/{file_prefix}.fasta', "w") as output_file:
             for i in range(0, msa.matrix.shape[0] ):
-                output_file.write(f'>{msa.seq_ids[i]}'+"\n")
-                output_file.write(msa.row_to_seq(i) + "\n")
+                row_seq=msa.row_to_seq(i)
+                for seq_id in msa.row_members(i): #row can represent several identical sequences
+                    output_file.write(f'>{seq_id}'+"\n")
+                    output_file.write(row_seq + "\n")
         return True
 
 
     def get_bifurcating_snps(self, genotype: Genotype) -> Genotype:
         '''Identifies SNPs that separate target and non-target species around amplicon sequences'''
         msa_generator=MsaGenerator(temp_blast_db_dir=self.temp_blast_db_dir)
-        
-        msa_results: List[MsaResult]=msa_generator.generate_msa(genotype.amplicons, genomes_dir=self.negative_genomes_dir)
-
-        print("Processing MSA data")
-        with tqdm(total=len(msa_results)) as progress_meter:
-            for msa in msa_results:
-                amplicon_id=msa.amplicon_id
-                progress_meter.update(1)
-                self.msa_df_to_msa_file(msa, [f for f in genotype.amplicons if f.id==amplicon_id][0].name) ##this saves MSA files for fasta.
-                current_amplicon=[f for f in genotype.amplicons if f.id==amplicon_id][0]
-                ampicon_msa_seq: str= msa.row_to_seq(msa.seq_ids.index(amplicon_id))
-                msa_to_amplicon_coord: Dict[int, int] =self._map_msa_to_ref_coordinates( msa_seq= list(ampicon_msa_seq) )
-                if len(msa.seq_ids)==1:
-                    current_amplicon.has_homologues=False
-                else:
-                    current_amplicon.has_homologues=True
-                    for i in range(0, msa.matrix.shape[1]):
-                        target_nucleotide=ampicon_msa_seq[i]
-                        if target_nucleotide=="-":
-                            continue #can't target primer to non-existent nucleotide
-                        bases_at_position=Counter( msa.nucleotides_at_col(i) )
-                        if bases_at_position[target_nucleotide]<=InputConfiguration.max_matching_negative_genomes: #i.e. the target strain nucleotide is unique among all other strains
-                            #four cases exist (here, T, C and A can be any nucleotide):
-                            # 1) A vs TTTT : output T
-                            # 2) A vs TTCC : output T and C
-                            # 3) A vs ---- : output -
-                            # 4) A vs TT-- : output T only, not - 
-                            for alt_base, count in bases_at_position.items():
-                                if alt_base!=target_nucleotide:
-                                    if alt_base=="-" and len(bases_at_position)!=2: #case 4
-                                        continue #do not output missing base if there are other nucleotides in that position
-                                    snp=SNP(ref_contig_id=current_amplicon.ref_seq.refseq_id, ref_base=target_nucleotide, alt_base=alt_base,  position=current_amplicon.ref_seq.ref_start+msa_to_amplicon_coord[i])
-                                    if snp.alt_base=="-":
-                                        if i==0:
-                                            continue #exceptional case where deletion is the first base on amplicon and correct VCF cannot be created
-                                        snp.ref_base="".join( [ ampicon_msa_seq[f] for f in range(i-1,i+1) ] ) #For deletions, reference is sequence from previous to deleted base
-                                        snp.alt_base=ampicon_msa_seq[i-1]
-                                    snp.passes_filters=True
-                                    snp.specificity=1
-                                    snp.sensitivity=1
-                                    snp.is_species_snp=True
-                                    genotype.add_genotype_allele(snp, snp.alt_base, bases_at_position[alt_base])
+        amplicons: Dict[str, Amplicon]=dict([ (f.id, f) for f in genotype.amplicons ])
+        gap_code=InputConfiguration.BASE_DIC["-"]
+        amplicon_snps: Dict[str, List[Tuple[SNP, int]]]={}
+        #MSAs are processed as soon as they are aligned, so only MSAs that are being aligned are kept in memory
+        for msa in msa_generator.iter_msa(genotype.amplicons, genomes_dir=self.negative_genomes_dir):
+            amplicon_id=msa.amplicon_id
+            current_amplicon=amplicons[amplicon_id]
+            amplicon_snps[amplicon_id]=[]
+            self.msa_df_to_msa_file(msa, current_amplicon.name) ##this saves MSA files for fasta.
+            amplicon_row=msa.seq_ids.index(amplicon_id)
+            ampicon_msa_seq: str= msa.row_to_seq(amplicon_row)
+            msa_to_amplicon_coord: npt.NDArray =msa.coordinate_map(amplicon_row)
+            if len(msa.seq_ids)==1:
+                current_amplicon.has_homologues=False
+            else:
+                current_amplicon.has_homologues=True
+                for i, alt_code, count in self._species_snp_alleles(msa, amplicon_row):
+                    target_nucleotide=ampicon_msa_seq[i]
+                    alt_base=InputConfiguration.NUMBER_DIC[alt_code]
+                    if alt_code==gap_code and i==0:
+                        continue #exceptional case where deletion is the first base on amplicon and correct VCF cannot be created
+                    snp=SNP(ref_contig_id=current_amplicon.ref_seq.refseq_id, ref_base=target_nucleotide, alt_base=alt_base,  position=current_amplicon.ref_seq.ref_start+int(msa_to_amplicon_coord[i]))
+                    if snp.alt_base=="-":
+                        snp.ref_base=ampicon_msa_seq[i-1:i+1] #For deletions, reference is sequence from previous to deleted base
+                        snp.alt_base=ampicon_msa_seq[i-1]
+                    snp.passes_filters=True
+                    snp.specificity=1
+                    snp.sensitivity=1
+                    snp.is_species_snp=True
+                    amplicon_snps[amplicon_id].append( (snp, count) )
+        #MSAs arrive in order of completion, SNPs are added in order in which MergedAmplicons.merge_amplicons lists amplicons
+        #(longest first, stable), so that SNP found in several overlapping amplicons always gets depth from the same (last) amplicon
+        for amplicon in sorted(genotype.amplicons, key=lambda x: x.len, reverse=True):
+            for snp, count in amplicon_snps.get(amplicon.id, []):
+                genotype.add_genotype_allele(snp, snp.alt_base, count)
         return genotype
-    
-    def _map_msa_to_ref_coordinates(self, msa_seq:List[str])-> Dict[int, int]:
-        """MSA produces a sequence string with gaps so position of nucleotide in the string
-        does not correspond to the position of nucleotide in reference sequence. 
-        This function creates a mapping that allows SNP object to have coordinates of the reference
-        sequence.
-        Where msa position has missing value, the dictionary value is -1
-        The full amplicon sequence is included in MSA, see generate_msa.generate_msa and  generate_msa._align_results
+
+    def _species_snp_alleles(self, msa: MsaResult, amplicon_row: int) -> List[Tuple[int, int, int]]:
+        """Finds MSA columns where amplicon base is unique among all sequences (it is present in at most
+        max_matching_negative_genomes sequences, including the amplicon) and alternative bases in these columns.
+        All columns are processed at once using base counts of the MSA.
+        Four cases exist (here, T, C and A can be any nucleotide):
+        1) A vs TTTT : output T
+        2) A vs TTCC : output T and C
+        3) A vs ---- : output -
+        4) A vs TT-- : output T only, not -
+        :param msa: MSA that includes amplicon sequence
+        :type msa: MsaResult
+        :param amplicon_row: MSA row of the amplicon
+        :type amplicon_row: int
+        :return: (MSA column, alternative base code, number of sequences with alternative base), sorted by column
+            and, within column, by first sequence that has alternative base
+        :rtype: List[Tuple[int, int, int]]
         """
-        amplicon_position=0
-        msa_to_amplicon_position: Dict[int,int]={}
-        for msa_position, position_value in enumerate(msa_seq):
-            if position_value!="-":
-                msa_to_amplicon_position[msa_position]=amplicon_position
-                amplicon_position+=1
-            else:
-                msa_to_amplicon_position[msa_position]=-1
-        return msa_to_amplicon_position
+        gap_code=InputConfiguration.BASE_DIC["-"]
+        amplicon_codes=msa.matrix[amplicon_row,:].astype(np.int64)
+        base_counts=msa.base_counts
+        target_counts=base_counts[np.arange(len(amplicon_codes)), amplicon_codes]
+        #can't target primer to non-existent nucleotide
+        columns=np.flatnonzero( (amplicon_codes!=gap_code) & (target_counts<=InputConfiguration.max_matching_negative_genomes) )
+        column_counts=base_counts[columns]
+        codes=np.arange(base_counts.shape[1])
+        is_alt=(column_counts>0) & (codes[None,:]!=amplicon_codes[columns][:,None])
+        is_case_4=(codes==gap_code)[None,:] & ((column_counts>0).sum(axis=1)!=2)[:,None]
+        is_alt&=~is_case_4
+        #alternative bases are reported in order in which they first appear in the column
+        first_rows=np.zeros(column_counts.shape, dtype=np.int64)
+        column_bases=msa.matrix[:,columns]
+        for code in codes:
+            first_rows[:,code]=np.argmax(column_bases==code, axis=0)
+        alt_columns, alt_codes = np.nonzero(is_alt)
+        order=np.lexsort( (first_rows[alt_columns, alt_codes], alt_columns) )
+        alt_columns, alt_codes = alt_columns[order], alt_codes[order]
+        return list(zip(columns[alt_columns].tolist(), alt_codes.tolist(), column_counts[alt_columns, alt_codes].tolist()))
 
     def generate_flanking_amplicons(self) -> Genotype:
         """Identifies SNPs within left and right amplicon flanking sequences
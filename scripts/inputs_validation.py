@@ -9,6 +9,7 @@ from Bio import SeqIO
 from typing import Set
 from hierarchy_utils import HierarchyUtilities
 from data_classes import InputConfiguration
+from file_utils import file_extension, open_file
 
 class ValidateFiles:
 
@@ -117,7 +118,7 @@ class ValidateFiles:
             return True
         
         vcf_contigs=set()
-        with open(vcf_file_name) as vcf_file:
+        with open_file(vcf_file_name) as vcf_file:
             for line in vcf_file:
                 if line[0]!="#":
                     contig_id=line.split("\t")[0]
@@ -135,9 +136,9 @@ class ValidateFiles:
         if not exists(genomes_dir):
             warnings.warn(f'Negative genomes directory {genomes_dir} does not exist. Please check spelling.')
             return False
-        negative_genomes=[file for file in listdir(genomes_dir) if file.split(".")[-1]=="fna" or file.split(".")[-1]=="fasta"]
+        negative_genomes=[file for file in listdir(genomes_dir) if file_extension(file) in [".fna", ".fasta"]]
         if len(negative_genomes)==0:
-            warnings.warn(f'Negative genomes directory {genomes_dir} has no files ending in .fna or .fasta')
+            warnings.warn(f'Negative genomes directory {genomes_dir} has no files ending in .fna or .fasta (or .fna.gz, .fasta.gz)')
             return False
         return True
 
@@ -145,7 +146,7 @@ class ValidateFiles:
         if not exists(vcfs_dir):
             warnings.warn(f'VCF directory {vcfs_dir} does not exist. Please check spelling.')
             return False
-        vcf_files=[file for file in listdir(vcfs_dir) if file.split(".")[-1]=="vcf"]
+        vcf_files=[file for file in listdir(vcfs_dir) if file_extension(file)==".vcf"]
         if len(vcf_files)==0:
             warnings.warn(f'Directory {vcfs_dir} have no VCF files')
             return False
@@ -153,7 +154,7 @@ class ValidateFiles:
         if not exists(vcf_file_name):
             warnings.warn(f'VCF file or directory {vcf_file_name} does not exist')
             return False
-        vcf_file= open(vcf_file_name)
+        vcf_file= open_file(vcf_file_name)
         first_two_char=vcf_file.readline()[0:2]
         if first_two_char!="##":
             vcf_file.close()
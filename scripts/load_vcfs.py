@@ -1,41 +1,67 @@
 import warnings
-from typing import Dict, Tuple, Set, List
+from typing import Dict, Tuple, Set, List, BinaryIO, Callable
+from shutil import which
+import subprocess
+from array import array
+import numpy as np
+import numpy.typing as npt
 from data_classes import SNP, Sample, Genotypes, Genotype, InputConfiguration
 from io import TextIOWrapper
+from file_utils import open_file, is_compressed
+from repeat_mask import RepeatMask
 ## Consider replacing some of this with GATKs VariantsToTable
 
    
 class VCFutilities():
 
-    repeat_coordinates: Set[ Tuple[str, int] ]=set()
+    repeat_coordinates: RepeatMask=RepeatMask()
+    READ_BLOCK_SIZE=1<<22
+    WRITE_BUFFER_LINES=10000
 
     def __init__(self) -> None:
         pass
 
 
     def determine_vcf_type(self, filename: str) -> str:
-        """Checks whether VCF is single- or multisample.
+        """Checks whether VCF is single- or multisample. VCF can be gzip or bgzip compressed.
 
         :param filename: full name to VCF file
         :type filename: str
         :return: VCF type as either single_sample or multi_sample
         """
         vcf_file_type="Unknown"
-        with open(filename) as vcf_file:
+        with open_file(filename) as vcf_file:
             for line in vcf_file:
                 if line[0:6]=="#CHROM":
-                    header_columns=line.strip().split("\t")
-                    if len(header_columns)==10:
-                        vcf_file_type="single_sample"
-                    elif len(header_columns)>10:
-                        vcf_file_type="multi_sample"
-                    else:
-                        raise ValueError(f'VCF file {filename} has fewer than 10 columns which is minimum required')
+                    vcf_file_type=self._vcf_type_from_header(line, filename)
                     break
         if vcf_file_type=="Unknown":
             raise ValueError(f'Header line not found in VCF file {filename}. Were looking for line starting with #CHROM')
         return vcf_file_type
 
+    def _vcf_type_from_header(self, header_line: str, filename: str) -> str:
+        header_columns=header_line.strip().split("\t")
+        if len(header_columns)==10:
+            return "single_sample"
+        elif len(header_columns)>10:
+            return "multi_sample"
+        else:
+            raise ValueError(f'VCF file {filename} has fewer than 10 columns which is minimum required')
+
+    def vcf_sample_names(self, filename: str) -> List[str]:
+        """Returns names of sample columns of VCF, only the header of the file is read
+        :param filename: full name to VCF file
+        :type filename: str
+        :return: Sample names in the order of VCF columns
+        :rtype: List[str]
+        """
+        with open_file(filename) as vcf_file:
+            for line in vcf_file:
+                if line[0:6]=="#CHROM":
+                    self._vcf_type_from_header(line, filename)
+                    return line.rstrip("\r\n").split("\t")[9:]
+        raise ValueError(f'Header line not found in VCF file {filename}. Were looking for line starting with #CHROM')
+
     def vcf_to_snps(self, filename: str, existing_snps:Dict[SNP, SNP], sample: Sample):
         """Converts VCF file into SNPs. The SNPs will be added to the inputted sample object 
         
@@ -46,54 +72,217 @@ class VCFutilities():
         :param sample: Dictionary of SNPs loaded from previous VCF files
         :type sample: Sample that contains VCF data 
         """
-        vcf_file_type=self.determine_vcf_type(filename)
-
-        multiploid_positions=[]
-        if vcf_file_type=="single_sample":
-            #vcf_datatypes={"CHROM":"string","POS":int, "REF": "string", "ALT": "string", "FORMAT": "string"}
-            with open(filename) as vcf_file_handle:
-                snps_to_add: List[SNP]=[]
-                for line in vcf_file_handle:
-                    if line[0]=="#" or line=="\n":
+        snp_records=self.vcf_to_snp_records(filename)
+        self.add_snp_records(snp_records, existing_snps, sample)
+
+    def vcf_to_snp_records(self, filename: str) -> List[Tuple[str, int, str, str]]:
+        """Reads VCF file into a compact list of (contig, position, ref, allele) tuples.
+        This does not create any SNP objects so the result is cheap to send between processes.
+        The file is read in large blocks and only the columns that are used are split out.
+        
+        :param filename: full name to VCF file
+        :type filename: str
+        :return: SNP records in the order they appear in VCF file
+        :rtype: List[Tuple[str, int, str, str]]
+        """
+        vcf_file_type="Unknown"
+        multiploid_positions=0
+        snp_records: List[Tuple[str, int, str, str]]=[]
+        contig_ids: Dict[str, str]={} #reuse same contig string so that pickling the records stays small
+        gt_indices: Dict[str, int]={} #FORMAT column is usually identical for all records, so GT index is only looked up once
+        repeat_coordinates=self.repeat_coordinates
+        check_repeats=len(repeat_coordinates)>0
+        contig_repeat_masks: Dict[str, npt.NDArray]={}
+        with open_file(filename, "rb") as vcf_file_handle:
+            for lines_block in self._read_blocks(vcf_file_handle):
+                for line in lines_block.split("\n"):
+                    if line=="" or line[0]=="#":
+                        if line[0:6]=="#CHROM":
+                            #file type is determined in the same pass, so the file is only read once
+                            vcf_file_type=self._vcf_type_from_header(line, filename)
+                            if vcf_file_type!="single_sample":
+                                raise ValueError(f'The vcf type {vcf_file_type} cannot be loaded as single sample, use multi_sample_vcf_to_snp_records instead')
                         continue
-                    chrom, pos, id, ref, alt, qual, filter, info, format, values=line.strip().split("\t")
+                    if vcf_file_type=="Unknown":
+                        break
+                    chrom, pos, _, ref, alt, other_columns=line.split("\t", 5)
+                    chrom=contig_ids.setdefault(chrom, chrom)
                     pos=int(pos)-1  #the rest of the code is 0 indexed like BED and BAM, but VCF coordinates are 1-indexed
-                    if (chrom, pos) in self.repeat_coordinates:
-                        continue
+                    if check_repeats:
+                        repeat_mask=contig_repeat_masks.get(chrom)
+                        if repeat_mask is None:
+                            repeat_mask=contig_repeat_masks[chrom]=repeat_coordinates.contig_mask(chrom)
+                        if pos<len(repeat_mask) and repeat_mask[pos]:
+                            continue
                     if alt.find(",")>-1:
                         #multiploid line, skip with a warning
-                        multiploid_positions.append((chrom, pos))
+                        multiploid_positions+=1
                         continue
-                    gt_index=format.split(":").index("GT")
-                    if gt_index==-1:
-                        raise ValueError(f'VCF file {filename} does not have genotype code [GT] in SAMPLE colum at {chrom} {str(pos-1)}')
+                    _, format, values=other_columns.rsplit("\t", 2)
+                    gt_index=gt_indices.get(format)
+                    if gt_index is None:
+                        format_fields=format.split(":")
+                        if "GT" not in format_fields:
+                            raise ValueError(f'VCF file {filename} does not have genotype code [GT] in SAMPLE colum at {chrom} {str(pos-1)}')
+                        gt_index=gt_indices[format]=format_fields.index("GT")
 
-                    allele = ref if values.split(",")[gt_index].split(":")[0]=="0" else alt
-                    snp=SNP(ref_contig_id=chrom, ref_base=ref, alt_base=allele, position=pos)
-                    if snp not in existing_snps:
-                        existing_snps[snp]=snp
-                        
-                    if snp not in sample.snps:
-                        snps_to_add.append(existing_snps[snp])
-            sample.snps.extend(snps_to_add)
+                    if gt_index==0:
+                        genotype_code=values.partition(":")[0]
+                        if genotype_code.find(",")>-1:
+                            genotype_code=genotype_code.partition(",")[0]
+                    else:
+                        genotype_code=values.split(":")[gt_index]
+                    snp_records.append( (chrom, pos, ref, ref if genotype_code=="0" else alt) )
 
+                if vcf_file_type=="Unknown":
+                    break
+        if vcf_file_type=="Unknown":
+            raise ValueError(f'Header line not found in VCF file {filename}. Were looking for line starting with #CHROM')
 
+        if multiploid_positions>0:
+            warnings.warn(f'VCF file {filename} has {multiploid_positions} multiploid positions. These will be ignored as bacterial haploid VCFs expected')
 
-            if len(multiploid_positions)>0:
-                warnings.warn(f'VCF file {filename} has {len(multiploid_positions)} multiploid positions. These will be ignored as bacterial haploid VCFs expected')
+        return snp_records
 
-        else:
-            raise ValueError(f'The vcf type {vcf_file_type} is not currently supported')
+    def multi_sample_vcf_to_snp_records(self, filename: str) -> Tuple[List[str], List[Tuple[str, int, str, str]], List[npt.NDArray]]:
+        """Reads multi-sample VCF in a single pass without splitting it into per-sample VCFs.
+        Each distinct (contig, position, ref, allele) is stored once and every sample gets an array of
+        indices of the records it carries, so memory is bounded by one VCF line plus these outputs.
+        Only non-reference alleles are recorded, reference (0), missing (.) and heterozygous calls are skipped.
+        
+        :param filename: full name to VCF file
+        :type filename: str
+        :return: sample names, distinct SNP records and for each sample indices of its records
+        :rtype: Tuple[List[str], List[Tuple[str, int, str, str]], List[npt.NDArray]]
+        """
+        sample_names: List[str]=[]
+        snp_records: List[Tuple[str, int, str, str]]=[]
+        sample_record_ids: List[array]=[]
+        heterozygous_calls=0
+        contig_ids: Dict[str, str]={}
+        gt_indices: Dict[str, int]={}
+        repeat_coordinates=self.repeat_coordinates
+        check_repeats=len(repeat_coordinates)>0
+        contig_repeat_masks: Dict[str, npt.NDArray]={}
+        header_found=False
+        with open_file(filename, "rb") as vcf_file_handle:
+            for lines_block in self._read_blocks(vcf_file_handle):
+                for line in lines_block.split("\n"):
+                    if line=="" or line[0]=="#":
+                        if line[0:6]=="#CHROM":
+                            self._vcf_type_from_header(line, filename)
+                            sample_names=line.split("\t")[9:]
+                            sample_record_ids=[array("i") for _ in sample_names]
+                            header_found=True
+                        continue
+                    if not header_found:
+                        break
+                    chrom, pos, _, ref, alt, _, _, _, format, values=line.split("\t", 9)
+                    chrom=contig_ids.setdefault(chrom, chrom)
+                    pos=int(pos)-1
+                    if check_repeats:
+                        repeat_mask=contig_repeat_masks.get(chrom)
+                        if repeat_mask is None:
+                            repeat_mask=contig_repeat_masks[chrom]=repeat_coordinates.contig_mask(chrom)
+                        if pos<len(repeat_mask) and repeat_mask[pos]:
+                            continue
+                    gt_index=gt_indices.get(format)
+                    if gt_index is None:
+                        format_fields=format.split(":")
+                        if "GT" not in format_fields:
+                            raise ValueError(f'VCF file {filename} does not have genotype code [GT] in SAMPLE colum at {chrom} {str(pos-1)}')
+                        gt_index=gt_indices[format]=format_fields.index("GT")
+                    if gt_index==0:
+                        genotype_codes=[f.partition(":")[0] for f in values.split("\t")]
+                    else:
+                        genotype_codes=[f.split(":")[gt_index] for f in values.split("\t")]
+                    alleles=[ref]+alt.split(",")
+                    code_record_ids: Dict[str, int]={} #usually only couple of distinct codes per line
+                    for sample_index, genotype_code in enumerate(genotype_codes):
+                        if genotype_code=="0" or genotype_code==".":
+                            continue
+                        record_id=code_record_ids.get(genotype_code)
+                        if record_id is None:
+                            allele_index=self._genotype_code_to_allele(genotype_code, len(alleles), filename)
+                            if allele_index is None:
+                                record_id=-1
+                            elif allele_index==0:
+                                record_id=-2 #reference or missing, ex. 0/0 or ./.
+                            else:
+                                record_id=len(snp_records)
+                                snp_records.append( (chrom, pos, ref, alleles[allele_index]) )
+                            code_record_ids[genotype_code]=record_id
+                        if record_id==-1:
+                            heterozygous_calls+=1
+                        elif record_id>=0:
+                            sample_record_ids[sample_index].append(record_id)
+                if not header_found:
+                    break
+        if not header_found:
+            raise ValueError(f'Header line not found in VCF file {filename}. Were looking for line starting with #CHROM')
+        if heterozygous_calls>0:
+            warnings.warn(f'VCF file {filename} has {heterozygous_calls} heterozygous calls. These will be ignored as bacterial haploid VCFs expected')
+        return (sample_names, snp_records, [np.frombuffer(f, dtype=np.int32) if len(f)>0 else np.zeros(0, dtype=np.int32) for f in sample_record_ids])
+
+    def _genotype_code_to_allele(self, genotype_code: str, alleles_count: int, filename: str) -> int:
+        """Converts GT code to index of the allele, 0 is reference or missing call. 
+        Returns None for heterozygous calls, homozygous calls (ex. 1/1) are treated as haploid
+        """
+        allele_codes=set(genotype_code.replace("|","/").split("/"))
+        if len(allele_codes)!=1:
+            return None
+        allele_code=allele_codes.pop()
+        if allele_code==".":
+            return 0
+        if not allele_code.isdigit() or int(allele_code)>=alleles_count:
+            raise ValueError(f'VCF file {filename} has invalid genotype code {genotype_code}')
+        return int(allele_code)
+
+    def _read_blocks(self, file_handle: BinaryIO):
+        """Yields decoded text of binary file in large blocks. Every block ends on a complete line
+        so it can be split into lines without checking for partial lines.
+        """
+        remainder=b""
+        while True:
+            block=file_handle.read(self.READ_BLOCK_SIZE)
+            if not block:
+                break
+            last_line_end=block.rfind(b"\n")
+            if last_line_end==-1:
+                remainder+=block
+                continue
+            text=(remainder+block[:last_line_end]).decode()
+            remainder=block[last_line_end+1:]
+            yield text.replace("\r","") if text.find("\r")>-1 else text
+        if remainder!=b"":
+            text=remainder.decode()
+            yield text.replace("\r","") if text.find("\r")>-1 else text
+
+    def add_snp_records(self, snp_records: List[Tuple[str, int, str, str]], existing_snps:Dict[SNP, SNP], sample: Sample):
+        """Converts records produced by vcf_to_snp_records into SNPs and adds them to the sample.
+        SNPs already present in existing_snps are reused, so the same SNP is represented by one object
+        
+        :param snp_records: (contig, position, ref, allele) tuples from one VCF file
+        :type snp_records: List[Tuple[str, int, str, str]]
+        :param existing_snps: Dictionary of SNPs loaded from previous VCF files
+        :type existing_snps:  Dict[SNP, SNP]
+        :param sample: Sample to which the SNPs are added
+        :type sample: Sample
+        """
+        snps_to_add: List[SNP]=[]
+        for chrom, pos, ref, allele in snp_records:
+            snp=SNP(ref_contig_id=chrom, ref_base=ref, alt_base=allele, position=pos)
+            snp=existing_snps.setdefault(snp, snp)
+            if not sample.has_snp(snp):
+                snps_to_add.append(snp)
+        sample.add_snps(snps_to_add)
 
 
     def load_repeat_regions(self, bed_file: str) -> bool:
         VCFutilities.repeat_coordinates.clear()
         if bed_file=="":
             return True
-        with open(bed_file) as bed_data:
-            for line in bed_data:
-                values=line.strip().split("\t")
-                VCFutilities.repeat_coordinates.update( [(values[0],f) for f in range(int(values[1]), int(values[2]))] )
+        VCFutilities.repeat_coordinates.load_bed(bed_file)
         return True
     
 
@@ -131,62 +320,44 @@ class VCFutilities():
         return [f for f in gt_snp if f[0].get_genotype_allele(f[1])!=reference_allele]
 
         
-    def output_genotypes_vcf(self, genotypes: Genotypes, output_file: str) -> None:
-        with open(output_file, "w") as vcf_output_file:
-            #write the vcf header
-            gt_columns=self._write_vcf_header(genotypes, vcf_output_file)
-
-            coordinates=sorted(set([coordinate for genotype in genotypes.genotypes for coordinate in genotype.defining_snp_coordinates]))
-            for contig_id, position in coordinates:
-                snps_at_coordinates=[(genotype, snp) for genotype in genotypes.genotypes for snp in genotype.defining_snps if snp.position==position and snp.ref_contig_id==contig_id]
-                alt_alleles: List[Tuple[Genotype, SNP]] = self._get_vcf_snp_to_ouput(snps_at_coordinates)
-                if len(alt_alleles)>1:
-                    print(f'Excess alleles at pos: {str(position)} contig {contig_id}')
-                    continue
-                if len(alt_alleles)==0:
-                    print(f'SNP found, but no GT with alt allele present at pos: {str(position)} contig {contig_id}')
-                    continue
-                genotype, snp=alt_alleles[0]
-                alt_str=snp.alt_base
+    def _snps_by_coordinate(self, genotypes: Genotypes) -> Tuple[Dict[Tuple[str, int], List[Tuple[Genotype, SNP]]], List[Tuple[str, int]]]:
+        """Groups SNPs of all genotypes by their coordinate in a single pass over genotypes.
+        Within a coordinate (genotype, SNP) pairs follow the order of genotypes and of their SNPs.
 
+        :param genotypes: genotypes with defining SNPs
+        :type genotypes: Genotypes
+        :return: (genotype, SNP) pairs at each coordinate and sorted coordinates of SNPs that pass filters
+        :rtype: Tuple[Dict[Tuple[str, int], List[Tuple[Genotype, SNP]]], List[Tuple[str, int]]]
+        """
+        snps_at_coordinates: Dict[Tuple[str, int], List[Tuple[Genotype, SNP]]]={}
+        passing_coordinates: Set[Tuple[str, int]]=set()
+        for genotype in genotypes.genotypes:
+            for snp in genotype.defining_snps:
+                snps_at_coordinates.setdefault(snp.coordinate, []).append( (genotype, snp) )
                 if snp.passes_filters:
-                    if genotype.get_genotype_allele(snp)==snp.alt_base:
-                        suffix=["0:."]*len(gt_columns)
-                        for gt in genotype.subgenotypes:
-                            if gt in gt_columns: #if genotype X and X.1 are separate targets, X.1 needs to show all SNPs of X,
-                                #but if only X is target, X.1 will not be an output column in VCF
-                                suffix[gt_columns[gt]]="1:"+str(genotype.get_genotype_allele_depth(snp)) #0 is REF allele
-                        vcf_snp_id="_".join( ["GT",genotype.name,snp.ref_contig_id,str(snp.position+1)] )
-                    else:
-                        suffix=["1:."]*len(gt_columns) #set
-                        for gt in genotype.subgenotypes:
-                            if gt in gt_columns: #if genotype X and X.1 are separate targets, X.1 needs to show all SNPs of X,
-                                #but if only X is target, X.1 will not be an output column in VCF
-                                suffix[gt_columns[gt]]="0:"+str(genotype.get_genotype_allele_depth(snp)) #0 is REF allele
-                        vcf_snp_id="_".join( ["GT",genotype.name,snp.ref_contig_id,str(snp.position+1)] )
-
-                    vcf_output_file.write("\t".join([str(f) for f in [snp.ref_contig_id,
-                                                                        snp.position+1,
-                                                                        vcf_snp_id,
-                                                                        snp.ref_base,
-                                                                        alt_str,
-                                                                        ".",
-                                                                        "PASS",
-                                                                        ".",
-                                                                        "GT:DP",
-                                                                        ]+suffix ]   ) +"\n" )
+                    passing_coordinates.add(snp.coordinate)
+        return snps_at_coordinates, sorted(passing_coordinates)
 
+    def _write_vcf(self, genotypes: Genotypes, output_file: str, vcf_record_values: Callable[[Genotype, SNP, Dict[str, int]], Tuple[str, List[str]]], **kwargs) -> None:
+        """Writes one VCF record for every coordinate with genotype defining SNPs, records are in coordinate order.
+        If output file name ends with .gz, the VCF is bgzip compressed and indexed with tabix (if tabix is available).
 
-    def output_species_vcf(self, genotypes: Genotypes, output_file: str) -> None:
-        with open(output_file, "w") as vcf_output_file:
+        :param genotypes: genotypes with defining SNPs
+        :type genotypes: Genotypes
+        :param output_file: path to output VCF
+        :type output_file: str
+        :param vcf_record_values: function that returns VCF ID and sample columns of the record for genotype and its SNP
+        :type vcf_record_values: Callable[[Genotype, SNP, Dict[str, int]], Tuple[str, List[str]]]
+        :param extra_columns: sample columns to add after genotype columns, optional
+        :type extra_columns: List[str]
+        """
+        snps_at_coordinates, coordinates = self._snps_by_coordinate(genotypes)
+        with open_file(output_file, "w") as vcf_output_file:
             #write the vcf header
-            gt_columns=self._write_vcf_header(genotypes, vcf_output_file, extra_columns=[])
-
-            coordinates=sorted(set([coordinate for genotype in genotypes.genotypes for coordinate in genotype.defining_snp_coordinates]))
+            gt_columns=self._write_vcf_header(genotypes, vcf_output_file, **kwargs)
+            vcf_lines: List[str]=[]
             for contig_id, position in coordinates:
-                snps_at_coordinates=[(genotype, snp) for genotype in genotypes.genotypes for 
-                                     snp in genotype.defining_snps if snp.position==position and snp.ref_contig_id==contig_id]
-                alt_alleles: List[Tuple[Genotype, SNP]] = self._get_vcf_snp_to_ouput(snps_at_coordinates)
+                alt_alleles: List[Tuple[Genotype, SNP]] = self._get_vcf_snp_to_ouput(snps_at_coordinates[(contig_id, position)])
                 if len(alt_alleles)>1:
                     print(f'Excess alleles at pos: {str(position)} contig {contig_id}')
                     continue
@@ -194,41 +365,69 @@ class VCFutilities():
                     print(f'SNP found, but no GT with alt allele present at pos: {str(position)} contig {contig_id}')
                     continue
                 genotype, snp=alt_alleles[0]
-                alt_str=snp.alt_base
+                if not snp.passes_filters:
+                    continue
+                vcf_snp_id, suffix = vcf_record_values(genotype, snp, gt_columns)
+                vcf_lines.append("\t".join([str(f) for f in [snp.ref_contig_id,
+                                                                snp.position+1,
+                                                                vcf_snp_id,
+                                                                snp.ref_base,
+                                                                snp.alt_base,
+                                                                ".",
+                                                                "PASS",
+                                                                ".",
+                                                                "GT:DP",
+                                                                ]+suffix ]   ) +"\n" )
+                if len(vcf_lines)>=self.WRITE_BUFFER_LINES:
+                    vcf_output_file.write("".join(vcf_lines))
+                    vcf_lines=[]
+            vcf_output_file.write("".join(vcf_lines))
+        if is_compressed(output_file):
+            self._index_vcf(output_file)
+
+    def _index_vcf(self, vcf_file: str) -> None:
+        """Creates tabix index of bgzip compressed VCF, index is skipped if tabix is not installed
+        :param vcf_file: path to bgzip compressed VCF
+        :type vcf_file: str
+        """
+        if which("tabix") is None:
+            print(f'tabix is not available, {vcf_file} will not be indexed')
+            return None
+        outcome=subprocess.run(["tabix", "-f", "-p", "vcf", vcf_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if outcome.returncode!=0:
+            warnings.warn(f'Failed to index {vcf_file}: {outcome.stderr.decode()}')
 
-                #for genotype, snp in snps_at_coordinates:
-                #check that snp is in multi genotype region
+    def _genotype_record_values(self, genotype: Genotype, snp: SNP, gt_columns: Dict[str, int]) -> Tuple[str, List[str]]:
+        if genotype.get_genotype_allele(snp)==snp.alt_base:
+            suffix=["0:."]*len(gt_columns)
+            for gt in genotype.subgenotypes:
+                if gt in gt_columns: #if genotype X and X.1 are separate targets, X.1 needs to show all SNPs of X,
+                    #but if only X is target, X.1 will not be an output column in VCF
+                    suffix[gt_columns[gt]]="1:"+str(genotype.get_genotype_allele_depth(snp)) #0 is REF allele
+        else:
+            suffix=["1:."]*len(gt_columns) #set
+            for gt in genotype.subgenotypes:
+                if gt in gt_columns: #if genotype X and X.1 are separate targets, X.1 needs to show all SNPs of X,
+                    #but if only X is target, X.1 will not be an output column in VCF
+                    suffix[gt_columns[gt]]="0:"+str(genotype.get_genotype_allele_depth(snp)) #0 is REF allele
+        vcf_snp_id="_".join( ["GT",genotype.name,snp.ref_contig_id,str(snp.position+1)] )
+        return vcf_snp_id, suffix
 
-                if snp.passes_filters:
-                    if genotype.name!=InputConfiguration.SPECIES_NAME:
-                        if genotype.get_genotype_allele(snp)==snp.alt_base:
-                            suffix=["0:."]*len(gt_columns)
-                            for subgenotype in genotype.subgenotypes:
-                                if subgenotype in gt_columns:
-                                    suffix[gt_columns[subgenotype]]="1:"+str(genotype.get_genotype_allele_depth(snp)) #0 is REF allele
-                        else:
-                            suffix=["1:."]*len(gt_columns) #set
-                            for subgenotype in genotype.subgenotypes:
-                                if subgenotype in gt_columns:
-                                    suffix[gt_columns[subgenotype]]="0:"+str(genotype.get_genotype_allele_depth(snp))
-                        vcf_snp_id="_".join( ["GT",genotype.name,snp.ref_contig_id,str(snp.position+1)] )
-                        suffix[gt_columns[InputConfiguration.SPECIES_NAME]]=".:." #predominant SNV is other species is not assesed                        
-                        #suffix[gt_columns["NonTargetSerovar"]]=".:."
-                    else:
-                        vcf_snp_id="_".join( ["Serovar", snp.ref_contig_id ,str(snp.position+1), snp.alt_base] )
-                        suffix=["0:."]*len(gt_columns)
-                        suffix[gt_columns[InputConfiguration.SPECIES_NAME]]="1:"+str(genotypes.genotypes[-1].get_genotype_allele_depth(snp))
-                        #suffix[gt_columns["NonTargetSerovar"]]="1:"+str(genotypes.genotypes[-1].get_genotype_allele_depth(snp))
-                    vcf_output_file.write("\t".join([str(f) for f in [snp.ref_contig_id,
-                                                                        snp.position+1,
-                                                                        vcf_snp_id,
-                                                                        snp.ref_base,
-                                                                        alt_str,
-                                                                        ".",
-                                                                        "PASS",
-                                                                        ".",
-                                                                        "GT:DP",
-                                                                        ]+suffix ]   ) +"\n" )
+    def output_genotypes_vcf(self, genotypes: Genotypes, output_file: str) -> None:
+        self._write_vcf(genotypes, output_file, self._genotype_record_values)
+
+    def output_species_vcf(self, genotypes: Genotypes, output_file: str) -> None:
+        def species_record_values(genotype: Genotype, snp: SNP, gt_columns: Dict[str, int]) -> Tuple[str, List[str]]:
+            if genotype.name!=InputConfiguration.SPECIES_NAME:
+                vcf_snp_id, suffix = self._genotype_record_values(genotype, snp, gt_columns)
+                suffix[gt_columns[InputConfiguration.SPECIES_NAME]]=".:." #predominant SNV is other species is not assesed
+            else:
+                vcf_snp_id="_".join( ["Serovar", snp.ref_contig_id ,str(snp.position+1), snp.alt_base] )
+                suffix=["0:."]*len(gt_columns)
+                suffix[gt_columns[InputConfiguration.SPECIES_NAME]]="1:"+str(genotypes.genotypes[-1].get_genotype_allele_depth(snp))
+            return vcf_snp_id, suffix
+
+        self._write_vcf(genotypes, output_file, species_record_values, extra_columns=[])
 
     def _write_vcf_header(self, genotypes: Genotypes, file_handle: TextIOWrapper, **kwargs) -> Dict[str, int]:
         extra_columns=kwargs.get("extra_columns", [])
@@ -237,9 +436,12 @@ class VCFutilities():
         file_handle.write('##FILTER=<ID=PASS,Description="All filters passed">'+"\n")
         file_handle.write('##ALT=<ID=*,Description="Represents allele(s) other than observed.">'+"\n")
 
-        for ref_contig in set([snp.ref_contig_id for genotype in genotypes.genotypes for snp in genotype.defining_snps]):
-            contig_max_position=max([snp.position for genotype in genotypes.genotypes for snp in genotype.defining_snps if snp.ref_contig_id == ref_contig])
-            file_handle.write(f'##contig=<ID={ref_contig},length={str(contig_max_position)}>'+"\n")
+        contig_max_positions: Dict[str, int]={}
+        for genotype in genotypes.genotypes:
+            for snp in genotype.defining_snps:
+                contig_max_positions[snp.ref_contig_id]=max(snp.position, contig_max_positions.get(snp.ref_contig_id, snp.position))
+        for ref_contig in sorted(contig_max_positions): #same order as records
+            file_handle.write(f'##contig=<ID={ref_contig},length={str(contig_max_positions[ref_contig])}>'+"\n")
         header_line="#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t"
         gt_columns={}
         for i, gt in enumerate(genotypes.genotypes):
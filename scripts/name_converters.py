@@ -1,5 +1,6 @@
 from typing import Dict, Set, List
 from os.path import split
+from file_utils import remove_compression_extension
 
 _value_to_sample: Dict[str,str]={}
 converters: List[ Dict[str,str]]=[_value_to_sample]
@@ -64,6 +65,7 @@ def address_to_filename(address) -> str:
     
 def filename_to_prefix(filename) -> str:
     filename=split(filename)[-1] # remove the directory part of the path if there is one.
+    filename=remove_compression_extension(filename) # sample.vcf.gz has the same prefix as sample.vcf
     sample=".".join(filename.split(".")[0:-1])
     return sample
 
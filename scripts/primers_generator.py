@@ -234,13 +234,9 @@ class PrimersGenerator():
         if self.config.repeats_bed_file=="":
             return None
         
-        invalid_pairs:List[PrimerPair]=[]
-        for pair in all_pairs:
-            if ( pair.ref_contig, pair.primers[0].ref_start) in VCFutilities.repeat_coordinates or \
-                ( pair.ref_contig, pair.primers[1].ref_end) in VCFutilities.repeat_coordinates:
-                    invalid_pairs.append(pair)
-        for pair in invalid_pairs:
-            all_pairs.remove(pair)
+        #any base of either primer in repeat region makes the pair invalid
+        repeat_mask=VCFutilities.repeat_coordinates
+        all_pairs[:]=[pair for pair in all_pairs if not any([repeat_mask.overlaps(pair.ref_contig, primer.ref_start, primer.ref_end) for primer in pair.primers])]
 
     def _primers_list_to_string(self, primers: List[Primer]) -> str:
         result=""
@@ -268,10 +264,13 @@ class PrimersGenerator():
         existing_primers_string=self._primers_list_to_string(self.existing_primers)
         primers_to_check_string=self._primer_pairs_list_to_string( primer_pairs )
         blast_runner=BlastRunner(word_size=5, e_value=0.1)
-        blast_runner.db_from_file(self.config.reference_fasta, self.config.temp_blast_db)
-        existing_primers_hits:List[BlastResult] = blast_runner.run_from_multi_sequence_string(existing_primers_string, self.config.temp_blast_db)
+        try:
+            blast_runner.db_from_file(self.config.reference_fasta, self.config.temp_blast_db)
+            existing_primers_hits:List[BlastResult] = blast_runner.run_from_multi_sequence_string(existing_primers_string, self.config.temp_blast_db)
+            new_primers_hits:List[BlastResult] = blast_runner.run_from_multi_sequence_string(primers_to_check_string, self.config.temp_blast_db)
+        finally:
+            blast_runner.remove_db()
         existing_primers_hits=sorted(existing_primers_hits, key = lambda x: (x.sseqid, x.sstart))
-        new_primers_hits:List[BlastResult] = blast_runner.run_from_multi_sequence_string(primers_to_check_string, self.config.temp_blast_db)
         new_primers_hits=sorted(new_primers_hits, key = lambda x: (x.sseqid, x.sstart))
         
         #This is suboptimal, but the only way I see to allow standard file format as input for existing primers
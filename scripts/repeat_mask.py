@@ -0,0 +1,118 @@
+from typing import Dict, List, Tuple
+import numpy as np
+import numpy.typing as npt
+
+class RepeatMask:
+    """Repeat regions of the reference loaded from BED file.
+    Each contig has a boolean mask with one value per base for O(1) point lookups
+    and sorted, merged intervals for range overlap checks. The mask is only as long
+    as the end of the last repeat interval on the contig.
+
+    Supports "in" with (contig, position) tuples like the set of repeat coordinates it replaces.
+    """
+
+    def __init__(self) -> None:
+        self._masks: Dict[str, npt.NDArray]={}
+        self._intervals: Dict[str, Tuple[npt.NDArray, npt.NDArray]]={}
+        self._masked_bases=0
+
+    @classmethod
+    def from_bed(cls, bed_file: str):
+        """Constructor using BED file
+        :param bed_file: path to BED file with repeat regions
+        :type bed_file: str
+        """
+        repeat_mask=cls()
+        repeat_mask.load_bed(bed_file)
+        return repeat_mask
+
+    def clear(self) -> None:
+        self._masks.clear()
+        self._intervals.clear()
+        self._masked_bases=0
+
+    def load_bed(self, bed_file: str) -> None:
+        """Replaces current repeat regions with regions from BED file
+        :param bed_file: path to BED file with repeat regions, coordinates are 0-indexed and end is not included
+        :type bed_file: str
+        """
+        contig_intervals: Dict[str, List[Tuple[int, int]]]={}
+        with open(bed_file) as bed_data:
+            for line in bed_data:
+                values=line.strip().split("\t")
+                if len(values)<3:
+                    continue
+                contig_intervals.setdefault(values[0], []).append( (int(values[1]), int(values[2])) )
+        self.set_intervals(contig_intervals)
+
+    def set_intervals(self, contig_intervals: Dict[str, List[Tuple[int, int]]]) -> None:
+        """Replaces current repeat regions
+        :param contig_intervals: for each contig list of (start, end) intervals, end is not included
+        :type contig_intervals: Dict[str, List[Tuple[int, int]]]
+        """
+        self.clear()
+        for contig_id, intervals in contig_intervals.items():
+            if len(intervals)==0:
+                continue
+            starts=np.asarray([f[0] for f in intervals], dtype=np.int64)
+            ends=np.asarray([f[1] for f in intervals], dtype=np.int64)
+            mask=np.zeros(ends.max(), dtype=bool)
+            #difference array marks interval starts and ends, cumulative sum is >0 inside any interval
+            coverage=np.zeros(len(mask)+1, dtype=np.int64)
+            np.add.at(coverage, starts, 1)
+            np.add.at(coverage, ends, -1)
+            mask[:]=np.cumsum(coverage[:-1])>0
+            self._masks[contig_id]=mask
+            #merged intervals are the runs of masked bases
+            edges=np.diff(mask.astype(np.int8), prepend=0, append=0)
+            self._intervals[contig_id]=(np.flatnonzero(edges==1), np.flatnonzero(edges==-1))
+            self._masked_bases+=int(mask.sum())
+
+    def __len__(self) -> int:
+        """Number of bases in repeat regions
+        """
+        return self._masked_bases
+
+    def __contains__(self, coordinate: Tuple[str, int]) -> bool:
+        contig_id, position = coordinate
+        mask=self._masks.get(contig_id)
+        if mask is None or position<0 or position>=len(mask):
+            return False
+        return bool(mask[position])
+
+    def contig_mask(self, contig_id: str) -> npt.NDArray:
+        """Boolean mask of repeat bases of the contig, empty if contig has no repeats.
+        Positions beyond the end of the mask are not in repeats.
+        :param contig_id: contig id
+        :type contig_id: str
+        :rtype: npt.NDArray
+        """
+        return self._masks.get(contig_id, np.zeros(0, dtype=bool))
+
+    def intervals(self, contig_id: str) -> List[Tuple[int, int]]:
+        """Sorted non-overlapping repeat intervals of the contig
+        :param contig_id: contig id
+        :type contig_id: str
+        :rtype: List[Tuple[int, int]]
+        """
+        if contig_id not in self._intervals:
+            return []
+        starts, ends = self._intervals[contig_id]
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def overlaps(self, contig_id: str, start: int, end: int) -> bool:
+        """Checks if range overlaps any repeat region
+        :param contig_id: contig id
+        :type contig_id: str
+        :param start: start of range, 0-indexed
+        :type start: int
+        :param end: end of range, not included
+        :type end: int
+        :rtype: bool
+        """
+        if contig_id not in self._intervals or end<=start:
+            return False
+        starts, ends = self._intervals[contig_id]
+        #first repeat interval that ends after start of range
+        i=np.searchsorted(ends, start, side="right")
+        return bool(i<len(starts) and starts[i]<end)
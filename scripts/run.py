@@ -112,7 +112,7 @@ def _load_specific_target_snps(config_data: InputConfiguration, genotypes: Genot
             target_snp.specificity=1
             #the actual depth is irrelevant
             extra_genotype.add_genotype_allele(target_snp, target_snp.alt_base, depth=100)
-            genotypes.genotypes.append(extra_genotype)
+            genotypes.add_genotype(extra_genotype)
             config_data.gts_with_few_snps.append(name)
 
 def _identify_genotype_SNPs(config_data: InputConfiguration):
@@ -121,7 +121,8 @@ def _identify_genotype_SNPs(config_data: InputConfiguration):
 
     genotypes: Genotypes = snp_identifier.identify_snps()
 
-    #genotypes.genotypes_to_snp_matrix().to_csv(config_data.genotype_snps, sep="\t", index=False)
+    if config_data.genotype_snp_matrix!="":
+        genotypes.snp_matrix_to_file(config_data.genotype_snp_matrix)
 
     with open(config_data.genotype_snps, "w") as snps_file:
         for genotype in genotypes.genotypes:
@@ -136,6 +137,8 @@ def _optimise_snps(config_data: InputConfiguration, genotypes: Genotypes):
     max_iterval_len=config_data.max_amplicon_len
     gts_with_few_snps=config_data.gts_with_few_snps+ [f for f in genotypes.genotypes if len(f.defining_snps)<=10]
     amplicon_intervals=snp_opimiser.optimise(max_iterval_len,genotypes, rare_gts=gts_with_few_snps)
+    if config_data.interval_selection=="set_cover":
+        amplicon_intervals=snp_opimiser.select_intervals(amplicon_intervals, redundancy=config_data.genotype_redundancy, snp_weight=config_data.interval_snp_weight)
     if len(amplicon_intervals)==0:
         print("No intervals with multiple genotypes were identified and none of the genotypes are listed are rare. Add genotypes to 'gts_with_few_snps' in config. Exiting.")
         exit()
@@ -232,7 +235,7 @@ def main():
     ### DEBUG command
 
     target_gts= [genotype.name for genotype in genotypes.genotypes]
-    genotypes.genotypes.append(flanking_amplicons)
+    genotypes.add_genotype(flanking_amplicons)
 
     genotypes.get_duplicate_snps()
 
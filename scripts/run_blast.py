@@ -1,11 +1,51 @@
 import subprocess
+import tempfile
+import threading
 from os.path import exists, isfile
-from os import mkdir
-from data_classes import BlastResult, InputConfiguration
-from typing import List
+from os import makedirs, remove
+from glob import glob
+from data_classes import BlastResult, BlastHits, InputConfiguration
+from typing import List, Dict, Iterator, Iterable, IO, Union
+from file_utils import is_compressed, scratch_name, open_file, uncompressed_size, fasta_contig_id
+
+
+def stream_process_output(arguments: List[str], stdin: IO=None, stdin_data: Union[bytes, Iterable[bytes]]=None) -> Iterator[bytes]:
+    """Runs program and yields lines of its standard output as they are produced,
+    so the whole output is never held in memory
+    :param arguments: program and its arguments
+    :type arguments: List[str]
+    :param stdin: file or pipe to use as standard input, optional
+    :type stdin: IO
+    :param stdin_data: data to write to standard input, either bytes or chunks of bytes produced while program runs, optional
+    :type stdin_data: Union[bytes, Iterable[bytes]]
+    """
+    with tempfile.TemporaryFile() as error_output: #unlike a pipe, file can't fill up and block the program
+        process=subprocess.Popen(arguments, stdin=subprocess.PIPE if stdin_data is not None else stdin,
+                                 stdout=subprocess.PIPE, stderr=error_output)
+        writer=None
+        if stdin_data is not None:
+            #input is written from separate thread, otherwise program may block on full output pipe while input is being written
+            def write_input():
+                try:
+                    for chunk in [stdin_data] if isinstance(stdin_data, bytes) else stdin_data:
+                        process.stdin.write(chunk)
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass #program failed, the error is reported below
+            writer=threading.Thread(target=write_input)
+            writer.start()
+        for line in process.stdout:
+            yield line
+        if writer is not None:
+            writer.join()
+        if process.wait()!=0:
+            error_output.seek(0)
+            raise OSError(f'Error running {arguments[0]}: {error_output.read().decode()}')
 
 
 class BlastRunner:
+    BATCH_BASES=50_000_000 #maximum size of genomes searched by single blastn process, roughly 10 bacterial genomes
+
     def __init__(self, **kwargs) -> None:
         """Class for running BLAST searches
         :key word_size: word size to use in BLAST search, int
@@ -13,62 +53,156 @@ class BlastRunner:
         """
         self.word_size:int=kwargs.get("word_size",InputConfiguration.blast_word_size)
         self.e_value: float= kwargs.get("e_value",InputConfiguration.blast_evalue)
-    
-    def db_from_file(self, file_name:str, db_dir: str) -> bool:
-        self.db_file_name = file_name
-        self.db_dir=db_dir
-        #create blast DB
+
+    def _prepare_db_dir(self, db_dir: str) -> None:
+        #database is scratch data, so it goes to scratch directory (ex. tmpfs) if one is configured.
+        #Database name is unique to the process, so concurrent runs sharing the directory don't overwrite each other
+        self.db_dir=InputConfiguration.scratch_dir if InputConfiguration.scratch_dir!="" else db_dir
         if exists(f'{self.db_dir}') and isfile(f'{self.db_dir}'):
             raise OSError(f'Cannot create directory {self.db_dir} because there is a file with such name')
+        if not exists(f'{self.db_dir}'):
+            makedirs(f'{self.db_dir}')
+        self.db_name=f'{self.db_dir}/{scratch_name("temp")}'
+
+    def _make_db(self, input_file: str, sequences: str="") -> None:
+        outcome=subprocess.run(["makeblastdb", "-in", input_file, "-title", "temp", "-out", self.db_name, "-dbtype", "nucl",
+                                "-blastdb_version", "4"], input=sequences.encode(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if outcome.returncode!=0:
+            raise OSError(f'Error generating blast database: {outcome.stderr.decode()}')
+
+    def remove_db(self) -> None:
+        """Deletes files of the database, database name is unique to the process so they would otherwise accumulate
+        """
+        if not hasattr(self, "db_name"):
+            return
+        for db_file in glob(f'{self.db_name}.*'):
+            remove(db_file)
+
+    def db_from_file(self, file_name:str, db_dir: str) -> bool:
+        self.db_file_name = file_name
         if not exists(self.db_file_name):
             raise ValueError(f'Error generating blast database. Source file {self.db_file_name} does not exist.')
-        if not exists(f'{self.db_dir}'):
-            mkdir(f'{self.db_dir}')
-        outcome=subprocess.run(f'makeblastdb -in {self.db_file_name} -title temp -out {self.db_dir}/temp -dbtype nucl \
-            -blastdb_version 4 1>/dev/null', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if outcome.returncode==1:
-            raise OSError(f'Error generating blast database: {outcome.stderr}')
+        self._prepare_db_dir(db_dir)
+        self._make_db(self.db_file_name)
         return True
 
-
-    def _seq_to_file(self, seq_header: str, sequence: str, temp_dir: str) -> str:
+    def _to_fasta_string(self, seq_header: str, sequence: str) -> str:
         if seq_header[0]==">":
-            input_str=seq_header+"\n"+sequence
+            return seq_header+"\n"+sequence+"\n"
         else:
-            input_str=">"+seq_header+"\n"+sequence
-        return self._write_to_fasta_file(input_str, temp_dir)
-
-    def _write_to_fasta_file(self, string_to_write, temp_dir):
-        #create blast DB
-        if exists(f'{temp_dir}') and isfile(f'{temp_dir}'):
-            raise OSError(f'Cannot create directory {temp_dir} because there is a file with such name')
-        if not exists(temp_dir):
-            mkdir(f'{temp_dir}')
-        temp_fasta_file=temp_dir+"/temp.fasta"
-        with open(temp_fasta_file, "w") as temp_fasta:
-            temp_fasta.write(string_to_write)
-        return temp_fasta_file
-
+            return ">"+seq_header+"\n"+sequence+"\n"
 
     def db_from_string(self, seq_header:str, sequence:str, db_dir: str) -> bool:
-        fasta_file=self._seq_to_file(seq_header, sequence, db_dir)
-        self.db_from_file(fasta_file, db_dir)
+        self._prepare_db_dir(db_dir)
+        self._make_db("-", self._to_fasta_string(seq_header, sequence))
         return True
 
     def db_from_multi_sequence_string(self, sequence:str, db_dir: str) -> bool:
-        fasta_file=self._write_to_fasta_file(sequence, db_dir)
-        self.db_from_file(fasta_file, db_dir)
+        self._prepare_db_dir(db_dir)
+        self._make_db("-", sequence)
         return True
 
+    @property
+    def _blastn_arguments(self) -> List[str]:
+        return ["blastn", "-query", "-", "-task", "megablast", "-max_target_seqs", "1000000000", "-db", self.db_name,
+                "-num_threads", "1", "-evalue", str(self.e_value), "-word_size", str(self.word_size),
+                "-outfmt", "6 qseqid qstart qend sseqid sstart send pident evalue qseq"]
+
     def run_from_file(self, query_file:str) -> List[BlastResult]:
         #quickblast: reference, query, prints query
-        blast_results=subprocess.run(f'blastn -query {query_file} -task \'megablast\' \
-                -max_target_seqs 1000000000 -db {self.db_dir}/temp \
-                -num_threads 1 -evalue {self.e_value} -word_size {self.word_size} \
-                -outfmt \"6 delim=  qseqid qstart qend sseqid sstart send pident evalue qseq\"'
-                , shell=True, executable="/bin/bash", stdout=subprocess.PIPE,  stderr=subprocess.PIPE)
-        if blast_results.returncode==1:
-            raise OSError(f'Error running BLAST: {blast_results.stderr}')
+        #query is streamed to blastn, compressed genomes are decompressed on the fly, so there is no decompressed copy on disk
+        if is_compressed(query_file):
+            decompressor=subprocess.Popen(["gzip", "-dc", query_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            blast_results=subprocess.run(self._blastn_arguments, stdin=decompressor.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            decompressor.stdout.close()
+            if decompressor.wait()!=0:
+                raise OSError(f'Error decompressing {query_file}: {decompressor.stderr.read().decode()}')
+        else:
+            with open(query_file, "rb") as query_input:
+                blast_results=subprocess.run(self._blastn_arguments, stdin=query_input, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return self._parse_blast_output(blast_results, query_file)
+
+    def run_from_file_by_subject(self, query_file:str) -> Dict[str, BlastHits]:
+        """Same search as run_from_file, but hits are read from blastn as they are produced
+        and stored in compact per-subject collections instead of a list of BlastResult objects
+        :param query_file: fasta file (can be gzip compressed) with query sequences
+        :type query_file: str
+        :return: hits of every subject sequence that has hits
+        :rtype: Dict[str, BlastHits]
+        """
+        return self.run_from_files_by_subject([query_file])
+
+    def batch_query_files(self, query_files: List[str], processes: int=1) -> List[List[str]]:
+        """Groups query files into batches that are searched by single blastn process, so that small genomes
+        don't each pay for blastn start up. Batches are at most BATCH_BASES in size, but smaller if that is needed
+        to give every process several batches. Files larger than batch size are in batches of their own.
+        :param query_files: fasta files (can be gzip compressed) with query sequences
+        :type query_files: List[str]
+        :param processes: number of processes that will run batches
+        :type processes: int
+        :rtype: List[List[str]]
+        """
+        file_sizes=[uncompressed_size(f) for f in query_files]
+        batch_bases=max(1, min(self.BATCH_BASES, sum(file_sizes)//(processes*4)))
+        batches: List[List[str]]=[]
+        current_batch_bases=0
+        for query_file, file_size in zip(query_files, file_sizes):
+            if len(batches)==0 or current_batch_bases+file_size>batch_bases:
+                batches.append([])
+                current_batch_bases=0
+            batches[-1].append(query_file)
+            current_batch_bases+=file_size
+        return batches
+
+    @staticmethod
+    def _batch_contig_id(file_index: int, contig_index: int) -> str:
+        return f'q{file_index}_{contig_index}'
+
+    def _batch_fasta(self, query_files: List[str], contig_ids: List[List[str]]) -> Iterator[bytes]:
+        """Yields content of query files with contigs renamed, so that contigs with same names in different files
+        can be told apart. Original ids are added to contig_ids before contig is passed to blastn.
+        """
+        for file_index, query_file in enumerate(query_files):
+            file_contig_ids: List[str]=[]
+            contig_ids.append(file_contig_ids)
+            with open_file(query_file, "rb") as query_input:
+                lines: List[bytes]=[]
+                for line in query_input:
+                    if line[0:1]==b">":
+                        file_contig_ids.append(fasta_contig_id(line.decode(), len(file_contig_ids)))
+                        lines.append(f'>{self._batch_contig_id(file_index, len(file_contig_ids)-1)}\n'.encode())
+                    else:
+                        lines.append(line if line[-1:]==b"\n" else line+b"\n") #last line of file may lack new line
+                    if len(lines)>=10000:
+                        yield b"".join(lines)
+                        lines=[]
+                yield b"".join(lines)
+
+    def run_from_files_by_subject(self, query_files: List[str]) -> Dict[str, BlastHits]:
+        """Searches several query files with single blastn process, hits are attributed back to their query files
+        :param query_files: fasta files (can be gzip compressed) with query sequences
+        :type query_files: List[str]
+        :return: hits of every subject sequence that has hits
+        :rtype: Dict[str, BlastHits]
+        """
+        subject_hits: Dict[str, BlastHits]={}
+        contig_ids: List[List[str]]=[]
+        for line in stream_process_output(self._blastn_arguments, stdin_data=self._batch_fasta(query_files, contig_ids)):
+            if line.strip()==b"":
+                continue
+            values=line.rstrip(b"\n").split(b"\t")
+            sseqid=values[3].decode()
+            if sseqid not in subject_hits:
+                subject_hits[sseqid]=BlastHits(sseqid)
+            file_index, contig_index = values[0].decode()[1:].split("_")
+            file_index, contig_index = int(file_index), int(contig_index)
+            subject_hits[sseqid].append(contig_ids[file_index][contig_index], int(values[1]), int(values[2]), int(values[4]), int(values[5]),
+                                        float(values[6]), float(values[7]), values[8], query_files[file_index])
+        return subject_hits
+
+    def _parse_blast_output(self, blast_results: subprocess.CompletedProcess, query_file: str) -> List[BlastResult]:
+        if blast_results.returncode!=0:
+            raise OSError(f'Error running BLAST: {blast_results.stderr.decode()}')
         raw_blast_results=blast_results.stdout.decode().strip().split("\n")
         blast_hits: List[BlastResult]=[]
 
@@ -90,13 +224,16 @@ class BlastRunner:
             blast_hits.append(new_hit)
 
         return blast_hits
-    
-    def run_from_string(self,  seq_header: str, sequence: str, temp_dir: str) -> List[BlastResult]:
-        fasta_file=self._seq_to_file(seq_header, sequence, temp_dir)
-        blast_hits: List[BlastResult]=self.run_from_file(fasta_file)
-        return blast_hits
-    
-    def run_from_multi_sequence_string(self,  sequence: str, temp_dir: str) -> List[BlastResult]:
-        fasta_file=self._write_to_fasta_file(sequence, temp_dir)
-        blast_hits: List[BlastResult]=self.run_from_file(fasta_file)
-        return blast_hits
\ No newline at end of file
+
+    def run_from_string(self,  seq_header: str, sequence: str, temp_dir: str="") -> List[BlastResult]:
+        """Searches sequence against the database, sequence is passed to blastn through stdin
+        :param temp_dir: not used, sequences are not written to disk
+        """
+        return self.run_from_multi_sequence_string(self._to_fasta_string(seq_header, sequence))
+
+    def run_from_multi_sequence_string(self,  sequence: str, temp_dir: str="") -> List[BlastResult]:
+        """Searches fasta formatted sequences against the database, sequences are passed to blastn through stdin
+        :param temp_dir: not used, sequences are not written to disk
+        """
+        blast_results=subprocess.run(self._blastn_arguments, input=sequence.encode(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return self._parse_blast_output(blast_results, "")
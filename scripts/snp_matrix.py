@@ -0,0 +1,205 @@
+from typing import Dict, List, Tuple
+import numpy as np
+import numpy.typing as npt
+from data_classes import SNP, Sample, SnpRegistry
+
+class SnpPresenceMatrix:
+    """Columnar store of SNPs found in samples.
+    Every distinct SNP (contig, position, alt allele) gets one integer id which is
+    the column of the matrix. Every sample is a row of bit-packed presence values, so
+    10k samples x 200k SNPs need ~250Mb instead of lists of SNP objects per sample.
+
+    Samples are added one at a time while VCFs are loaded and the matrix is
+    packed once by calling pack(). Counting functions use the packed matrix.
+    Packed matrix can optionally be collapsed so that samples of the same genotype with
+    identical SNPs are kept as one row with weight equal to number of such samples.
+    """
+
+    ROWS_PER_CHUNK=1024 #number of rows unpacked at once when counting
+
+    def __init__(self) -> None:
+        self._snp_ids=SnpRegistry() #column ids are local to the matrix, so they are dense even if other SNPs exist
+        self._snps: List[SNP]=[]
+        self._samples: List[Sample]=[]
+        self._sample_snp_ids: List[npt.NDArray]=[] #only kept until matrix is packed
+        self._packed: npt.NDArray=np.zeros( (0,0), dtype=np.uint8)
+        self._weights: npt.NDArray=np.zeros(0, dtype=np.int64) #number of samples each row represents
+        self._is_collapsed=False
+
+    @classmethod
+    def from_samples(cls, samples: List[Sample]):
+        """Constructor using samples that already have SNPs loaded into them
+        :param samples: samples with SNPs
+        :type samples: List[Sample]
+        """
+        snp_matrix=cls()
+        for sample in samples:
+            snp_matrix.add_sample_snps(sample, sample.snps)
+        snp_matrix.pack()
+        return snp_matrix
+
+    @property
+    def snps(self) -> List[SNP]:
+        """SNPs in the order of their ids (i.e. matrix columns)
+        """
+        return self._snps
+
+    @property
+    def samples(self) -> List[Sample]:
+        """Samples in the order of matrix rows
+        """
+        return self._samples
+
+    @property
+    def genotypes(self) -> npt.NDArray:
+        """Genotype of every sample in the order of matrix rows
+        """
+        return np.asarray([f.genotype for f in self._samples], dtype=object)
+
+    @property
+    def weights(self) -> npt.NDArray:
+        """Number of samples represented by each row, all 1 unless matrix was collapsed
+        """
+        return self._weights
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self._samples), len(self._snps))
+
+    @property
+    def is_packed(self) -> bool:
+        return len(self._sample_snp_ids)==0 and self._packed.shape[0]==len(self._samples)
+
+    def snp_id(self, contig_id: str, position: int, alt_base: str, ref_base: str) -> int:
+        """Returns id of the SNP, new SNP is created if it hasn't been seen before
+        """
+        snp_id=self._snp_ids.get_id( (contig_id, position, alt_base) )
+        if snp_id==len(self._snps):
+            self._snps.append( SNP(ref_contig_id=contig_id, ref_base=ref_base, alt_base=alt_base, position=position) )
+        return snp_id
+
+    def add_sample(self, sample: Sample, snp_records: List[Tuple[str, int, str, str]]) -> None:
+        """Adds sample row using records produced by VCFutilities.vcf_to_snp_records
+        :param sample: sample to add, its SNPs list is not populated
+        :type sample: Sample
+        :param snp_records: (contig, position, ref, allele) tuples from sample VCF
+        :type snp_records: List[Tuple[str, int, str, str]]
+        """
+        snp_ids=[self.snp_id(contig_id, position, allele, ref) for contig_id, position, ref, allele in snp_records]
+        self._add_row(sample, snp_ids)
+
+    def add_multi_sample_records(self, samples: List[Sample], snp_records: List[Tuple[str, int, str, str]], sample_record_ids: List[npt.NDArray]) -> None:
+        """Adds sample rows using output of VCFutilities.multi_sample_vcf_to_snp_records
+        :param samples: samples to add, one for each item of sample_record_ids
+        :type samples: List[Sample]
+        :param snp_records: distinct (contig, position, ref, allele) tuples from multi-sample VCF
+        :type snp_records: List[Tuple[str, int, str, str]]
+        :param sample_record_ids: for each sample indices of snp_records it carries
+        :type sample_record_ids: List[npt.NDArray]
+        """
+        record_snp_ids=np.asarray([self.snp_id(contig_id, position, allele, ref) for contig_id, position, ref, allele in snp_records], dtype=np.int64)
+        for sample, record_ids in zip(samples, sample_record_ids):
+            self._add_row(sample, record_snp_ids[record_ids])
+
+    def add_sample_snps(self, sample: Sample, snps: List[SNP]) -> None:
+        """Adds sample row using SNP objects
+        :param sample: sample to add
+        :type sample: Sample
+        :param snps: SNPs present in the sample
+        :type snps: List[SNP]
+        """
+        snp_ids=[self.snp_id(snp.ref_contig_id, snp.position, snp.alt_base, snp.ref_base) for snp in snps]
+        self._add_row(sample, snp_ids)
+
+    def _add_row(self, sample: Sample, snp_ids: List[int]) -> None:
+        if len(self._sample_snp_ids)==0 and len(self._samples)!=0:
+            raise ValueError("Samples cannot be added after the matrix has been packed")
+        self._samples.append(sample)
+        self._sample_snp_ids.append( np.asarray(snp_ids, dtype=np.int64) )
+
+    def pack(self) -> None:
+        """Converts per sample SNP ids into bit-packed matrix
+        """
+        if self.is_packed:
+            return None
+        snps_count=len(self._snps)
+        self._packed=np.zeros( (len(self._samples), (snps_count+7)//8 ), dtype=np.uint8)
+        row_bits=np.zeros(snps_count, dtype=bool)
+        for row, snp_ids in enumerate(self._sample_snp_ids):
+            row_bits[:]=False
+            row_bits[snp_ids]=True
+            self._packed[row,:]=np.packbits(row_bits)
+        self._sample_snp_ids=[]
+        self._weights=np.ones(len(self._samples), dtype=np.int64)
+
+    def collapse_identical_samples(self) -> int:
+        """Replaces samples that have the same genotype and identical SNPs with single
+        representative (first such sample) weighted by number of samples it replaces.
+        Counting functions use the weights so their results do not change.
+        :return: number of rows after collapsing
+        :rtype: int
+        """
+        self.pack()
+        representative_rows: Dict[Tuple[str, bytes], int]={}
+        kept_rows: List[int]=[]
+        weights: List[int]=[]
+        for row, sample in enumerate(self._samples):
+            key=(str(sample.genotype), self._packed[row,:].tobytes())
+            kept_index=representative_rows.get(key)
+            if kept_index is None:
+                representative_rows[key]=len(kept_rows)
+                kept_rows.append(row)
+                weights.append(self._weights[row])
+            else:
+                weights[kept_index]+=self._weights[row]
+        self._samples=[self._samples[f] for f in kept_rows]
+        self._packed=self._packed[kept_rows,:]
+        self._weights=np.asarray(weights, dtype=np.int64)
+        self._is_collapsed=True
+        return len(kept_rows)
+
+    def _unpacked_rows(self, rows: npt.NDArray):
+        """Yields unpacked (0/1) matrix for chunks of supplied row indices
+        """
+        snps_count=len(self._snps)
+        for chunk_start in range(0, len(rows), self.ROWS_PER_CHUNK):
+            chunk_rows=rows[chunk_start:chunk_start+self.ROWS_PER_CHUNK]
+            yield np.unpackbits(self._packed[chunk_rows,:], axis=1, count=snps_count)
+
+    def column_counts(self, row_mask: npt.NDArray) -> npt.NDArray:
+        """Counts number of selected samples that have each SNP
+        :param row_mask: boolean array, True for rows (samples) to count
+        :type row_mask: npt.NDArray
+        :return: array with count for each SNP id
+        :rtype: npt.NDArray
+        """
+        self.pack()
+        counts=np.zeros(len(self._snps), dtype=np.int64)
+        rows=np.flatnonzero(row_mask)
+        for chunk_start, unpacked_rows in zip(range(0, len(rows), self.ROWS_PER_CHUNK), self._unpacked_rows(rows)):
+            if self._is_collapsed:
+                counts+=self._weights[rows[chunk_start:chunk_start+self.ROWS_PER_CHUNK]] @ unpacked_rows
+            else:
+                counts+=unpacked_rows.sum(axis=0, dtype=np.int64)
+        return counts
+
+    def genotype_column_counts(self) -> Tuple[List[str], npt.NDArray, npt.NDArray]:
+        """Counts SNPs for every sample genotype in a single pass over the matrix
+        :return: genotype names, number of samples of each genotype and
+                 matrix of SNP counts with one row per genotype and one column per SNP id
+        :rtype: Tuple[List[str], npt.NDArray, npt.NDArray]
+        """
+        self.pack()
+        genotype_names, sample_genotype_index=np.unique(self.genotypes.astype(str), return_inverse=True)
+        counts=np.zeros( (len(genotype_names), len(self._snps)), dtype=np.int64)
+        #rows are ordered by genotype so that every chunk can be summed by contiguous genotype blocks
+        rows=np.argsort(sample_genotype_index, kind="stable")
+        rows_genotype_index=sample_genotype_index[rows]
+        for chunk_start, unpacked_rows in zip(range(0, len(rows), self.ROWS_PER_CHUNK), self._unpacked_rows(rows)):
+            chunk_genotype_index=rows_genotype_index[chunk_start:chunk_start+self.ROWS_PER_CHUNK]
+            block_starts=np.flatnonzero( np.diff(chunk_genotype_index, prepend=-1) )
+            if self._is_collapsed:
+                unpacked_rows=unpacked_rows*self._weights[rows[chunk_start:chunk_start+self.ROWS_PER_CHUNK], None]
+            counts[chunk_genotype_index[block_starts],:]+=np.add.reduceat(unpacked_rows, block_starts, axis=0, dtype=np.int64)
+        genotype_sizes=np.bincount(sample_genotype_index, weights=self._weights, minlength=len(genotype_names)).astype(np.int64)
+        return (list(genotype_names), genotype_sizes, counts)
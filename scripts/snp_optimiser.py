@@ -1,56 +1,111 @@
-from typing import List
+from typing import List, Dict, Tuple
+import numpy as np
+import numpy.typing as npt
 from data_classes import  Genotypes, SNP, Genotype
 class SnpOptimiser:
 
+    MAX_INTERVAL_SNPS=9 #allow for some SNPs in close proximity, but limit to 9 SNPs per interval
+
     def __init__(self) -> None:
         pass
 
+    def _window_ends(self, sorted_snps: List[SNP], snp_interval: int) -> npt.NDArray:
+        """For each SNP finds index (exclusive) of the last SNP on same contig that is less than snp_interval away
+        :param sorted_snps: SNPs sorted by contig and position
+        :type sorted_snps: List[SNP]
+        :param snp_interval: Maximum length of amplicon
+        :type snp_interval: int
+        :rtype: npt.NDArray
+        """
+        positions=np.fromiter( (f.position for f in sorted_snps), dtype=np.int64, count=len(sorted_snps))
+        contigs=[f.ref_contig_id for f in sorted_snps]
+        contig_codes=np.cumsum([False]+[contigs[i]!=contigs[i-1] for i in range(1, len(contigs))], dtype=np.int64)
+        #offset every contig so that windows can't extend into next contig and single searchsorted covers all contigs
+        stride=int(positions.max())+max(snp_interval, 0)+1
+        keys=contig_codes*stride+positions
+        ends=np.searchsorted(keys, keys+snp_interval, side="left")
+        return np.maximum(ends, np.arange(len(sorted_snps))) #window always starts at its first SNP
+
+    def _snp_genotype_masks(self, sorted_snps: List[SNP], genotypes: Genotypes) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        """For each SNP identifies which genotypes it captures
+        :return: SNP x genotype matrices: genotype captured by SNP, genotype with REF allele of bifurcating SNP,
+            and for each SNP if it is shared by multiple genotypes
+        :rtype: Tuple[npt.NDArray, npt.NDArray, npt.NDArray]
+        """
+        snp_rows: Dict[SNP, int]=dict([ (snp, i) for i, snp in enumerate(sorted_snps) ])
+        has_snp=np.zeros( (len(sorted_snps), len(genotypes.genotypes)), dtype=bool)
+        has_alt=np.zeros( has_snp.shape, dtype=bool)
+        has_ref=np.zeros( has_snp.shape, dtype=bool)
+        for column, gt in enumerate(genotypes.genotypes):
+            gt_snps=gt.defining_snps
+            rows=np.fromiter( (snp_rows[snp] for snp in gt_snps), dtype=np.int64, count=len(gt_snps))
+            alleles=[gt.get_genotype_allele(snp) for snp in gt_snps]
+            has_snp[rows, column]=True
+            has_alt[rows, column]=np.fromiter( (allele==snp.alt_base for snp, allele in zip(gt_snps, alleles)), dtype=bool, count=len(gt_snps))
+            has_ref[rows, column]=np.fromiter( (allele==snp.ref_base for snp, allele in zip(gt_snps, alleles)), dtype=bool, count=len(gt_snps))
+
+        is_shared=has_snp.sum(axis=1)>1
+        #possibly genotyping scheme consists of two genotypes splitting all samples.
+        #in this case use ALT defined genotypes, first one in order of genotypes
+        first_gt=np.argmax(has_snp, axis=1)
+        first_alt_gt=np.argmax(has_alt, axis=1)
+        first_ref_gt=np.argmax(has_ref, axis=1)
+        rows=np.arange(len(sorted_snps))
+        captured=np.zeros(has_snp.shape, dtype=bool)
+        captured[rows, np.where(is_shared, first_alt_gt, first_gt)]=True
+        bifurcating=np.zeros(has_snp.shape, dtype=bool)
+        bifurcating[rows[is_shared], first_ref_gt[is_shared]]=True
+        #shared SNP without ALT or REF genotype can't be attributed to a genotype
+        unresolved=is_shared & ( ~has_alt.any(axis=1) | ~has_ref.any(axis=1) )
+        return captured, bifurcating, unresolved
+
     def optimise(self, snp_interval: int, genotypes: Genotypes, rare_gts: List[str]) -> List[object]:
         """Select SNPs based on how many fall within a maximum permitted amplicon range
 
-        :param snp_interval: Maximum length of amplicon 
+        :param snp_interval: Maximum length of amplicon
         :type snp_interval: int
 
         :param genotypes: genotypes with already identified genotypes defining SNPs
         :type genotypes: Genotypes
-        """        
+        """
         interval_snps=[]
         sorted_snps: List[SNP]=genotypes.all_snps_coord_sorted()
-        i=0
-        max_reached_index=0
-        while i<len(sorted_snps):
-            j=i #this means the first snp is automatically added
-            while j<len(sorted_snps) and sorted_snps[j].ref_contig_id==sorted_snps[i].ref_contig_id and \
-                  sorted_snps[j].position-sorted_snps[i].position<snp_interval:
-                j+=1
-            if j>max_reached_index: #this account for some intervals containing >2 snps. Without this, these intervals would create multiple entries in interval_snps
-                interval_snps.append( {"snps": sorted_snps[i:j], "genotypes":[] } ) # j, not j-1 because python excludes the last element of index
-                max_reached_index=j-1
-            i+=1
-        # check which GTs are captured by which lists of SNPs
-        # Remove those that capture same GT multiple times - this is likely due to structural variant
         bifurcating_gts=set() #these are GTs that divide dataset into two parts, both of which are targets
-        #this means same SNP will capture both of these genotypes. This makes every such SNP 
-        #a multi GT SNP, which is not how it is supposed to be. 
-        for interval in interval_snps:
-            if len(interval["snps"])>9: #allow for some SNPs in close proximity, but limit to 9 SNPs per interval
-                continue
-            interval["genotypes"]=set()
-            for snp in interval["snps"]:
-                gts_with_snp: List[Genotype]=genotypes.genotypes_with_snp(snp)
-                if len(gts_with_snp)>1:
-                    #possibly genotyping scheme consists of two genotypes splitting all samples.
-                    #in this case use ALT defined genotypes
-                    gt_with_alt=[f for f in gts_with_snp if f.get_genotype_allele(snp)==snp.alt_base][0]
-                    interval["genotypes"].add(gt_with_alt.name)
-                    gt_with_ref=[f for f in gts_with_snp if f.get_genotype_allele(snp)==snp.ref_base][0]
-                    bifurcating_gts.add(gt_with_ref.name)
-                else:
-                    interval["genotypes"].add(gts_with_snp[0].name)
-                
-                    
+        #this means same SNP will capture both of these genotypes. This makes every such SNP
+        #a multi GT SNP, which is not how it is supposed to be.
+        if len(sorted_snps)>0:
+            ends=self._window_ends(sorted_snps, snp_interval)
+            starts=np.arange(len(sorted_snps))
+            #window ends never decrease, so every window after the first non-empty one reaches further than the previous one
+            #and each SNP starts one interval
+            is_kept=np.cumsum(ends>0)>0
+            starts, ends = starts[is_kept], ends[is_kept]
+            # check which GTs are captured by which lists of SNPs
+            # Remove those that capture same GT multiple times - this is likely due to structural variant
+            captured, bifurcating, unresolved = self._snp_genotype_masks(sorted_snps, genotypes)
+            is_short=(ends-starts)<=self.MAX_INTERVAL_SNPS
+            #SNPs that fall into at least one of the short intervals
+            coverage=np.zeros(len(sorted_snps)+1, dtype=np.int64)
+            np.add.at(coverage, starts[is_short], 1)
+            np.add.at(coverage, ends[is_short], -1)
+            in_short_interval=np.cumsum(coverage[:-1])>0
+            if (unresolved & in_short_interval).any():
+                snp=sorted_snps[np.flatnonzero(unresolved & in_short_interval)[0]]
+                raise ValueError(f'SNP {snp.coordinate} is shared by multiple genotypes, but not as REF and ALT alleles')
+            gt_names=np.asarray([f.name for f in genotypes.genotypes])
+            bifurcating_gts.update(gt_names[bifurcating[in_short_interval].any(axis=0)].tolist())
+
+            #genotypes of each interval are bitwise OR of genotypes of its SNPs. Interleaving starts and ends
+            #makes reduceat reduce every [start, end) slice at even indices; extra zero row allows end==len(sorted_snps)
+            packed=np.packbits(np.vstack([captured, np.zeros( (1, captured.shape[1]), dtype=bool)]), axis=1)
+            slice_bounds=np.column_stack([starts, np.maximum(ends, starts+1)]).ravel()
+            interval_gts=np.unpackbits(np.bitwise_or.reduceat(packed, slice_bounds, axis=0)[::2], axis=1, count=captured.shape[1]).astype(bool)
+            interval_gts[~is_short | (ends==starts)]=False
+            is_rare=np.isin(gt_names, rare_gts)
+            is_multi_gt=(interval_gts.sum(axis=1)>1) | (interval_gts & is_rare).any(axis=1)
+            for i in np.flatnonzero(is_multi_gt):
+                interval_snps.append( {"snps": sorted_snps[starts[i]:ends[i]], "genotypes": set(gt_names[interval_gts[i]].tolist()) } )
 
-        interval_snps=[snp_interval for snp_interval in interval_snps if len(snp_interval["genotypes"])>1 or len(set(snp_interval["genotypes"]) & set(rare_gts))>0 ]
         captured_genotypes=set([f for genotypes in interval_snps for f in genotypes["genotypes"]])
         for gt in bifurcating_gts: #the reference GT will not captured through about algorithms, so has to added manually.
             captured_genotypes.add(gt)
@@ -66,3 +121,63 @@ class SnpOptimiser:
             print(f'All of them have defining SNPs')
         return interval_snps
 
+    def _interval_bounds(self, intervals: List[object]) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        """Contig code, first and last SNP position of each interval
+        :rtype: Tuple[npt.NDArray, npt.NDArray, npt.NDArray]
+        """
+        contigs=[f["snps"][0].ref_contig_id for f in intervals]
+        contig_codes=np.unique(contigs, return_inverse=True)[1]
+        starts=np.asarray([min([snp.position for snp in f["snps"]]) for f in intervals])
+        ends=np.asarray([max([snp.position for snp in f["snps"]]) for f in intervals])
+        return contig_codes, starts, ends
+
+    def select_intervals(self, interval_snps: List[object], redundancy: int=1, snp_weight: float=1.0) -> List[object]:
+        """Selects small subset of intervals produced by optimise() so that every genotype captured by intervals
+        is captured by at least "redundancy" selected intervals (or all intervals that capture it, if there are fewer).
+        Uses greedy weighted set cover: on each step the interval that captures most genotypes that still need
+        intervals is selected. Interval score is multiplied by (1 + snp_weight * SNPs per genotype of the interval),
+        so among intervals capturing the same genotypes the ones with more SNPs are preferred.
+        Intervals overlapping already selected intervals are only used if genotypes can't be captured otherwise.
+
+        :param interval_snps: intervals from optimise()
+        :type interval_snps: List[object]
+        :param redundancy: Number of different intervals that should capture each genotype, default 1
+        :type redundancy: int
+        :param snp_weight: How strongly intervals with more SNPs per genotype are favoured, 0 ignores number of SNPs, default 1.0
+        :type snp_weight: float
+        :return: Selected intervals in the original order
+        :rtype: List[object]
+        """
+        if redundancy<1:
+            raise ValueError(f'Genotype redundancy must be at least 1, but is {redundancy}')
+        if snp_weight<0:
+            raise ValueError(f'SNP weight can not be negative, but is {snp_weight}')
+        if len(interval_snps)==0:
+            return []
+        gt_names=sorted(set([f for interval in interval_snps for f in interval["genotypes"]]))
+        gt_columns=dict([ (name, i) for i, name in enumerate(gt_names) ])
+        captures=np.zeros( (len(interval_snps), len(gt_names)), dtype=bool)
+        for row, interval in enumerate(interval_snps):
+            captures[row, [gt_columns[f] for f in interval["genotypes"]]]=True
+        snps_per_gt=np.asarray([len(f["snps"]) for f in interval_snps])/np.maximum(captures.sum(axis=1), 1)
+        weights=1+snp_weight*snps_per_gt
+        #overlaps are calculated only for selected intervals, matrix of all pairs would be too large for big cohorts
+        contig_codes, starts, ends = self._interval_bounds(interval_snps)
+
+        remaining_demand=np.minimum(captures.sum(axis=0), redundancy)
+        is_selected=np.zeros(len(interval_snps), dtype=bool)
+        is_blocked=np.zeros(len(interval_snps), dtype=bool)
+        for allow_overlaps in [False, True]:
+            while remaining_demand.any():
+                gains=(captures & (remaining_demand>0)).sum(axis=1)*weights
+                gains[is_selected]=0
+                if not allow_overlaps:
+                    gains[is_blocked]=0
+                best=int(np.argmax(gains)) #ties are resolved in favour of the first interval
+                if gains[best]==0:
+                    break
+                is_selected[best]=True
+                is_blocked|=(contig_codes==contig_codes[best]) & (starts<=ends[best]) & (ends>=starts[best])
+                remaining_demand[captures[best]]=np.maximum(remaining_demand[captures[best]]-1, 0)
+        print(f'Selected {is_selected.sum()} of {len(interval_snps)} intervals capturing {len(gt_names)} genotypes')
+        return [interval for interval, selected in zip(interval_snps, is_selected) if selected]
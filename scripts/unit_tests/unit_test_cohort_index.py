@@ -0,0 +1,61 @@
+from os.path import expanduser, realpath, dirname
+from os import utime
+import unittest
+import tempfile
+import shutil
+from sys import path
+unit_test_dir = dirname(realpath(__file__))
+path.append( f'{unit_test_dir}/..')
+print(unit_test_dir)
+from data_classes import InputConfiguration
+from load_vcfs import VCFutilities
+from cohort_index import CohortIndex
+
+class TestCohortIndex(unittest.TestCase):
+    valid_data=expanduser("~/HandyAmpliconTool/unit_test_data/valid_data/")
+    config_file=expanduser("~/HandyAmpliconTool/unit_test_data/unittest.json")
+    valid_vcf=f'{valid_data}/vcfs/8490_5#12.vcf'
+    repeats_bed=f'{valid_data}/ref_repeats.bed'
+
+    def setUp(self) -> None:
+        self.config_data = InputConfiguration(self.config_file)
+        self.temp_dir=tempfile.mkdtemp()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+        return super().tearDown()
+
+    def test_changed_files(self):
+        index_file=f'{self.temp_dir}/cohort_index.pkl'
+        first_vcf=shutil.copy(self.valid_vcf, f'{self.temp_dir}/first.vcf')
+        second_vcf=shutil.copy(self.valid_vcf, f'{self.temp_dir}/second.vcf')
+        cohort_index=CohortIndex(index_file)
+        self.assertEqual(cohort_index.changed_files([first_vcf, second_vcf]), [first_vcf, second_vcf])
+        snp_records=VCFutilities().vcf_to_snp_records(first_vcf)
+        cohort_index.add(first_vcf, snp_records)
+        cohort_index.add(second_vcf, snp_records)
+        cohort_index.save()
+
+        cohort_index=CohortIndex(index_file)
+        self.assertEqual(len(cohort_index), 2)
+        self.assertEqual(cohort_index.records(first_vcf), snp_records)
+        #touched file has the same content and is not reloaded, file with new content is
+        utime(first_vcf, (0,0))
+        with open(second_vcf, "a") as vcf_file:
+            vcf_file.write("\n")
+        self.assertEqual(cohort_index.changed_files([first_vcf, second_vcf]), [second_vcf])
+        self.assertEqual(cohort_index.changed_files([first_vcf]), [])
+        self.assertFalse(second_vcf in cohort_index)
+
+    def test_repeats_change(self):
+        index_file=f'{self.temp_dir}/cohort_index.pkl'
+        cohort_index=CohortIndex(index_file)
+        cohort_index.add(self.valid_vcf, [])
+        cohort_index.save()
+        self.assertEqual(len(CohortIndex(index_file)), 1)
+        self.assertEqual(len(CohortIndex(index_file, self.repeats_bed)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
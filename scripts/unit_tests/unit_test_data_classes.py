@@ -5,7 +5,8 @@ path.append( f'{unit_test_dir}/..')
 print(unit_test_dir)
 
 import unittest
-from data_classes import InputConfiguration, FlankingAmplicon, Amplicon, BlastResult
+import pickle
+from data_classes import InputConfiguration, FlankingAmplicon, Amplicon, BlastResult, BlastHits, SNP, Genotype, Genotypes
 
 class TestDataClasses(unittest.TestCase):
     valid_data=expanduser("~/HandyAmpliconTool/unit_test_data/valid_data/")
@@ -26,6 +27,86 @@ class TestDataClasses(unittest.TestCase):
                           bed_line="NoneSuch\t100\t1000\tTest Amplicon\n",
                           ref_fasta_file=self.config_data.reference_fasta)
         
+    def test_snp_identity(self) -> None:
+        snp=SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)
+        same_snp=SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)
+        self.assertEqual(snp.id, same_snp.id)
+        self.assertEqual(hash(snp), hash(same_snp))
+        self.assertEqual(snp, same_snp)
+        same_snp.alt_base="G"
+        self.assertNotEqual(snp, same_snp)
+        self.assertNotEqual(snp.id, same_snp.id)
+        self.assertEqual(SNP.registry.key(same_snp.id), ("contig", 10, "G"))
+        incomplete_snp=SNP(ref_contig_id="contig", position=10)
+        self.assertEqual(incomplete_snp.id, -1)
+        incomplete_snp.alt_base="T"
+        self.assertEqual(incomplete_snp, snp)
+
+    def test_snp_copy(self) -> None:
+        snp=SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)
+        snp.sensitivity=0.5
+        snp_copy=snp.copy()
+        self.assertEqual(snp, snp_copy)
+        snp_copy.sensitivity=1
+        self.assertEqual(snp.sensitivity, 0.5)
+        unpickled_snp=pickle.loads(pickle.dumps(snp))
+        self.assertEqual(unpickled_snp, snp)
+        self.assertEqual(hash(unpickled_snp), hash(snp))
+        self.assertEqual(unpickled_snp.sensitivity, 0.5)
+
+    def test_genotypes_index(self) -> None:
+        first_snp=SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)
+        second_snp=SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=20)
+        first_genotype=Genotype("4.1")
+        second_genotype=Genotype("4.2")
+        first_genotype.add_genotype_allele(first_snp, "T", 10)
+        genotypes=Genotypes()
+        genotypes.add_genotype(first_genotype)
+        genotypes.add_genotype(second_genotype)
+        self.assertEqual(genotypes.get_genotype("4.2"), second_genotype)
+        self.assertIsNone(genotypes.get_genotype("4.3"))
+        self.assertEqual(genotypes.genotypes_with_snp(first_snp), [first_genotype])
+        #SNPs added after the genotype was added to Genotypes are also indexed, in the order of genotypes
+        second_genotype.add_genotype_allele(first_snp, "A", 10)
+        second_genotype.add_genotype_allele(second_snp, "T", 10)
+        first_genotype.add_genotype_allele(second_snp, "T", 10)
+        self.assertEqual(genotypes.genotypes_with_snp(first_snp), [first_genotype, second_genotype])
+        self.assertEqual(genotypes.genotypes_with_snp(second_snp), [first_genotype, second_genotype])
+        unpickled_genotypes=pickle.loads(pickle.dumps(genotypes))
+        self.assertEqual([f.name for f in unpickled_genotypes.genotypes_with_snp(second_snp)], ["4.1", "4.2"])
+
+    def test_blast_hits(self) -> None:
+        first_result=BlastResult.from_blast_line("3.1.1_1_669587_R\t2\t20\tamplicon\t1663171\t1663189\t89.474\t0.16\tTCTGGTACAAAGCGGCGAA")
+        second_result=BlastResult.from_blast_line("contig_2\t5\t9\tamplicon\t30\t26\t100.0\t1e-5\tAC-GT")
+        first_hits=BlastHits("amplicon")
+        second_hits=BlastHits("amplicon")
+        for hits, result, query_file in [(first_hits, first_result, "first.fna"), (second_hits, second_result, "second.fna")]:
+            hits.append(result.qseqid, result.qstart, result.qend, result.sstart, result.send, result.pident, result.evalue, result.qseq.encode(), query_file)
+        first_hits.extend(second_hits)
+        self.assertEqual(len(first_hits), 2)
+        self.assertTrue(first_hits[0].coordinates_match(first_result))
+        self.assertTrue(first_hits[-1].coordinates_match(second_result))
+        self.assertEqual([f.qseqid for f in first_hits], ["3.1.1_1_669587_R", "contig_2"])
+        self.assertEqual([f.query_file_name for f in first_hits], ["first.fna", "second.fna"])
+        self.assertEqual(list(first_hits.coordinates["send"]), [1663189, 26])
+        self.assertRaises(IndexError, first_hits.__getitem__, 2)
+
+    def test_genotypes_to_snp_matrix(self) -> None:
+        first_snp=SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=20, passes_filters=True)
+        second_snp=SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10, passes_filters=True)
+        first_genotype=Genotype("4.1")
+        second_genotype=Genotype("4.2")
+        first_genotype.add_genotype_allele(first_snp, "T", 10)
+        first_genotype.add_genotype_allele(second_snp, "T", 10)
+        second_genotype.add_genotype_allele(second_snp.copy(), "A", 10)
+        genotypes=Genotypes(genotypes=[first_genotype, second_genotype])
+        snp_matrix=genotypes.genotypes_to_snp_matrix()
+        self.assertEqual(list(snp_matrix.columns), ["Contig", "Position", "4.1", "4.2"])
+        self.assertEqual(list(snp_matrix["Position"]), [10, 20])
+        self.assertEqual(list(snp_matrix["4.1"]), [True, True])
+        self.assertEqual(list(snp_matrix["4.2"]), [True, False])
+        self.assertRaises(ValueError, Genotypes().genotypes_to_snp_matrix)
+
     def test_blastresult(self) -> None:
         result=BlastResult.from_blast_line("3.1.1_1_669587_R\t2\t20\tNC_003198.1\t1663171\t1663189\t89.474\t0.16\tTCTGGTACAAAGCGGCGAA\n")
         self.assertEqual(result.value, "3.1.1_1_669587_R 2 20 NC_003198.1 1663171 1663189")
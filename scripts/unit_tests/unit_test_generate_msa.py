@@ -1,12 +1,12 @@
 from os.path import expanduser, realpath, dirname
-from typing import List
+from typing import List, Dict
 import unittest
 from sys import path
 unit_test_dir = dirname(realpath(__file__))
 path.append( f'{unit_test_dir}/..')
 print(unit_test_dir)
-from data_classes import InputConfiguration, Amplicon, BlastResult
-from generate_msa import MsaGenerator
+from data_classes import InputConfiguration, Amplicon, BlastResult, BlastHits
+from generate_msa import MsaGenerator, MsaResult, ThreadBudget
 
 class TestMsaGenenerator(unittest.TestCase):
     valid_data=expanduser("~/HandyAmpliconTool/unit_test_data/valid_data/")
@@ -39,20 +39,23 @@ class TestMsaGenenerator(unittest.TestCase):
 
     def test_run_blast(self):
         generator=MsaGenerator(self.config_data.temp_blast_db)
-        results: List[BlastResult]=generator._run_blast([self.dummy_amplicon],[self.ref_fasta,self.long_fasta])
+        amplicon=self.dummy_amplicon
+        results: Dict[str, BlastHits]=generator._run_blast([amplicon],[self.ref_fasta,self.long_fasta])
         expected_results=self.dummy_blast_results
         #has to be done in two steps because the Pool running results doesn't return them in specific order
-        self.assertTrue(len(results)==1)
-        self.assertTrue( results[0].coordinates_match(expected_results[0])  )
+        self.assertTrue(len(results[amplicon.id])==1)
+        self.assertTrue( results[amplicon.id][0].coordinates_match(expected_results[0])  )
 
 
     def test_process_blast_results(self):
         generator=MsaGenerator(self.config_data.temp_blast_db)
         amplicon=self.dummy_amplicon
         expected_results=self.dummy_blast_results
+        amplicon_hits=BlastHits(amplicon.id)
         for result in expected_results:
-            result.sseqid=amplicon._uuid
-        valid_amplicon_hits=generator._process_blast_results(expected_results, [amplicon])
+            amplicon_hits.append(result.qseqid, result.qstart, result.qend, result.sstart, result.send, result.pident, result.evalue, result.qseq, "")
+        valid_amplicon_hits=generator._process_blast_results({amplicon.id: amplicon_hits}, [amplicon, Amplicon("No hits", self.acr_seq)])
+        self.assertEqual([len(f) for f in valid_amplicon_hits.values()], [1, 0])
         for key, values in valid_amplicon_hits.items():
             for value in values:
                 self.assertTrue(value.coordinates_match(expected_results[0]) or value.coordinates_match(expected_results[1]))
@@ -67,7 +70,8 @@ class TestMsaGenenerator(unittest.TestCase):
         generator=MsaGenerator(self.config_data.temp_blast_db)
         dummy_results=self.dummy_blast_results
         dummy_amplicon=self.dummy_amplicon
-        result=generator._align_results_helper([dummy_results, dummy_amplicon._uuid, dummy_amplicon.seq])
+        row_members, row_sequences, row_anchors = generator._alignment_rows(dummy_results, dummy_amplicon._uuid, dummy_amplicon.seq, False)
+        result=generator._align_results_helper([dummy_amplicon._uuid, row_members, row_sequences, row_anchors, 1])
         self.assertTrue(dummy_amplicon._uuid in result.keys())
         self.assertTrue(str.lower(dummy_amplicon.seq) == result[dummy_amplicon._uuid])
         for blast_result in dummy_results:
@@ -80,6 +84,57 @@ class TestMsaGenenerator(unittest.TestCase):
         amplicon=self.dummy_amplicon
         result=generator._msa_to_dataframe({amplicon._uuid: amplicon.seq})
         self.assertEqual( "".join([f for f in result.iloc[0]]) , amplicon.seq)
+    def test_msa_result(self):
+        msa=MsaResult("amplicon", ["amplicon", "hit_1", "hit_2"], ["ac-gt", "ACTGX", "-CTG-"])
+        self.assertEqual(msa.matrix.dtype.name, "uint8")
+        self.assertEqual(msa.row_to_seq(0), "AC-GT") #lower case is same as upper case
+        self.assertEqual(msa.row_to_seq(1), "ACTGN") #unknown characters are N
+        self.assertEqual(msa.nucleotides_at_col(2), ["-", "T", "T"])
+        self.assertEqual(msa.base_counts[2].tolist(), [1, 0, 0, 0, 2, 0])
+        self.assertEqual(msa.base_counts.sum(axis=1).tolist(), [3]*5)
+        self.assertEqual(msa.coordinate_map(0).tolist(), [0, 1, -1, 2, 3])
+        self.assertEqual(msa.coordinate_map(2).tolist(), [-1, 0, 1, 2, -1])
+        self.assertRaises(ValueError, MsaResult, "amplicon", ["amplicon", "hit_1"], ["ACGT", "ACG"])
+        #rows representing several identical sequences are weighted in base counts
+        msa=MsaResult("amplicon", ["amplicon", "hit_1"], ["ACGT", "AC-T"], [["amplicon"], ["hit_1", "hit_2", "hit_3"]])
+        self.assertEqual(msa.weights.tolist(), [1, 3])
+        self.assertEqual(msa.row_members(1), ["hit_1", "hit_2", "hit_3"])
+        self.assertEqual(msa.base_counts[2].tolist(), [3, 0, 0, 1, 0, 0])
+        self.assertRaises(ValueError, MsaResult, "amplicon", ["amplicon", "hit_1"], ["ACGT", "AC-T"], [["amplicon"]])
+    def test_anchored_alignment(self):
+        generator=MsaGenerator(self.config_data.temp_blast_db)
+        amplicon_seq="GAAATAGCCTGCTGATAGAGACTTTCATTCTCGGTTCCAGAGCGTTGTTGCAGTGCAGGATAAATAAAGGAGTAAAG"
+        substitution=amplicon_seq[0:30]+"A"+amplicon_seq[31:]
+        deletion=amplicon_seq[0:40]+amplicon_seq[43:]
+        insertion=amplicon_seq[0:50]+"TTTTTT"+amplicon_seq[50:]
+        partial=amplicon_seq[10:70]
+        aligned=generator._anchored_alignment([amplicon_seq, substitution, deletion, insertion, partial],
+                                              [ (0, len(amplicon_seq)) ]*4+[ (10, 70) ])
+        self.assertEqual(aligned[0], amplicon_seq)
+        self.assertEqual(aligned[1], substitution)
+        self.assertEqual(aligned[2], amplicon_seq[0:40]+"---"+amplicon_seq[43:])
+        self.assertEqual(aligned[3], amplicon_seq) #inserted bases are dropped
+        self.assertEqual(aligned[4], "-"*10+partial+"-"*(len(amplicon_seq)-70))
+    def test_plan_mafft_jobs(self):
+        generator=MsaGenerator(self.config_data.temp_blast_db)
+        cpu_threads=InputConfiguration.cpu_threads
+        InputConfiguration.cpu_threads=8
+        try:
+            aligner_inputs=[ [f'amplicon_{n}', [ [f'hit_{i}'] for i in range(n) ], ["ACGT"]*n, [ (0, 4) ]*n, 1] for n in [2, 300, 6] ]
+            generator._plan_mafft_jobs(aligner_inputs)
+        finally:
+            InputConfiguration.cpu_threads=cpu_threads
+        self.assertEqual([f[0] for f in aligner_inputs], ["amplicon_300", "amplicon_6", "amplicon_2"]) #largest first
+        self.assertEqual([f[4] for f in aligner_inputs], [8, 1, 1]) #planned threads, ThreadBudget limits threads of jobs running together
+        self.assertEqual(generator._mafft_strategy(10)[0], "FFT-NS-1")
+        self.assertEqual(generator._mafft_strategy(generator.MAX_PROGRESSIVE_SEQUENCES+1)[0], "PartTree")
+        self.assertEqual(generator._mafft_strategy(generator.MAX_PARTTREE_SEQUENCES+1)[0], "add-fragments")
+    def test_thread_budget(self):
+        thread_budget=ThreadBudget(threads=8, jobs=10)
+        running=[thread_budget.acquire(1), thread_budget.acquire(1), thread_budget.acquire(8)]
+        self.assertEqual(running, [1, 1, 6]) #jobs running together don't use more than 8 threads
+        thread_budget=ThreadBudget(threads=8, jobs=2)
+        self.assertEqual([thread_budget.acquire(1), thread_budget.acquire(1)], [4, 4]) #last jobs share leftover threads
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
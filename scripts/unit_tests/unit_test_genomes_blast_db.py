@@ -0,0 +1,82 @@
+from os.path import expanduser, realpath, dirname
+from os import utime
+import unittest
+import tempfile
+import shutil
+from sys import path
+unit_test_dir = dirname(realpath(__file__))
+path.append( f'{unit_test_dir}/..')
+print(unit_test_dir)
+from data_classes import InputConfiguration
+from genomes_blast_db import GenomesBlastDb
+
+class TestGenomesBlastDb(unittest.TestCase):
+    valid_data=expanduser("~/HandyAmpliconTool/unit_test_data/valid_data/")
+    config_file=expanduser("~/HandyAmpliconTool/unit_test_data/unittest.json")
+
+    def setUp(self) -> None:
+        self.config_data = InputConfiguration(self.config_file)
+        self.temp_dir=tempfile.mkdtemp()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+        return super().tearDown()
+
+    def test_catalog_fingerprint(self):
+        genome_files=[f'{self.temp_dir}/second.fna', f'{self.temp_dir}/first.fna']
+        for genome_file in genome_files:
+            with open(genome_file, "w") as genome:
+                genome.write(">contig\nACGT\n")
+        genomes_db=GenomesBlastDb(self.temp_dir, genome_files)
+        self.assertEqual(genomes_db.genome_files, sorted(genome_files))
+        fingerprint=genomes_db.catalog_fingerprint()
+        self.assertEqual(GenomesBlastDb(self.temp_dir, genome_files[::-1]).catalog_fingerprint(), fingerprint)
+        utime(genome_files[0], (0,0))
+        self.assertNotEqual(genomes_db.catalog_fingerprint(), fingerprint)
+        self.assertNotEqual(GenomesBlastDb(self.temp_dir, genome_files[1:]).catalog_fingerprint(), fingerprint)
+
+    def test_add_hit(self):
+        genomes_db=GenomesBlastDb(self.temp_dir, ["first.fna", "second.fna"])
+        genomes_db._contig_ids=[["chr"], ["chr", "plasmid"]]
+        genomes_db._contig_lengths=[[1000], [1000, 100]]
+        genomes_db._amplicons_length=100
+        self.assertEqual(genomes_db.genome_contig(GenomesBlastDb.db_contig_id(1, 1)), ("second.fna", "plasmid"))
+        amplicon_hits={}
+        genomes_db._add_hit(amplicon_hits, [b"amplicon", b"1", b"4", b"ng0_0", b"101", b"104", b"100.0", b"1e-5", b"ACGG"])
+        #genome on reverse strand is reported like hit of genome query against reverse complemented amplicon
+        genomes_db._add_hit(amplicon_hits, [b"amplicon", b"1", b"4", b"lcl|ng1_1", b"104", b"101", b"100.0", b"1e-5", b"AC-GG"])
+        forward_hit, reverse_hit = list(amplicon_hits["amplicon"])
+        self.assertEqual( (forward_hit.qseqid, forward_hit.qstart, forward_hit.qend, forward_hit.sseqid, forward_hit.sstart, forward_hit.send, forward_hit.qseq),
+                          ("chr", 101, 104, "amplicon", 1, 4, "ACGG") )
+        self.assertEqual(forward_hit.query_file_name, "first.fna")
+        self.assertEqual( (reverse_hit.qseqid, reverse_hit.qstart, reverse_hit.qend, reverse_hit.sstart, reverse_hit.send, reverse_hit.qseq),
+                          ("plasmid", 101, 104, 4, 1, "CC-GT") )
+        self.assertEqual(reverse_hit.query_file_name, "second.fna")
+    def test_genome_evalue(self):
+        genomes_db=GenomesBlastDb(self.temp_dir, ["first.fna"])
+        genomes_db._contig_ids=[["chr", "plasmid"]]
+        genomes_db._contig_lengths=[[5000, 1000]]
+        genomes_db._amplicons_length=200
+        self.assertEqual(genomes_db.search_space, 1000*200)
+        #blastn e-value is proportional to search space, in per genome search it is contig length times length of amplicons
+        hit_evalue=lambda db, contig_length: 1e-9*db.search_space/(contig_length*db._amplicons_length)
+        evalue=genomes_db.genome_evalue("ng0_0", hit_evalue(genomes_db, 5000))
+        self.assertAlmostEqual(evalue, 1e-9)
+        #unrelated genome with shorter contig changes search space passed to blastn, but not the e-value of the hit
+        bigger_db=GenomesBlastDb(self.temp_dir, ["first.fna", "second.fna"])
+        bigger_db._contig_ids=[["chr", "plasmid"], ["chr"]]
+        bigger_db._contig_lengths=[[5000, 1000], [300]]
+        bigger_db._amplicons_length=200
+        self.assertEqual(bigger_db.search_space, 300*200)
+        self.assertAlmostEqual(bigger_db.genome_evalue("ng0_0", hit_evalue(bigger_db, 5000)), evalue)
+        #hits that are above e-value cut-off after rescaling are dropped
+        bigger_db.e_value=0.05
+        amplicon_hits={}
+        bigger_db._add_hit(amplicon_hits, [b"amplicon", b"1", b"4", b"ng0_0", b"101", b"104", b"100.0", b"0.01", b"ACGG"])
+        bigger_db._add_hit(amplicon_hits, [b"amplicon", b"1", b"4", b"ng1_0", b"101", b"104", b"100.0", b"0.01", b"ACGG"])
+        self.assertEqual([f.qseqid for f in amplicon_hits["amplicon"]], ["chr"])
+        self.assertEqual(list(amplicon_hits["amplicon"])[0].query_file_name, "second.fna")
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
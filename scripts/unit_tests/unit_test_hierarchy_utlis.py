@@ -7,10 +7,11 @@ import pickle
 unit_test_dir = dirname(realpath(__file__))
 path.append( f'{unit_test_dir}/..')
 print(unit_test_dir)
-from data_classes import InputConfiguration, Genotypes, Sample, SNP
+from data_classes import InputConfiguration, Genotypes, Genotype, Sample, SNP
 from hierarchy_utils import HierarchyUtilities
 import metadata_utils as metadata_utils
 from load_vcfs import VCFutilities
+from snp_matrix import SnpPresenceMatrix
 
 class TestHierarchyUtils(unittest.TestCase):
     valid_data=expanduser("~/HandyAmpliconTool/unit_test_data/valid_data/")
@@ -70,5 +71,22 @@ class TestHierarchyUtils(unittest.TestCase):
             expected_snp_counts.pop(genotype.name)
         self.assertTrue(len(expected_snp_counts)==0)
 
+    def test_genotype_snp_counts(self):
+        hierarchy=HierarchyUtilities()
+        hierarchy_genotypes=[Genotype("4"), Genotype("4.1"), Genotype("4.1.1")]
+        hierarchy_genotypes[0].subgenotypes.extend(["4.1", "4.1.1", "4.2"])
+        hierarchy_genotypes[1].subgenotypes.extend(["4.1.1"])
+        snp_matrix=SnpPresenceMatrix()
+        snp_records={"4":[("contig", 10, "A", "T")], "4.1":[("contig", 20, "A", "T")], "4.1.1":[("contig", 30, "A", "T")],
+                     "4.2":[("contig", 10, "A", "T"), ("contig", 20, "A", "T")], "2.3.1":[("contig", 40, "A", "T")]}
+        for genotype, records in snp_records.items():
+            sample=Sample(genotype, f'{genotype}.vcf')
+            sample.genotype=genotype
+            snp_matrix.add_sample(sample, records)
+        snp_matrix.pack()
+        snps_counts, samples_counts=hierarchy._genotype_snp_counts(snp_matrix, hierarchy_genotypes)
+        self.assertEqual(snps_counts.tolist(), [[2,2,1,0], [0,1,1,0], [0,0,1,0], [2,2,1,1]])
+        self.assertEqual(samples_counts.tolist(), [4,2,1,5])
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -6,9 +6,11 @@ path.append( f'{unit_test_dir}/..')
 print(unit_test_dir)
 
 import unittest
+from unittest.mock import patch
 from identify_species_snps import IdentifySpeciesSnps
+from generate_msa import MsaResult, MsaGenerator
 import name_converters
-from data_classes import InputConfiguration, Genotype, Genotypes
+from data_classes import InputConfiguration, Genotype, Genotypes, Amplicon, ReferenceSequence
 from snp_optimiser import SnpOptimiser
 import pandas as pd
 from os import listdir
@@ -87,9 +89,46 @@ class TestIdentifySpeciesSnps(unittest.TestCase):
         dummy_df:pd.DataFrame=pd.DataFrame( data = {'col1': [1, 2], 'col2': [3, 4]} )
         self.assertTrue(  snp_identifier.msa_df_to_msa_file( dummy_df , "test") )
 
-    def test_map_msa_to_ref_coordinates(self):
-        #Already tested via test_get_bifurcating_snps
-        pass
+    def test_get_bifurcating_snps_overlapping_amplicons(self):
+        #SNP at position 110 is in both amplicons, its depth comes from the shorter amplicon, which is processed
+        #after the longer one, regardless of which MSA is aligned first
+        max_matching_negative_genomes=InputConfiguration.max_matching_negative_genomes
+        InputConfiguration.max_matching_negative_genomes=1
+        try:
+            long_amplicon=Amplicon("long", "AAAAAAAAAAGAAAAA")
+            long_amplicon.ref_seq=ReferenceSequence("contig_1", 100, 116, long_amplicon.seq)
+            short_amplicon=Amplicon("short", "AGAAAAAAA")
+            short_amplicon.ref_seq=ReferenceSequence("contig_1", 109, 118, short_amplicon.seq)
+            long_msa=MsaResult(long_amplicon.id, [long_amplicon.id, "hit_1"], [long_amplicon.seq, "AAAAAAAAAACAAAAA"])
+            short_msa=MsaResult(short_amplicon.id, [short_amplicon.id, "hit_1", "hit_2", "hit_3"], [short_amplicon.seq]+["ACAAAAAAA"]*3)
+            for msas in [ [long_msa, short_msa], [short_msa, long_msa] ]:
+                species_genotype=Genotype(InputConfiguration.SPECIES_NAME)
+                species_genotype.amplicons=[short_amplicon, long_amplicon]
+                with patch.object(MsaGenerator, "iter_msa", return_value=iter(msas)):
+                    species_genotype=self.snp_identifier.get_bifurcating_snps(species_genotype)
+                self.assertEqual(len(species_genotype.defining_snps), 1)
+                snp=species_genotype.defining_snps[0]
+                self.assertEqual( (snp.position, snp.ref_base, snp.alt_base), (110, "G", "C") )
+                self.assertEqual(species_genotype._allele_depths[snp], 3)
+        finally:
+            InputConfiguration.max_matching_negative_genomes=max_matching_negative_genomes
+
+    def test_species_snp_alleles(self):
+        max_matching_negative_genomes=InputConfiguration.max_matching_negative_genomes
+        InputConfiguration.max_matching_negative_genomes=1
+        try:
+            msa=MsaResult("amplicon", ["amplicon", "hit_1", "hit_2", "hit_3"], ["ACGTAG",
+                                                                              "ACCC-G",
+                                                                              "ACA--T",
+                                                                              "ACC--T"])
+            alleles=self.snp_identifier._species_snp_alleles(msa, 0)
+            #column 2: alternative bases in order of first appearance, column 3: gap is not output when other bases are present
+            #column 4: only gaps, so gap is output. Column 5: amplicon base is in 2 sequences, which is above the limit
+            self.assertEqual(alleles, [(2, 2, 2), (2, 1, 1), (3, 2, 1), (4, 0, 3)])
+            InputConfiguration.max_matching_negative_genomes=2
+            self.assertEqual(self.snp_identifier._species_snp_alleles(msa, 0)[-1], (5, 4, 2))
+        finally:
+            InputConfiguration.max_matching_negative_genomes=max_matching_negative_genomes
 
 
 
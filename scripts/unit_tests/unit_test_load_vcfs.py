@@ -1,11 +1,14 @@
 from os.path import expanduser, realpath, dirname
 from typing import List, Dict
 import unittest
+import tempfile
+import gzip
+import shutil
 from sys import path
 unit_test_dir = dirname(realpath(__file__))
 path.append( f'{unit_test_dir}/..')
 print(unit_test_dir)
-from data_classes import InputConfiguration, Sample, SNP
+from data_classes import InputConfiguration, Sample, SNP, Genotype, Genotypes
 from load_vcfs import VCFutilities
 import metadata_utils as metadata_utils
 
@@ -45,6 +48,59 @@ class TestLoadVCF(unittest.TestCase):
         self.assertEqual(len(existing_snps),681)
         self.assertEqual(len(sample.snps),681)
         
+    def test_vcf_to_snp_records(self):
+        vcf_loader=VCFutilities()
+        snp_records=vcf_loader.vcf_to_snp_records(self.valid_vcf)
+        self.assertEqual(len(snp_records),681)
+        self.assertTrue( all([ type(f[1])==int for f in snp_records]) )
+        self.assertRaises(ValueError, vcf_loader.vcf_to_snp_records, filename=self.invalid_vcf)
+        sample=Sample(self.valid_vcf.replace(".vcf",""), self.valid_vcf)
+        vcf_loader.add_snp_records(snp_records, {}, sample)
+        self.assertTrue( sample.has_snp(sample.snps[0]) )
+
+    def test_multi_sample_vcf_to_snp_records(self):
+        vcf_loader=VCFutilities()
+        vcf_loader.load_repeat_regions("")
+        self.assertEqual(vcf_loader.vcf_sample_names(self.multisample_vcf), ["8490_5#12.sorted.bam", "8490_5#13.sorted.bam", "8490_5#14.sorted.bam"])
+        sample_names, snp_records, sample_record_ids=vcf_loader.multi_sample_vcf_to_snp_records(self.multisample_vcf)
+        self.assertEqual(len(sample_names), 3)
+        self.assertEqual(snp_records, vcf_loader.vcf_to_snp_records(self.valid_vcf))
+        self.assertEqual([len(f) for f in sample_record_ids], [681, 681, 681])
+        self.assertRaises(ValueError, vcf_loader.multi_sample_vcf_to_snp_records, filename=self.invalid_vcf)
+        self.assertEqual(vcf_loader._genotype_code_to_allele("1/1", 2, self.multisample_vcf), 1)
+        self.assertEqual(vcf_loader._genotype_code_to_allele("./.", 2, self.multisample_vcf), 0)
+        self.assertIsNone(vcf_loader._genotype_code_to_allele("0|1", 2, self.multisample_vcf))
+        self.assertRaises(ValueError, vcf_loader._genotype_code_to_allele, genotype_code="2", alleles_count=2, filename=self.multisample_vcf)
+
+    def test_compressed_vcf(self):
+        vcf_loader=VCFutilities()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            compressed_vcf=f'{temp_dir}/8490_5#12.vcf.gz'
+            with open(self.valid_vcf, "rb") as input_vcf, gzip.open(compressed_vcf, "wb") as output_vcf:
+                shutil.copyfileobj(input_vcf, output_vcf)
+            self.assertEqual(vcf_loader.determine_vcf_type(compressed_vcf),"single_sample")
+            self.assertEqual(vcf_loader.vcf_to_snp_records(compressed_vcf), vcf_loader.vcf_to_snp_records(self.valid_vcf))
+
+    def test_output_genotypes_vcf(self):
+        vcf_writer=VCFutilities()
+        genotypes=[Genotype("4.1"), Genotype("4.2")]
+        for genotype in genotypes:
+            genotype.subgenotypes=[genotype.name]
+        genotypes[0].add_genotype_allele(SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=20, passes_filters=True), "T", 10)
+        genotypes[1].add_genotype_allele(SNP(ref_contig_id="contig", ref_base="C", alt_base="G", position=10, passes_filters=True), "G", 5)
+        genotypes[1].add_genotype_allele(SNP(ref_contig_id="contig", ref_base="C", alt_base="G", position=30, passes_filters=False), "G", 5)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vcf_writer.output_genotypes_vcf(Genotypes(genotypes=genotypes), f'{temp_dir}/genotypes.vcf')
+            vcf_writer.output_genotypes_vcf(Genotypes(genotypes=genotypes), f'{temp_dir}/genotypes.vcf.gz')
+            with open(f'{temp_dir}/genotypes.vcf') as vcf_file:
+                vcf_lines=vcf_file.readlines()
+            with gzip.open(f'{temp_dir}/genotypes.vcf.gz', "rt") as vcf_file:
+                self.assertEqual(vcf_file.readlines(), vcf_lines)
+        records=[f.strip().split("\t") for f in vcf_lines if f[0]!="#"]
+        self.assertEqual([f[1] for f in records], ["11", "21"])
+        self.assertEqual(records[0][2:5], ["GT_4.2_contig_11", "C", "G"])
+        self.assertEqual(records[0][9:], ["0:.", "1:5"])
+
     def test_load_repeat_regions(self):
         vcf_loader=VCFutilities()
         vcf_loader.load_repeat_regions(self.config_data.repeats_bed_file)
@@ -58,6 +58,7 @@ class TestNameConverters(unittest.TestCase):
     def test_filename_to_prefix(self):
         self._reset_data()
         self.assertEqual( name_converters.filename_to_prefix(self.valid_vcf_full_name), self.valid_vcf_sample)
+        self.assertEqual( name_converters.filename_to_prefix(self.valid_vcf_full_name+".gz"), self.valid_vcf_sample)
         self.assertEqual( name_converters.filename_to_prefix(self.valid_vcf_filename), self.valid_vcf_sample)
 
 
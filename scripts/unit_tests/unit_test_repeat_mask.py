@@ -0,0 +1,52 @@
+from os.path import expanduser, realpath, dirname
+import unittest
+from sys import path
+unit_test_dir = dirname(realpath(__file__))
+path.append( f'{unit_test_dir}/..')
+print(unit_test_dir)
+from data_classes import InputConfiguration
+from repeat_mask import RepeatMask
+
+class TestRepeatMask(unittest.TestCase):
+    valid_data=expanduser("~/HandyAmpliconTool/unit_test_data/valid_data/")
+    config_file=expanduser("~/HandyAmpliconTool/unit_test_data/unittest.json")
+    repeats_bed=f'{valid_data}/ref_repeats.bed'
+
+    def setUp(self) -> None:
+        self.config_data = InputConfiguration(self.config_file)
+        return super().setUp()
+
+    def test_point_lookup(self):
+        repeat_mask=RepeatMask()
+        repeat_mask.set_intervals({"contig": [(10,20), (15,30), (40,41)]})
+        self.assertEqual(len(repeat_mask), 21)
+        self.assertTrue( ("contig", 10) in repeat_mask )
+        self.assertTrue( ("contig", 29) in repeat_mask )
+        self.assertFalse( ("contig", 30) in repeat_mask )
+        self.assertFalse( ("contig", 1000) in repeat_mask )
+        self.assertFalse( ("other_contig", 10) in repeat_mask )
+        self.assertEqual(repeat_mask.intervals("contig"), [(10,30), (40,41)])
+
+    def test_overlaps(self):
+        repeat_mask=RepeatMask()
+        repeat_mask.set_intervals({"contig": [(10,20), (40,41)]})
+        self.assertTrue(repeat_mask.overlaps("contig", 0, 11))
+        self.assertTrue(repeat_mask.overlaps("contig", 19, 25))
+        self.assertTrue(repeat_mask.overlaps("contig", 12, 14))
+        self.assertTrue(repeat_mask.overlaps("contig", 0, 100))
+        self.assertFalse(repeat_mask.overlaps("contig", 0, 10))
+        self.assertFalse(repeat_mask.overlaps("contig", 20, 40))
+        self.assertFalse(repeat_mask.overlaps("contig", 41, 100))
+        self.assertFalse(repeat_mask.overlaps("other_contig", 0, 100))
+
+    def test_from_bed(self):
+        repeat_mask=RepeatMask.from_bed(self.repeats_bed)
+        self.assertEqual(len(repeat_mask), 346834)
+        with open(self.repeats_bed) as bed_file:
+            contig, start, end = bed_file.readline().strip().split("\t")[0:3]
+        self.assertTrue( (contig, int(start)) in repeat_mask )
+        self.assertTrue(repeat_mask.overlaps(contig, int(start)-5, int(start)+1))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -1,4 +1,6 @@
-from os.path import expanduser, realpath, dirname
+from os.path import expanduser, realpath, dirname, getsize
+from os import getpid, remove
+from glob import glob
 import unittest
 from typing import List
 from sys import path
@@ -35,6 +37,9 @@ class TestBlastRunner(unittest.TestCase):
         fasta_header="RandomSeq"
         self.assertTrue(blast_runner.db_from_string(fasta_header, self.fasta_seq, self.temp_dir))
         self.assertTrue(blast_runner.db_from_string(fasta_header, self.fasta_seq, self.temp_dir))
+        self.assertTrue(blast_runner.db_name.endswith(f'_{getpid()}')) #concurrent runs don't share database files
+        blast_runner.remove_db()
+        self.assertEqual(glob(f'{blast_runner.db_name}.*'), [])
         
 
     def test_run_from_string(self):
@@ -48,6 +53,30 @@ class TestBlastRunner(unittest.TestCase):
         self.assertTrue(hits[0].is_flipped==False)
         print(hits)
 
+    def test_batch_query_files(self):
+        blast_runner=BlastRunner()
+        blast_runner.BATCH_BASES=2*getsize(self.ref_fasta)
+        query_files=[self.ref_fasta]*10
+        batches=blast_runner.batch_query_files(query_files, processes=1)
+        self.assertEqual(batches, [query_files[i:i+2] for i in range(0, len(query_files), 2)])
+        #with more processes batches are smaller, so every process gets work
+        self.assertEqual(len(blast_runner.batch_query_files(query_files, processes=len(query_files))), len(query_files))
+
+    def test_batch_fasta(self):
+        blast_runner=BlastRunner()
+        query_file=f'{self.temp_dir}/batch_fasta_{getpid()}.fna'
+        with open(query_file, "w") as query:
+            query.write(">chr description\nACGT\n>\nAC\n>plasmid\nGG")
+        contig_ids: List[List[str]]=[]
+        try:
+            batch_fasta=b"".join(blast_runner._batch_fasta([query_file, query_file], contig_ids))
+        finally:
+            remove(query_file)
+        self.assertEqual(batch_fasta, b">q0_0\nACGT\n>q0_1\nAC\n>q0_2\nGG\n>q1_0\nACGT\n>q1_1\nAC\n>q1_2\nGG\n")
+        #contig without id gets placeholder id
+        self.assertEqual(contig_ids, [["chr", "contig_1", "plasmid"]]*2)
+
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -0,0 +1,76 @@
+from os.path import expanduser, realpath, dirname
+import unittest
+from sys import path
+unit_test_dir = dirname(realpath(__file__))
+path.append( f'{unit_test_dir}/..')
+print(unit_test_dir)
+import numpy as np
+from data_classes import InputConfiguration, Sample, SNP
+from snp_matrix import SnpPresenceMatrix
+
+class TestSnpMatrix(unittest.TestCase):
+    valid_data=expanduser("~/HandyAmpliconTool/unit_test_data/valid_data/")
+    config_file=expanduser("~/HandyAmpliconTool/unit_test_data/unittest.json")
+
+    def setUp(self) -> None:
+        self.config_data = InputConfiguration(self.config_file)
+        return super().setUp()
+
+    @property
+    def dummy_samples(self):
+        first_sample=Sample("first", "first.vcf")
+        first_sample.genotype="4.1"
+        second_sample=Sample("second", "second.vcf")
+        second_sample.genotype="4.2"
+        return [first_sample, second_sample]
+
+    def test_add_sample(self):
+        snp_matrix=SnpPresenceMatrix()
+        first_sample, second_sample=self.dummy_samples
+        snp_matrix.add_sample(first_sample, [("contig", 10, "A", "T"), ("contig", 20, "C", "G")])
+        snp_matrix.add_sample(second_sample, [("contig", 10, "A", "T"), ("contig", 30, "C", "C")])
+        snp_matrix.pack()
+        self.assertEqual(snp_matrix.shape, (2,3))
+        self.assertEqual(snp_matrix.snps[0], SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10))
+        self.assertEqual(len(first_sample.snps), 0)
+        self.assertRaises(ValueError, snp_matrix.add_sample, sample=first_sample, snp_records=[])
+
+    def test_column_counts(self):
+        samples=self.dummy_samples
+        samples[0].add_snps([SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)])
+        samples[1].add_snps([SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10),
+                             SNP(ref_contig_id="contig", ref_base="A", alt_base="G", position=10)])
+        snp_matrix=SnpPresenceMatrix.from_samples(samples)
+        self.assertEqual(list(snp_matrix.column_counts(np.asarray([True, True]))), [2,1])
+        self.assertEqual(list(snp_matrix.column_counts(snp_matrix.genotypes=="4.1")), [1,0])
+
+    def test_genotype_column_counts(self):
+        samples=self.dummy_samples+self.dummy_samples
+        samples[0].add_snps([SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)])
+        samples[2].add_snps([SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)])
+        samples[3].add_snps([SNP(ref_contig_id="contig", ref_base="A", alt_base="G", position=10)])
+        snp_matrix=SnpPresenceMatrix.from_samples(samples)
+        genotype_names, genotype_sizes, counts=snp_matrix.genotype_column_counts()
+        self.assertEqual(genotype_names, ["4.1", "4.2"])
+        self.assertEqual(list(genotype_sizes), [2,2])
+        self.assertEqual(counts.tolist(), [[2,0],[0,1]])
+
+    def test_collapse_identical_samples(self):
+        samples=self.dummy_samples+self.dummy_samples+self.dummy_samples
+        for sample in samples:
+            sample.add_snps([SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=10)])
+        samples[5].add_snps([SNP(ref_contig_id="contig", ref_base="A", alt_base="G", position=10)])
+        snp_matrix=SnpPresenceMatrix.from_samples(samples)
+        expected_counts=snp_matrix.genotype_column_counts()
+        self.assertEqual(snp_matrix.collapse_identical_samples(), 3)
+        self.assertEqual(snp_matrix.samples, [samples[0], samples[1], samples[5]])
+        self.assertEqual(list(snp_matrix.weights), [3,2,1])
+        genotype_names, genotype_sizes, counts=snp_matrix.genotype_column_counts()
+        self.assertEqual(genotype_names, expected_counts[0])
+        self.assertEqual(list(genotype_sizes), list(expected_counts[1]))
+        self.assertEqual(counts.tolist(), expected_counts[2].tolist())
+        self.assertEqual(list(snp_matrix.column_counts(snp_matrix.genotypes=="4.2")), [3,1])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
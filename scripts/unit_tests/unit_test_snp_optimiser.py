@@ -5,7 +5,8 @@ from sys import path
 unit_test_dir = dirname(realpath(__file__))
 path.append( f'{unit_test_dir}/..')
 print(unit_test_dir)
-from data_classes import InputConfiguration
+from data_classes import InputConfiguration, Genotypes, Genotype, SNP
+from snp_optimiser import SnpOptimiser
 import metadata_utils as metadata_utils
 
 class TestSnpOptimiser(unittest.TestCase):
@@ -20,6 +21,35 @@ class TestSnpOptimiser(unittest.TestCase):
         self.config_data = InputConfiguration(self.config_file)
         return super().setUp()
 
+    def test_optimise(self):
+        genotypes=[Genotype("4.1"), Genotype("4.2"), Genotype("4.3")]
+        snps=[SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=f, passes_filters=True) for f in [100, 150, 600, 2000]]
+        genotypes[0].add_genotype_allele(snps[0], "T", 10)
+        genotypes[1].add_genotype_allele(snps[1], "T", 10)
+        genotypes[2].add_genotype_allele(snps[2], "T", 10)
+        #bifurcating SNP, ALT allele defines genotype 4.3
+        genotypes[0].add_genotype_allele(snps[3], "A", 10)
+        genotypes[2].add_genotype_allele(snps[3].copy(), "T", 10)
+        intervals=SnpOptimiser().optimise(1000, Genotypes(genotypes=genotypes), rare_gts=[])
+        self.assertEqual([f["snps"] for f in intervals], [snps[0:3], snps[1:3]])
+        self.assertEqual([f["genotypes"] for f in intervals], [{"4.1","4.2","4.3"}, {"4.2","4.3"}])
+        intervals=SnpOptimiser().optimise(100, Genotypes(genotypes=genotypes), rare_gts=["4.3"])
+        self.assertEqual([f["snps"] for f in intervals], [snps[0:2], snps[2:3], snps[3:4]])
+
+
+    def test_select_intervals(self):
+        snps=[SNP(ref_contig_id="contig", ref_base="A", alt_base="T", position=f, passes_filters=True) for f in [100, 200, 300, 5000, 6000]]
+        intervals=[ {"snps": snps[0:1], "genotypes": {"4.1","4.2"}},
+                    {"snps": snps[0:3], "genotypes": {"4.1","4.2"}},
+                    {"snps": snps[3:4], "genotypes": {"4.2","4.3"}},
+                    {"snps": snps[4:5], "genotypes": {"4.3"}} ]
+        optimiser=SnpOptimiser()
+        self.assertEqual(optimiser.select_intervals(intervals), [intervals[1], intervals[3]])
+        self.assertEqual(optimiser.select_intervals(intervals, snp_weight=0), [intervals[0], intervals[2]])
+        #second interval capturing 4.1 overlaps the first one, but it is the only way to capture 4.1 twice
+        self.assertEqual(optimiser.select_intervals(intervals, redundancy=2), intervals)
+        self.assertEqual(optimiser.select_intervals([]), [])
+        self.assertRaises(ValueError, optimiser.select_intervals, interval_snps=intervals, redundancy=0)
 
 
 if __name__ == '__main__':
@@ -41,9 +41,12 @@ setup(name='EnviroAmpDesigner',
       include_package_data=True,
       entry_points={'console_scripts': ['design_primers = design_primers:main']},
       scripts=[
+          'scripts/cohort_index.py',
           'scripts/data_classes.py',
           'scripts/design_primers.py',
+          'scripts/file_utils.py',
           'scripts/generate_msa.py',
+          'scripts/genomes_blast_db.py',
           'scripts/hierarchy_utils.py',
           'scripts/identify_genotype_snps.py',
           'scripts/identify_species_snps.py',
@@ -52,8 +55,10 @@ setup(name='EnviroAmpDesigner',
           'scripts/metadata_utils.py',
           'scripts/name_converters.py',
           'scripts/primers_generator.py',
+          'scripts/repeat_mask.py',
           'scripts/run_blast.py',
-          'scripts/snp_optimiser.py'
+          'scripts/snp_optimiser.py',
+          'scripts/snp_matrix.py'
       ],
       cmdclass={'install': EnviroAmpDesignerInstall}
 )